@@ -54,6 +54,10 @@ from bokeh.models import ColumnDataSource, TextInput, Div, CustomJS, Button, Tex
 from bokeh.layouts import gridplot, widgetbox
 from bokeh.events import Reset
 
+# time index of the data files, shared with tccon_app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'tccon_app'))
+from site_index import get_site_index, time_slices
+
 # to ignore warnings
 import warnings
 warnings.filterwarnings('ignore')
@@ -559,6 +563,13 @@ else:
 	print 'Cache dictionnary found:\nIf you added or modified files since last time, remove cache_dic.npy and run the program again, load times will initially be longer'
 ## END OF CACHE SETUP
 #################################################################################
+## SITE INDEX SETUP
+# time index of the files of each site, the times of site_index[prefix]['files'][i] are site_index[prefix]['times'][offsets[i]:offsets[i+1]]
+# the time variables are only read when the index is built, load_var resolves the date input into (file,start_id,end_id) slices with np.searchsorted
+# the index is kept by the site_index module of tccon_app, so it is only built again if files are added to or removed from the data folder
+site_index = get_site_index(data_path,tccon_file_list,netcdf)
+## END OF SITE INDEX SETUP
+#################################################################################
 
 ## END OF SETUP SECTION
 #########################################################################################################################################################################
@@ -780,7 +791,6 @@ def set_site(site='',site_ID=0):
 		return
 	
 	prefix = [key for key in T_FULL if T_FULL[key]==site][0] # TCCON 2 letters abbreviation of the site
-	site_file_list = [i for i in tccon_file_list if prefix in i] # a list of the associated files
 
 	if layout_mode=='comp' and site_ID==1:
 		corfig = fig3
@@ -825,7 +835,7 @@ def set_site(site='',site_ID=0):
 
 		notes_div.text = notes.replace("a></font>","a></font>, <a href='"+T_site[prefix]+"'>"+site+"</a>") # updated the information widget with a link to the site's webpage
 
-	load_var(site_file_list,site,site_source,site_ID,mode="set_site")
+	load_var(site,site_source,site_ID,mode="set_site")
 ## END OF SET_SITE FUNCTION
 #########################################################################################################################################################################
 ## SET_VAR FUNCTION
@@ -845,9 +855,6 @@ def set_var(site='',site_ID=0):
 
 	dum_hide.value = str(time.time()) # update the css of site_input label
 
-	prefix = [key for key in T_FULL if T_FULL[key]==site][0] # TCCON 2 letters abbreviation of the site
-	site_file_list = [i for i in tccon_file_list if prefix in i] # a list of the associated files
-
 	fig.yaxis[0].axis_label = var_input.value
 	if layout_mode == 'comp':
 			fig.yaxis[1].axis_label = var_input3.value
@@ -863,7 +870,7 @@ def set_var(site='',site_ID=0):
 			fig4.yaxis[0].axis_label = var_input3.value
 			fig4.xaxis[0].axis_label = var_input4.value
 	
-	load_var(site_file_list,site,site_source,site_ID,mode="set_var")
+	load_var(site,site_source,site_ID,mode="set_var")
 ## END OF SET_VAR FUNCTION
 #########################################################################################################################################################################
 ## LOAD_DATA FUNCTION
@@ -916,7 +923,7 @@ def load_data():
 ## END OF LOAD_DATA FUNCTION
 #########################################################################################################################################################################
 ## LOAD_VAR FUNCTION
-def load_var(site_file_list,site,site_source,site_ID,mode=""):
+def load_var(site,site_source,site_ID,mode=""):
 	'''
 	Function called by set_site() and set_var() to load the variables matching site,variable, and date inputs
 	'''
@@ -935,6 +942,9 @@ def load_var(site_file_list,site,site_source,site_ID,mode=""):
 
 	date_val = date_input.value # can be of the form 'firstdate'-'lastdate' or just 'firstdate'
 
+	prefix = [key for key in T_FULL if T_FULL[key]==site][0] # TCCON 2 letters abbreviation of the site
+	site_entry = site_index[prefix] # files, variables, and times of the site
+
 	dum_text.value = str(time.time()) # click the timer button to start the loading countdown in the 'status_div' widget
 
 	filled_site_inputs = False
@@ -964,97 +974,60 @@ def load_var(site_file_list,site,site_source,site_ID,mode=""):
 				return
 
 	if no_cached_data or mode=='set_site':
-		# loop over the TCCON files for the selected site
-		for filenum,site_file in enumerate(site_file_list):
-			if netcdf:
-				f = netCDF4.Dataset(os.path.join(data_path,site_file),'r') # netcdf file reader
-				all_var = [var for var in f.variables if 'run' not in var]
-			else:
-				df = pd.read_csv(os.path.join(data_path,site_file),header=2) # read the .eof.csv file
-				all_var = [var for var in list(df) if 'run' not in var]
+		all_var = site_entry['variables']
 
-			# setup some initializations if it is the first file
-			if filenum==0:		
-				if not filled_site_inputs:
-					initialize(all_var,site_source,site_ID,reset=False) # fills variable inputs with options, does not reset the data source
-					dum_text.value = str(time.time()+3) # click the timer button again to stop the loading countdown in the 'status_div' widget
-					time.sleep(0.1)
-					status_div.text = site+' still has an empty variable input'
-					return
-				if mode == 'set_site':
-					initialize(all_var,site_source,site_ID,reset=False) # fills variable inputs with options, does not reset the data source
-					dum_text.value = str(time.time()+7) # click the timer button again to stop the loading countdown in the 'status_div' widget
-					time.sleep(0.1)
-					status_div.text = 'Data ready to load'
-					return
-				
-				initialize(all_var,site_source,site_ID) # fills variable inputs with options,resets the data source, and setup hovertool tooltips
-				save_data = {key:[] for key in site_source.data}
-				new_data = {key:[] for key in site_source.data}					
-	
-			if netcdf:
-				nctime =  f.variables['time'][:] # fractional days since 1970
-			else:			
-				# for .eof.csv files convert year,day,hour in fractional days since 1970
-				nctime = np.array([(datetime(int(df.year[i]),1,1)+timedelta(days=df.day[i]-1)-datetime(1970,1,1)).days+df.hour[i]/24 for i in range(len(df))])
-
-			# use the value of the 'date_input' widget to determine the range of dates over which data should be fetched
-			try: # for the minimum of the range
-				mindate = date_val.split('-')[0] # if the 'date_input' widget is empty, this will raise an exception
-				mindate = calendar.timegm(datetime(int(mindate[:4]),int(mindate[4:6]),int(mindate[6:8])).timetuple())/24/3600 # if the date is entered wrong, this will raise an exception
-			except: # catch all exceptions
-				mindate = calendar.timegm(datetime(1970,1,1).timetuple())/24/3600 # if an exception has been caught, just use a very early date
-
-			try: # for the maximum of the range 
-				maxdate = date_val.split('-')[1] # if the 'date_input' widget is empty, or if only the minimum date is given, this will raise an exception
-				maxdate = calendar.timegm(datetime(int(maxdate[:4]),int(maxdate[4:6]),int(maxdate[6:8])).timetuple())/24/3600 # if the date is entered wrong, this will raise an exception
-			except: # catch all exceptions
-				maxdate = calendar.timegm(datetime(2050,1,1).timetuple())/24/3600 # if an exception has been caught, just use a very late date
-
-			# perform a quick check on date ranges based on file names to avoid looping over files for nothing
-			if filenum==0:
-				all_file_min = site_file_list[0][2:10]		# minimum YYYYMMDD of all files
-				all_file_max = site_file_list[-1][11:19]	# maximum YYYYMMDD of all files
-				all_file_min_date = calendar.timegm(datetime(int(all_file_min[:4]),int(all_file_min[4:6]),int(all_file_min[6:8])).timetuple())/24/3600
-				all_file_max_date = calendar.timegm(datetime(int(all_file_max[:4]),int(all_file_max[4:6]),int(all_file_max[6:8])).timetuple())/24/3600
-
-				# break out of the for loop if min or max dates from the file names are not compatible with the date input
-				if (mindate>all_file_max_date) or (maxdate<all_file_min_date):
-					dum_text.value = str(time.time()+3) # click the timer button to start the loading countdown in the 'status_div' widget
-					time.sleep(0.1)
-					status_div.text = site +' date range: '+all_file_min+'-'+all_file_max
-					if netcdf:
-						f.close() # close the netcdf reader
-					return
-				if mindate>maxdate:
-					dum_text.value = str(time.time()+3) # click the timer button to start the loading countdown in the 'status_div' widget
-					time.sleep(0.1)
-					status_div.text = 'Wrong date input'
-					if netcdf:
-						f.close() # close the netcdf reader
-					return
-
-			# for each file, fastforward to next iteration of the for loop if the dates in the file name are not compatible with the date input
-			file_min = site_file[2:10]
-			file_max = site_file[11:19]
-			file_min_date = calendar.timegm(datetime(int(file_min[:4]),int(file_min[4:6]),int(file_min[6:8])).timetuple())/24/3600
-			file_max_date = calendar.timegm(datetime(int(file_max[:4]),int(file_max[4:6]),int(file_max[6:8])).timetuple())/24/3600
-			if (mindate>file_max_date) or (maxdate<file_min_date):
-				if netcdf:
-					f.close() # close the netcdf reader
-				continue
+		if not filled_site_inputs:
+			initialize(all_var,site_source,site_ID,reset=False) # fills variable inputs with options, does not reset the data source
+			dum_text.value = str(time.time()+3) # click the timer button again to stop the loading countdown in the 'status_div' widget
+			time.sleep(0.1)
+			status_div.text = site+' still has an empty variable input'
+			return
+		if mode == 'set_site':
+			initialize(all_var,site_source,site_ID,reset=False) # fills variable inputs with options, does not reset the data source
+			dum_text.value = str(time.time()+7) # click the timer button again to stop the loading countdown in the 'status_div' widget
+			time.sleep(0.1)
+			status_div.text = 'Data ready to load'
+			return
 
-			newtime = nctime[(nctime>=mindate) & (nctime<maxdate)] # list of times that satisfy the 'date_input' value (still fractional days since 1970)
+		# use the value of the 'date_input' widget to determine the range of dates over which data should be fetched
+		try: # for the minimum of the range
+			mindate = date_val.split('-')[0] # if the 'date_input' widget is empty, this will raise an exception
+			mindate = calendar.timegm(datetime(int(mindate[:4]),int(mindate[4:6]),int(mindate[6:8])).timetuple())/24/3600 # if the date is entered wrong, this will raise an exception
+		except: # catch all exceptions
+			mindate = calendar.timegm(datetime(1970,1,1).timetuple())/24/3600 # if an exception has been caught, just use a very early date
+
+		try: # for the maximum of the range 
+			maxdate = date_val.split('-')[1] # if the 'date_input' widget is empty, or if only the minimum date is given, this will raise an exception
+			maxdate = calendar.timegm(datetime(int(maxdate[:4]),int(maxdate[4:6]),int(maxdate[6:8])).timetuple())/24/3600 # if the date is entered wrong, this will raise an exception
+		except: # catch all exceptions
+			maxdate = calendar.timegm(datetime(2050,1,1).timetuple())/24/3600 # if an exception has been caught, just use a very late date
+
+		# perform a quick check on date ranges based on file names to avoid looking for data for nothing
+		if (mindate>site_entry['max_day']) or (maxdate<site_entry['min_day']):
+			dum_text.value = str(time.time()+3) # click the timer button to start the loading countdown in the 'status_div' widget
+			time.sleep(0.1)
+			status_div.text = site +' date range: '+site_entry['min_date']+'-'+site_entry['max_date']
+			return
+		if mindate>maxdate:
+			dum_text.value = str(time.time()+3) # click the timer button to start the loading countdown in the 'status_div' widget
+			time.sleep(0.1)
+			status_div.text = 'Wrong date input'
+			return
 
-			# check that there is actual data in the time range, if not, go to the next (next iteration in for loop)
-			if len(newtime)==0:
-				continue
+		initialize(all_var,site_source,site_ID) # fills variable inputs with options,resets the data source, and setup hovertool tooltips
+		save_data = {key:[] for key in site_source.data}
+		new_data = {key:[] for key in site_source.data}
 
-			start_id = np.where(nctime==newtime[0])[0][0] # ID of the starting time in the full time list of the file
-			end_id = np.where(nctime==newtime[-1])[0][0]+1 # ID of the end time in the full time list of the file
+		print 'load_var() ...'
+		# loop over the TCCON files of the selected site that have data in the date range; start_id and end_id are the IDs of the first and last+1 matching times in each file
+		for site_file,start_id,end_id,file_time in time_slices(site_entry,mindate,maxdate):
+			if netcdf:
+				f = netCDF4.Dataset(os.path.join(data_path,site_file),'r') # netcdf file reader
+			else:
+				df = pd.read_csv(os.path.join(data_path,site_file),header=2) # read the .eof.csv file
 
 			try: # attempt to fetch data using start_id and end_id
-				add_x = np.array([datetime(*time.gmtime(i*24*3600)[:6]) for i in nctime[start_id:end_id]])
+				add_x = np.array([datetime(*time.gmtime(i*24*3600)[:6]) for i in file_time])
 				if netcdf:
 					add_y1 = f.variables[first_var][start_id:end_id]
 					add_y2 = ''
@@ -1102,6 +1075,8 @@ def load_var(site_file_list,site,site_source,site_ID,mode=""):
 							add_y2 = add_y2[inds]
 
 						if True not in inds:
+							if netcdf:
+								f.close() # close the netcdf reader
 							continue
 
 				elif public:
@@ -1110,8 +1085,6 @@ def load_var(site_file_list,site,site_source,site_ID,mode=""):
 
 				new_data = add_data(new_data,x=add_x,y1=add_y1,y2=add_y2,colo=add_colo,flag=add_flag,spectrum=add_spectrum)					
 
-				if filenum == 0:
-					print 'load_var() ...'
 				print site_file,'data read:',len(add_x),'new values'
 			if netcdf:
 				f.close() # close the netcdf reader		
@@ -1140,6 +1113,7 @@ def load_var(site_file_list,site,site_source,site_ID,mode=""):
 				add_cache(date_val,site,save_data,first_var=first_var,second_var=second_var)
 
 	else: #else clause of 'if no_cached_data', this will execute if there is cached data corresponding to the inputs
+		all_var = site_entry['variables']
 		initialize(all_var,site_source,site_ID) # fills variable inputs with options,resets the data site_source, and setup hovertool tooltips
 		if not filled_site_inputs:
 			dum_text.value = str(time.time()+1) # click the timer button to start the loading countdown in the 'status_div' widget
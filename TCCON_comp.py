@@ -48,6 +48,7 @@ make sure you write in all the variables that you may be using later so you don'
 # general
 import os
 import sys
+import json
 
 # netcdf reading/writing
 import netCDF4
@@ -64,6 +65,9 @@ import numpy as np
 # round up
 from math import ceil
 
+# parallel matching and averaging of the sites
+from multiprocessing import Pool
+
 # interactive plots
 from bokeh.plotting import figure, output_file
 from bokeh.models import Legend, Panel, Tabs, CustomJS, ColumnDataSource, CheckboxGroup, RadioGroup, Button, PreText, Range1d
@@ -84,868 +88,1123 @@ def progress(i,tot,bar_length=20,char=''):
 	sys.stdout.write("\rPercent:[{0}] {1}%".format(hashes + spaces, int(round(percent * 100)))+"    "+str(i+1)+"/"+str(tot)+' Site: '+char+'                    ')
 	sys.stdout.flush()
 
+# index of the [edges[i],edges[i+1]) interval that contains each time, -1 for times outside of the edges
+def time_bin_index(times,edges):
+	bin_ID = np.searchsorted(edges,times,side='right')-1
+	bin_ID[bin_ID>=len(edges)-1] = -1
+	return bin_ID
+
+# number of values and mean of the values in each bin, the mean is NaN for empty bins
+def bin_means(bin_ID,values,nbins):
+	inside = bin_ID>=0
+	values = np.ma.filled(values,np.nan) if np.ma.isMaskedArray(values) else np.asarray(values)
+	counts = np.bincount(bin_ID[inside],minlength=nbins)
+	sums = np.bincount(bin_ID[inside],weights=values[inside].astype(np.float64),minlength=nbins)
+	with np.errstate(divide='ignore',invalid='ignore'):
+		return counts, sums/counts
+
+# match and average the data of one site with the intervals of the reference site; args is a (site,site_data,var_list,edges,select_count) tuple
+# only the arrays of that site are sent to the worker processes, with the interval edges and the number of reference data in each interval
+def match_site(args):
+	site,site_data,var_list,edges,select_count = args
+	span = len(select_count)
+
+	site_ID = time_bin_index(np.asarray(site_data['datetime'],dtype='datetime64[us]'),edges)
+	site_count = np.bincount(site_ID[site_ID>=0],minlength=span)
+
+	matched = (select_count>0) & (site_count>0) # intervals with data from both sites
+
+	freq_site_data = {}
+	if np.count_nonzero(matched)>0:
+		for var in var_list:
+			freq_site_data[var] = bin_means(site_ID,site_data[var],span)[1][matched]
+
+	return site,matched,freq_site_data
+
+# N, Bias, RMS, Scatter and R for all the pairs of rows of a (site,interval) matrix of averaged data with NaN for intervals without data
+# each statistic is a (site,site) matrix, Bias and RMS are for row i minus row j
+def pair_stats(binned):
+	binned = binned-np.nanmean(binned) # the same offset for all sites does not change the statistics but limits rounding errors
+	valid = np.isfinite(binned).astype(np.float64)
+	x = np.where(valid>0,binned,0.0)
+
+	# sums over the intervals where both sites have data
+	N = valid.dot(valid.T)
+	Sx = x.dot(valid.T)
+	Sy = Sx.T
+	Sx2 = (x**2).dot(valid.T)
+	Sy2 = Sx2.T
+	Sxy = x.dot(x.T)
+
+	with np.errstate(divide='ignore',invalid='ignore'):
+		bias = (Sx-Sy)/N
+		sum_d2 = Sx2+Sy2-2*Sxy # sum of the squared differences
+		rms = np.sqrt(sum_d2/N)
+		scatter = np.sqrt((sum_d2-N*bias**2)/(N-1))
+		R = (N*Sxy-Sx*Sy)/np.sqrt((N*Sx2-Sx**2)*(N*Sy2-Sy**2))
+
+	return {'N':N.astype(int),'Bias':bias,'RMS':rms,'Scatter':scatter,'R':R}
+
+# FREQ_DATA is saved in a folder with one .npy file per site and variable and an index.json file, the times are saved as datetime64
+# plain .npy files can be memory-mapped and read with any python/numpy version, unlike a pickled dictionary
+FREQ_DATA_VERSION = 1
+def save_freq_data(path,FREQ_DATA,SELECT,FREQ):
+	if not os.path.isdir(path):
+		os.makedirs(path)
+
+	index = {'version':FREQ_DATA_VERSION,'select':SELECT,'freq':FREQ,'sites':{}}
+	for count,site in enumerate(sorted(FREQ_DATA)):
+		folder = 'site{:02d}'.format(count)
+		for role in ['site','select']:
+			if not os.path.isdir(os.path.join(path,folder,role)):
+				os.makedirs(os.path.join(path,folder,role))
+
+		site_data = FREQ_DATA[site][site]
+		select_data = FREQ_DATA[site][SELECT]
+		variables = sorted([var for var in site_data if var!='datetime'])
+
+		np.save(os.path.join(path,folder,'datetime.npy'),np.array(site_data['datetime'],dtype='datetime64[s]'))
+		for var in variables:
+			for role,data in [('site',site_data),('select',select_data)]:
+				values = np.ma.filled(data[var],np.nan) if np.ma.isMaskedArray(data[var]) else np.asarray(data[var])
+				np.save(os.path.join(path,folder,role,var+'.npy'),np.ascontiguousarray(values))
+
+		index['sites'][site] = {'folder':folder,'length':len(site_data['datetime']),'variables':variables}
+
+	with open(os.path.join(path,'index.json'),'w') as outfile:
+		json.dump(index,outfile,indent=1,sort_keys=True)
+
+def read_freq_index(path):
+	with open(os.path.join(path,'index.json'),'r') as infile:
+		index = json.load(infile)
+	if index['version'] > FREQ_DATA_VERSION:
+		print('WARNING:',path,'was written by a newer version of this code (FREQ_DATA version',index['version'],')')
+	return index
+
+# load FREQ_DATA saved with save_freq_data, only the given variables are memory-mapped
+def load_freq_data(path,variables=[]):
+	index = read_freq_index(path)
+	SELECT = index['select']
+
+	FREQ_DATA = {}
+	for site in index['sites']:
+		folder = os.path.join(path,index['sites'][site]['folder'])
+		site_vars = [var for var in index['sites'][site]['variables'] if (variables==[]) or (var in variables)]
+
+		times = np.load(os.path.join(folder,'datetime.npy'),mmap_mode='r',allow_pickle=False)
+		FREQ_DATA[site] = {site:{'datetime':times},SELECT:{'datetime':times}}
+		for var in site_vars:
+			FREQ_DATA[site][site][var] = np.load(os.path.join(folder,'site',var+'.npy'),mmap_mode='r',allow_pickle=False)
+			FREQ_DATA[site][SELECT][var] = np.load(os.path.join(folder,'select',var+'.npy'),mmap_mode='r',allow_pickle=False)
+
+	return FREQ_DATA
+
+# prefix sums used to get the comparison statistics of any time window of the matched data y1 (site) and y2 (reference) at times x
+# the data are sorted by time once here, 't' are the sorted times and 'order' the rows of the data in that order, so a time window is found with two binary searches in 't' and its statistics are differences of the prefix sums
+# the data are shifted by the same offset (the reference mean), which does not change the statistics but limits rounding errors
+def prefix_sums(x,y1,y2):
+	order = np.argsort(np.asarray(x),kind='mergesort')
+	y1 = np.array(y1,dtype=np.float64)[order]
+	y2 = np.array(y2,dtype=np.float64)[order]
+	valid = np.isfinite(y1) & np.isfinite(y2)
+	offset = np.mean(y2[valid]) if valid.any() else 0.0
+	a = np.where(valid,y1-offset,0.0)
+	b = np.where(valid,y2-offset,0.0)
+	return offset, {'t':np.asarray(x)[order],'order':order.astype(np.int32),'n':np.cumsum(valid).astype(np.float64),'s1':np.cumsum(a),'s2':np.cumsum(b),'s11':np.cumsum(a*a),'s22':np.cumsum(b*b),'s12':np.cumsum(a*b)}
+
+# first and last x values of the DATA plot, x columns of datetime64 (e.g. 'datetime') are converted to datetime for the datetime axis
+def x_limits(columns):
+	min_x = min([column[0] for column in columns])
+	max_x = max([column[-1] for column in columns])
+	if isinstance(min_x,np.datetime64):
+		return np.datetime64(min_x,'us').astype(datetime), np.datetime64(max_x,'us').astype(datetime)
+	if isinstance(min_x,datetime):
+		return min_x, max_x
+	return int(min_x), ceil(max_x)
+
+# data given to a ColumnDataSource as float64 or datetime64 arrays are written in binary in the html file instead of json text
+def bokeh_column(values):
+	values = np.ma.filled(values,np.nan) if np.ma.isMaskedArray(values) else np.asarray(values)
+	if values.dtype == object and len(values) and isinstance(values[0],datetime):
+		return np.array(values,dtype='datetime64[us]')
+	if values.dtype.kind in 'Mm':
+		return values
+	return np.ascontiguousarray(values,dtype=np.float64)
+
 
 #########
 # SETUP #
 #########
 
-######## /!\ important time handling to make sure times don't get shifted from UTC due to computer environment variables when using datetime objects ###########
-os.environ['TZ'] = 'UTC'
-time.tzset()
-# This will not change your system timezone settings
-################################################################################################################################################################
-
-print('\n\nPut in a folder all the .ncdf files (containing the complete eof data) you want to process, give the path to that folder')
-
-TCCON_path='1'
-while os.path.isdir(TCCON_path)==False:
-	TCCON_path=raw_input('Give the path to your folder /YOUR/PATH/TO/FILES  :\n')
-	if os.path.isdir(TCCON_path)==False:
-		print('/!\\ You gave a wrong path /!\\\n')
-
-save_path=os.path.join(TCCON_path,'SAVE')
-if not os.path.isdir(save_path):
-	os.makedirs(save_path)
-
-kelly_colors = {	
-					'vivid_yellow':(255, 179, 0),
-					'strong_purple':(128, 62, 117),
-					'vivid_orange':(255, 104, 0),
-					'very_light_blue':(166, 189, 215),
-					'vivid_red':(193, 0, 32),
-					'grayish_yellow':(206, 162, 98),
-					'medium_gray':(129, 112, 102),
-
-					# these aren't good for people with defective color vision:
-					'vivid_green':(0, 125, 52),
-					'strong_purplish_pink':(246, 118, 142),
-					'strong_blue':(0, 83, 138),
-					'strong_yellowish_pink':(255, 122, 92),
-					'strong_violet':(83, 55, 122),
-					'vivid_orange_yellow':(255, 142, 0),
-					'strong_purplish_red':(179, 40, 81),
-					'vivid_greenish_yellow':(244, 200, 0),
-					'strong_reddish_brown':(127, 24, 13),
-					'vivid_yellowish_green':(147, 170, 0),
-					'deep_yellowish_brown':(89, 51, 21),
-					'vivid_reddish_orange':(241, 58, 19),
-					'dark_olive_green':(35, 44, 22),
-
-					#filling in for the last sites
-					'gold':'gold',
-					'chartreuse':'chartreuse',
-					'cyan':'cyan',
-					'firebrick':'firebrick',
-					'lightsalmon':'lightsalmon',
-					'peru':'peru',
-					'goldenrod':'goldenrod',
-					'navy':'navy',
-					'green':'green',
-					'orange':'orange',
-					'purple','purple',
-					'red':'red',
-					'blue':'blue',
+# number of processes used to match and average the sites, can be set up to the number of cores
+workers = 1
+
+# the worker processes of Pool import this file, so the main code must only run when the file is executed
+if __name__ == "__main__":
+	######## /!\ important time handling to make sure times don't get shifted from UTC due to computer environment variables when using datetime objects ###########
+	os.environ['TZ'] = 'UTC'
+	time.tzset()
+	# This will not change your system timezone settings
+	################################################################################################################################################################
+
+	print('\n\nPut in a folder all the .ncdf files (containing the complete eof data) you want to process, give the path to that folder')
+
+	TCCON_path='1'
+	while os.path.isdir(TCCON_path)==False:
+		TCCON_path=raw_input('Give the path to your folder /YOUR/PATH/TO/FILES  :\n')
+		if os.path.isdir(TCCON_path)==False:
+			print('/!\\ You gave a wrong path /!\\\n')
+
+	save_path=os.path.join(TCCON_path,'SAVE')
+	if not os.path.isdir(save_path):
+		os.makedirs(save_path)
+
+	kelly_colors = {	
+						'vivid_yellow':(255, 179, 0),
+						'strong_purple':(128, 62, 117),
+						'vivid_orange':(255, 104, 0),
+						'very_light_blue':(166, 189, 215),
+						'vivid_red':(193, 0, 32),
+						'grayish_yellow':(206, 162, 98),
+						'medium_gray':(129, 112, 102),
+
+						# these aren't good for people with defective color vision:
+						'vivid_green':(0, 125, 52),
+						'strong_purplish_pink':(246, 118, 142),
+						'strong_blue':(0, 83, 138),
+						'strong_yellowish_pink':(255, 122, 92),
+						'strong_violet':(83, 55, 122),
+						'vivid_orange_yellow':(255, 142, 0),
+						'strong_purplish_red':(179, 40, 81),
+						'vivid_greenish_yellow':(244, 200, 0),
+						'strong_reddish_brown':(127, 24, 13),
+						'vivid_yellowish_green':(147, 170, 0),
+						'deep_yellowish_brown':(89, 51, 21),
+						'vivid_reddish_orange':(241, 58, 19),
+						'dark_olive_green':(35, 44, 22),
+
+						#filling in for the last sites
+						'gold':'gold',
+						'chartreuse':'chartreuse',
+						'cyan':'cyan',
+						'firebrick':'firebrick',
+						'lightsalmon':'lightsalmon',
+						'peru':'peru',
+						'goldenrod':'goldenrod',
+						'navy':'navy',
+						'green':'green',
+						'orange':'orange',
+						'purple':'purple',
+						'red':'red',
+						'blue':'blue',
+
+					}
+
+	# dictonnary with the full names of TCCON sites
+	T_FULL = {
+				'pa':'Park Falls',
+				'oc':'Lamont',
+				'wg':'Wollongong',
+				'db':'Darwin',
+				'or':'Orleans',
+				'bi':'Bialystok',
+				'br':'Bremen',
+				'jc':'JPL 01',
+				'jf':'JPL 02',
+				'ra':'Reunion Island',
+				'gm':'Garmisch',
+				'lh':'Lauder 01',
+				'll':'Lauder 02',
+				'tk':'Tsukuba 02',
+				'ka':'Karlsruhe',
+				'ae':'Ascension Island',
+				'eu':'Eureka',
+				'so':'Sodankyla',
+				'iz':'Izana',
+				'if':'Indianapolis',
+				'df':'Dryden',
+				'js':'Saga',
+				'fc':'Four Corners',
+				'ci':'Pasadena',
+				'rj':'Rikubetsu',
+				'pr':'Paris',
+				'ma':'Manaus',
+				'sp':'Ny-Alesund',
+				'et':'East Trout Lake',
+				'an':'Anmyeondo',
+				'bu':'Burgos',
+				'we':'Jena',
+				'zs':'Zugspitze',
+			 }
+
+	# dictonnary with the country/state of TCCON sites
+	T_LOC =  {	
+				'pa':'Wisconsin, USA',
+				'oc':'Oklahoma, USA',
+				'wg':'Australia',
+				'db':'Australia',
+				'or':'France',
+				'bi':'Poland',
+				'br':'Germany',
+				'jc':'California, USA',
+				'jf':'California, USA',
+				'ra':'France',
+				'gm':'Germany',
+				'lh':'New Zealand',
+				'll':'New Zealand',
+				'tk':'Japan',
+				'ka':'Germany',
+				'ae':'United Kingdom',
+				'eu':'Canada',
+				'so':'Finland',
+				'iz':'Spain',
+				'if':'Indiana, USA',
+				'df':'California, USA',
+				'js':'Japan',
+				'fc':'USA',
+				'ci':'California, USA',
+				'rj':'Japan',
+				'pr':'France',
+				'ma':'Brazil',
+				'sp':'Norway',
+				'et':'Canada',
+				'an':'South Korea',
+				'bu':'Philippines',
+				'we':'Germany',
+				'zs':'Germany',
+			 }
+
+	site_files =[i for i in os.listdir(TCCON_path) if '.' in i]
+
+	# start a new analysis or use existing files
+	Q = ''
+	while Q not in ['Y','y','N','n']:
+		Q=raw_input("\nSkip to plotting? (y/n):\n")
+		if Q not in ['Y','y','N','n']:
+			print('Your must type y for yes or n for no')
 
-				}
+	# plots tools
+	TOOLS = "pan,wheel_zoom,box_zoom,undo,redo,reset,save"
 
-# dictonnary with the full names of TCCON sites
-T_FULL = {
-			'pa':'Park Falls',
-			'oc':'Lamont',
-			'wg':'Wollongong',
-			'db':'Darwin',
-			'or':'Orleans',
-			'bi':'Bialystok',
-			'br':'Bremen',
-			'jc':'JPL 01',
-			'jf':'JPL 02',
-			'ra':'Reunion Island',
-			'gm':'Garmisch',
-			'lh':'Lauder 01',
-			'll':'Lauder 02',
-			'tk':'Tsukuba 02',
-			'ka':'Karlsruhe',
-			'ae':'Ascension Island',
-			'eu':'Eureka',
-			'so':'Sodankyla',
-			'iz':'Izana',
-			'if':'Indianapolis',
-			'df':'Dryden',
-			'js':'Saga',
-			'fc':'Four Corners',
-			'ci':'Pasadena',
-			'rj':'Rikubetsu',
-			'pr':'Paris',
-			'ma':'Manaus',
-			'sp':'Ny-Alesund',
-			'et':'East Trout Lake',
-			'an':'Anmyeondo',
-			'bu':'Burgos',
-			'we':'Jena',
-			'zs':'Zugspitze',
-		 }
-
-# dictonnary with the country/state of TCCON sites
-T_LOC =  {	
-			'pa':'Wisconsin, USA',
-			'oc':'Oklahoma, USA',
-			'wg':'Australia',
-			'db':'Australia',
-			'or':'France',
-			'bi':'Poland',
-			'br':'Germany',
-			'jc':'California, USA',
-			'jf':'California, USA',
-			'ra':'France',
-			'gm':'Germany',
-			'lh':'New Zealand',
-			'll':'New Zealand',
-			'tk':'Japan',
-			'ka':'Germany',
-			'ae':'United Kingdom',
-			'eu':'Canada',
-			'so':'Finland',
-			'iz':'Spain',
-			'if':'Indiana, USA',
-			'df':'California, USA',
-			'js':'Japan',
-			'fc':'USA',
-			'ci':'California, USA',
-			'rj':'Japan',
-			'pr':'France',
-			'ma':'Brazil',
-			'sp':'Norway',
-			'et':'Canada',
-			'an':'South Korea',
-			'bu':'Philippines',
-			'we':'Germany',
-			'zs':'Germany',
-		 }
-
-site_files =[i for i in os.listdir(TCCON_path) if '.' in i]
-
-# start a new analysis or use existing files
-Q = ''
-while Q not in ['Y','y','N','n']:
-	Q=raw_input("\nSkip to plotting? (y/n):\n")
-	if Q not in ['Y','y','N','n']:
-		print('Your must type y for yes or n for no')
-
-# plots tools
-TOOLS = "pan,wheel_zoom,box_zoom,undo,redo,reset,save"
+	#############
+	# MAIN CODE #
+	#############
 
-#############
-# MAIN CODE #
-#############
-
-codestart = time.time() #To keep track of time while the code runs
+	codestart = time.time() #To keep track of time while the code runs
 
-if Q in ['N','n']:
+	if Q in ['N','n']:
 
-	select_vars = (raw_input('\nGive the exact name of variables to read (.EOF headers), separate by commas (lat,long,flag,time,sza are read by default) (e.g. "xco2_ppm,xch4_ppm,xn2o_ppb,xco2_error_ppm"):\n')).split(',')
+		select_vars = (raw_input('\nGive the exact name of variables to read (.EOF headers), separate by commas (lat,long,flag,time,sza are read by default) (e.g. "xco2_ppm,xch4_ppm,xn2o_ppb,xco2_error_ppm"):\n')).split(',')
 	
-	sza_check = False
-	while sza_check == False:
-		SZA=raw_input('\nSelect data with SZA below (give a number or just press enter to take data with any SZA):\n')
-		if SZA == '':
-			sza_check = True
-		try:
-			float(SZA)
-			sza_check = True
-		except ValueError:
-			pass
-
-	QF = ''
-	while QF not in ['Y','y','N','n']:
-		QF=raw_input("\nSkip matching and averaging? (y/n):\n")
-		if QF not in ['Y','y','N','n']:
-			print('Your must type y for yes or n for no')
-
-	if QF in ['N','n']:
-
-		print('\nTCCON sites and two letter abbreviations:\n')
-		for i in T_FULL.keys():
-			print('\t-',T_FULL[i],':',i)
+		sza_check = False
+		while sza_check == False:
+			SZA=raw_input('\nSelect data with SZA below (give a number or just press enter to take data with any SZA):\n')
+			if SZA == '':
+				sza_check = True
+			try:
+				float(SZA)
+				sza_check = True
+			except ValueError:
+				pass
+
+		QF = ''
+		while QF not in ['Y','y','N','n']:
+			QF=raw_input("\nSkip matching and averaging? (y/n):\n")
+			if QF not in ['Y','y','N','n']:
+				print('Your must type y for yes or n for no')
 
-		SELECT = ''
-		while SELECT not in T_FULL.keys():
-			SELECT = raw_input('\nGive the two letter abreviation of the site you wish to compare with other TCCON sites (e.g. "eu" for Eureka):\n')
-			if SELECT not in T_FULL.keys():
-				print('Wrong entry')
-		SELECT = T_FULL[SELECT]
+		pair_mode = False
+		if QF in ['N','n']:
 
-		# Ask user if (s)he wants to set a custom time range; if not, use the time range of the selected site
-		QS=''
-		while QS not in ['Y','y','N','n']:
-			QS=raw_input("Use a specific time range? (y/n) if no, "+SELECT+" full time range will be used:\n")
-			if QS not in ['Y','y','N','n']:
-				print('Your must type y for yes or n for no')
+			# batch mode that compares all the pairs of sites instead of one site against the others
+			QA = ''
+			while QA not in ['Y','y','N','n']:
+				QA=raw_input("\nCompare all the pairs of sites? (y/n) if no, you will select one site to compare with the others:\n")
+				if QA not in ['Y','y','N','n']:
+					print('Your must type y for yes or n for no')
+			pair_mode = QA in ['Y','y']
 
-		if QS in ['Y','y']:		
-			time_switch = True
-		else:
-			time_switch = False
+			if pair_mode:
+				SELECT = 'all sites'
+			else:
+				print('\nTCCON sites and two letter abbreviations:\n')
+				for i in T_FULL.keys():
+					print('\t-',T_FULL[i],':',i)
+
+				SELECT = ''
+				while SELECT not in T_FULL.keys():
+					SELECT = raw_input('\nGive the two letter abreviation of the site you wish to compare with other TCCON sites (e.g. "eu" for Eureka):\n')
+					if SELECT not in T_FULL.keys():
+						print('Wrong entry')
+				SELECT = T_FULL[SELECT]
+
+			# Ask user if (s)he wants to set a custom time range; if not, use the time range of the selected site
+			QS=''
+			while QS not in ['Y','y','N','n']:
+				QS=raw_input("Use a specific time range? (y/n) if no, "+SELECT+" full time range will be used:\n")
+				if QS not in ['Y','y','N','n']:
+					print('Your must type y for yes or n for no')
+
+			if QS in ['Y','y']:		
+				time_switch = True
+			else:
+				time_switch = False
 
-		# if time_switch = True, get a user specified time range
-		if time_switch == True:
+			# if time_switch = True, get a user specified time range
+			if time_switch == True:
 
-			t0 = ''
-			while type(t0) != datetime: 
-				start = raw_input("Starting date? YYYY-MM-DD-HH (e.g. 2010-01-02-14 for 2 PM January 2nd 2010, -HH is optional):\n")
+				t0 = ''
+				while type(t0) != datetime: 
+					start = raw_input("Starting date? YYYY-MM-DD-HH (e.g. 2010-01-02-14 for 2 PM January 2nd 2010, -HH is optional):\n")
 			
-				if len(start) in [10,13]:	
-					if len(start) == 13:
-						t0 = datetime.strptime(start,'%Y-%m-%d-%H')
+					if len(start) in [10,13]:	
+						if len(start) == 13:
+							t0 = datetime.strptime(start,'%Y-%m-%d-%H')
+						else:
+							t0 = datetime.strptime(start,'%Y-%m-%d')
 					else:
-						t0 = datetime.strptime(start,'%Y-%m-%d')
-				else:
-					print("Invalid input")
-					t0 = ''
-
-			tf = ''	
-			while type(tf) != datetime: 
-				end = raw_input("End date? YYYY-MM-DD-HH (e.g. 2010-01-02-14 for 2 PM January 2nd 2010, -HH is optional):\n")
-				if len(end) in [10,13]:
-					if len(end) == 13:
-						tf = datetime.strptime(end,'%Y-%m-%d-%H')
+						print("Invalid input")
+						t0 = ''
+
+				tf = ''	
+				while type(tf) != datetime: 
+					end = raw_input("End date? YYYY-MM-DD-HH (e.g. 2010-01-02-14 for 2 PM January 2nd 2010, -HH is optional):\n")
+					if len(end) in [10,13]:
+						if len(end) == 13:
+							tf = datetime.strptime(end,'%Y-%m-%d-%H')
+						else:
+							tf = datetime.strptime(end,'%Y-%m-%d')
 					else:
-						tf = datetime.strptime(end,'%Y-%m-%d')
-				else:
-					print("Invalid input")
-					tf = ''
-
-				if type(tf) == datetime:
-					if tf < t0:
-						print("The starting date shall precede the end date")
+						print("Invalid input")
 						tf = ''
 
-		# Frequency of data matching and averaging
-		switch = False # for checking the validity of user input
-		while switch == False:
-			FREQ = raw_input("Frequency of data matching and averaging? (e.g. '1 hours'; '5.62 days','7.1 weeks', put an 's' even for 1):\n")
-			if len(FREQ.split()) == 2: # there should be exactly two arguments
-				if FREQ.split()[1] in ['hours','days','weeks']: # the second argument must be in that list
-					try: # the first argument must be a number
-						float(FREQ.split()[0])
-						switch = True # if above conditions are met, get out of the while loop, otherwise output an error message and prompt user with the question again
-					except ValueError:
-						print("Invalid input (1)")
+					if type(tf) == datetime:
+						if tf < t0:
+							print("The starting date shall precede the end date")
+							tf = ''
+
+			# Frequency of data matching and averaging
+			switch = False # for checking the validity of user input
+			while switch == False:
+				FREQ = raw_input("Frequency of data matching and averaging? (e.g. '1 hours'; '5.62 days','7.1 weeks', put an 's' even for 1):\n")
+				if len(FREQ.split()) == 2: # there should be exactly two arguments
+					if FREQ.split()[1] in ['hours','days','weeks']: # the second argument must be in that list
+						try: # the first argument must be a number
+							float(FREQ.split()[0])
+							switch = True # if above conditions are met, get out of the while loop, otherwise output an error message and prompt user with the question again
+						except ValueError:
+							print("Invalid input (1)")
+					else:
+						print("Invalid input (2)")			
 				else:
-					print("Invalid input (2)")			
-			else:
-				print("Invalid input (3)")
+					print("Invalid input (3)")
 
-		if FREQ.split()[1] == 'weeks':
-			time_step = timedelta(weeks=float(FREQ.split()[0]))
-		if FREQ.split()[1] == 'days':
-			time_step = timedelta(days=float(FREQ.split()[0]))
-		if FREQ.split()[1] == 'hours':
-			time_step = timedelta(hours=float(FREQ.split()[0]))
+			if FREQ.split()[1] == 'weeks':
+				time_step = timedelta(weeks=float(FREQ.split()[0]))
+			if FREQ.split()[1] == 'days':
+				time_step = timedelta(days=float(FREQ.split()[0]))
+			if FREQ.split()[1] == 'hours':
+				time_step = timedelta(hours=float(FREQ.split()[0]))
 
-		frequency = time_step.total_seconds()
+			frequency = time_step.total_seconds()
 	
-	###########################
-	# Read TCCON netCDF files #
-	###########################
+		###########################
+		# Read TCCON netCDF files #
+		###########################
 
-	milestone = time.time()
-	print('\nRead TCCON netCDF files ...')
+		milestone = time.time()
+		print('\nRead TCCON netCDF files ...')
 
-	ALL_DATA = {}
-	prev_site = ''
+		ALL_DATA = {}
 
-	for file in site_files:
+		# variables read by default
+		read_vars = select_vars+[var for var in ['time','asza_deg','flag','lat_deg','long_deg'] if var not in select_vars]
 
-		site_path = os.path.join(TCCON_path,file)
-		
-		site = T_FULL[file[:2]] # filnames start with the site two letter abbreviation
+		# files of each site, filenames start with the site two letter abbreviation
+		site_file_list = {}
+		for file in sorted(site_files):
+			site_file_list.setdefault(T_FULL[file[:2]],[]).append(file)
 
-		check = False
-		if site == prev_site:
-			check = True
-		else:
-			print('\n',site)
-			data_site = {}
-
-		print(file)
+		for site in site_file_list:
 
-		f = netCDF4.Dataset(site_path,'r')
+			print('\n',site)
 
-		try:
-			for var in select_vars:
-				if check == False:
-					data_site[var] = f.variables[var][:]
-					if ('time' not in select_vars) and (var == select_vars[0]):
-						data_site['time'] = f.variables['time'][:]
-						data_site['datetime'] = np.array([datetime(*time.gmtime(i*24*3600)[:6]) for i in f.variables['time'][:]])
-					if ('asza_deg' not in select_vars) and (var == select_vars[0]):
-						data_site['asza_deg'] = f.variables['asza_deg'][:]
-					if ('flag' not in select_vars) and (var == select_vars[0]):
-						data_site['flag'] = f.variables['flag'][:]
-					if ('lat_deg' not in select_vars) and (var == select_vars[0]):
-						data_site['lat_deg'] = f.variables['lat_deg'][:]	
-					if ('long_deg' not in select_vars) and (var == select_vars[0]):
-						data_site['long_deg'] = f.variables['long_deg'][:]									
+			# open the files once, and get the number of records in each file from the netCDF dimensions
+			site_datasets = []
+			var_types = {}
+			for file in site_file_list[site]:
+				print(file)
+				f = netCDF4.Dataset(os.path.join(TCCON_path,file),'r')
+				missing = [var for var in read_vars if var not in f.variables]
+				if missing:
+					print(site,'has no',missing[0])
+					f.close()
 				else:
-					data_site[var] = np.append(data_site[var][:],f.variables[var][:])
-					if ('time' not in select_vars) and (var == select_vars[0]):
-						data_site['time'] = np.append(data_site['time'][:],f.variables['time'][:])
-						data_site['datetime'] = np.append( data_site['datetime'][:] , np.array([datetime(*time.gmtime(i*24*3600)[:6]) for i in f.variables['time'][:]]) )		
-					if ('asza_deg' not in select_vars) and (var == select_vars[0]):
-						data_site['asza_deg'] = np.append( data_site['asza_deg'][:],f.variables['asza_deg'][:] )	
-					if ('flag' not in select_vars) and (var == select_vars[0]):
-						data_site['flag'] = np.append( data_site['flag'][:],f.variables['flag'][:] )
-					if ('lat_deg' not in select_vars) and (var == select_vars[0]):
-						data_site['lat_deg'] = np.append( data_site['lat_deg'][:],f.variables['lat_deg'][:] )
-					if ('long_deg' not in select_vars) and (var == select_vars[0]):
-						data_site['long_deg'] = np.append( data_site['long_deg'][:],f.variables['long_deg'][:] )
+					site_datasets.append(f)
+					for var in read_vars:
+						var_types.setdefault(var,(f.variables[var].dtype,f.variables[var].shape[1:]))
+
+			if site_datasets == []:
+				continue
+
+			# preallocate the site arrays and fill them file by file
+			total = sum([f.variables['time'].shape[0] for f in site_datasets])
+			data_site = {var:np.empty((total,)+var_types[var][1],dtype=var_types[var][0]) for var in read_vars}
+			start = 0
+			for f in site_datasets:
+				size = f.variables['time'].shape[0]
+				for var in read_vars:
+					values = f.variables[var][:]
+					if np.ma.isMaskedArray(values):
+						values = np.ma.filled(values,np.nan if data_site[var].dtype.kind=='f' else values.fill_value)
+					data_site[var][start:start+size] = values
+				f.close()
+				start += size
+
+			# the times stay a datetime64 array, single times are converted to datetime objects where needed
+			data_site['datetime'] = np.floor(data_site['time']*24*3600).astype('int64').astype('datetime64[s]').astype('datetime64[us]')
 
 			ALL_DATA[site] = data_site
 
-		except KeyError:
-			print(site,'has no',var)
-			pass
-
-		prev_site = site
-
-		f.close()
-
-	del data_site # we will just need the ALL_DATA[site] from now on
-
-	print('\nRead TCCON netCDF files DONE in',time.time()-milestone,'seconds\n')
+		print('\nRead TCCON netCDF files DONE in',time.time()-milestone,'seconds\n')
 
-	#####################
-	#    Filter DATA    #
-	#####################
+		#####################
+		#    Filter DATA    #
+		#####################
 
-	milestone = time.time()
-	print('Get flag=0 data ...')
-	DATA = {} # flag 0 data
-
-	for site in ALL_DATA:
-		DATA[site] = {}
-		no_flag = [i for i in range(len(ALL_DATA[site]['flag'])) if ALL_DATA[site]['flag'][i]==0]
-		tot=len([var for var in ALL_DATA[site]])
-		count=0
-		for var in ALL_DATA[site]:
-			progress(count,tot,char=site)
-			count+=1
-			if len(ALL_DATA[site][var])==len(ALL_DATA[site]['flag']):
-				DATA[site][var] = np.array([ALL_DATA[site][var][i] for i in no_flag])
-	print('\nGet flag=0 data DONE in',time.time()-milestone,'seconds\n')
+		milestone = time.time()
+		filters = ['flag=0']
+		if SZA!='':
+			filters += ['sza<='+SZA]
+		if QF in ['N','n'] and time_switch:
+			filters += ['time range']
+		print('Get '+', '.join(filters)+' data ...')
+		DATA = {} # filtered data
+
+		for site in ALL_DATA:
+			# one boolean mask per site with all the criteria
+			keep = np.asarray(ALL_DATA[site]['flag'])==0
+			if SZA!='':
+				keep &= np.asarray(ALL_DATA[site]['asza_deg'])<=float(SZA)
+			if QF in ['N','n'] and time_switch:
+				# one extra interval after tf so that the last interval used for matching and averaging is complete
+				site_times = np.asarray(ALL_DATA[site]['datetime'],dtype='datetime64[us]')
+				keep &= (site_times>=np.datetime64(t0,'us')) & (site_times<np.datetime64(tf+time_step,'us'))
+
+			DATA[site] = {}
+			for var in ALL_DATA[site]:
+				if len(ALL_DATA[site][var])==len(keep):
+					if keep.all():
+						DATA[site][var] = ALL_DATA[site][var] # nothing to remove, no need to copy
+					else:
+						DATA[site][var] = ALL_DATA[site][var][keep]
+			print('\t-',site,':',np.count_nonzero(keep),'/',len(keep))
+		print('Get '+', '.join(filters)+' data DONE in',time.time()-milestone,'seconds\n')
 
-	del ALL_DATA # memory relief as this can represent several GB of data
+		del ALL_DATA # memory relief as this can represent several GB of data
 
-	if SZA!='':
-		milestone = time.time()
-		print('Get sza<'+SZA+' data ...')
-		for site in DATA:
-			print('\n',site)
-			small_sza = [i for i in range(len(DATA[site]['asza_deg'])) if DATA[site]['asza_deg'][i]<=float(SZA)]
-			tot=len([var for var in DATA[site]])
-			count=0
-			for var in DATA[site]:
-
-				print(var)
-				#progress(count,tot,char=site)
-				count+=1
-				if len(DATA[site][var])==len(DATA[site]['asza_deg']):
-					DATA[site][var] = np.array([DATA[site][var][i] for i in small_sza])
-				print(len(DATA[site][var]))
-		print('Get sza<'+SZA+' data DONE in',time.time()-milestone,'seconds\n')
-
-	if time_switch == False:
-		t0 = DATA[SELECT]['datetime'][0]
-		tf = DATA[SELECT]['datetime'][-1]
+		if (QF in ['N','n']) and (time_switch == False):
+			if pair_mode:
+				t0 = min([DATA[site]['datetime'][0] for site in DATA if len(DATA[site]['datetime'])>0]).astype(datetime)
+				tf = max([DATA[site]['datetime'][-1] for site in DATA if len(DATA[site]['datetime'])>0]).astype(datetime)
+			else:
+				t0 = DATA[SELECT]['datetime'][0].astype(datetime)
+				tf = DATA[SELECT]['datetime'][-1].astype(datetime)
 	
-	if QF in ['N','n']:
-		print(SELECT,'time range:\nStart',t0.strftime('%d-%m-%Y %H:%M'),'\nEnd',tf.strftime('%d-%m-%Y %H:%M'))
+		if QF in ['N','n']:
+			print(SELECT,'time range:\nStart',t0.strftime('%d-%m-%Y %H:%M'),'\nEnd',tf.strftime('%d-%m-%Y %H:%M'))
 		
-	########################
-	# FREQly averaged data #
-	########################
-
-	if QF in ['N','n']:
-		FREQ_DATA = {}
-
-		span = int(ceil((tf-t0).total_seconds()/frequency))
+		########################
+		# All pairs of sites   #
+		########################
+
+		if QF in ['N','n'] and pair_mode:
+			span = int(ceil((tf-t0).total_seconds()/frequency))
+
+			milestone = time.time()
+			print('Averaging all sites in',span,'intervals of',FREQ)
+
+			step = np.timedelta64((time_step.days*24*3600+time_step.seconds)*10**6+time_step.microseconds,'us')
+			edges = np.datetime64(t0,'us')+np.arange(span+1)*step
+
+			pair_sites = sorted(DATA.keys())
+			site_ID = {site:time_bin_index(np.asarray(DATA[site]['datetime'],dtype='datetime64[us]'),edges) for site in pair_sites}
+
+			pair_vars = [var for var in select_vars if False not in [var in DATA[site] for site in pair_sites]]
+
+			PAIR_DATA = {}
+			for var in pair_vars:
+				binned = np.array([bin_means(site_ID[site],DATA[site][var],span)[1] for site in pair_sites]) # (site,interval) matrix
+				PAIR_DATA[var] = pair_stats(binned)
+
+			print('all pairs DONE in',time.time()-milestone,'seconds\n')
+
+			# table with one line per pair of sites and variable
+			pair_columns = ['N','Bias','RMS','Scatter','R']
+			pair_table = {key:[] for key in ['variable','site1','site2']+pair_columns}
+			for var in pair_vars:
+				for i,site1 in enumerate(pair_sites):
+					for j,site2 in enumerate(pair_sites[i+1:],i+1):
+						if PAIR_DATA[var]['N'][i,j]>0:
+							pair_table['variable'].append(var)
+							pair_table['site1'].append(site1)
+							pair_table['site2'].append(site2)
+							for key in pair_columns:
+								pair_table[key].append(PAIR_DATA[var][key][i,j])
+
+			pair_name = 'PAIRS_'+'_'.join(FREQ.split())
+			print(' -writting',pair_name+'.csv','...')
+			outfile = open(os.path.join(save_path,pair_name+'.csv'),'w')
+			outfile.write('# all pairs of sites averaged in intervals of '+FREQ+' from '+t0.strftime('%d-%m-%Y %H:%M')+' to '+tf.strftime('%d-%m-%Y %H:%M')+'; Bias and RMS are for site1 - site2\n')
+			outfile.write(','.join(['variable','site1','site2']+pair_columns)+'\n')
+			for i in range(len(pair_table['variable'])):
+				outfile.write(','.join([pair_table[key][i] for key in ['variable','site1','site2']]+['%d' % pair_table['N'][i]]+['%.6g' % pair_table[key][i] for key in pair_columns[1:]])+'\n')
+			outfile.close()
+
+			QH = ''
+			while QH not in ['Y','y','N','n']:
+				QH=raw_input("\nAlso write the table in an html file? (y/n):\n")
+				if QH not in ['Y','y','N','n']:
+					print('Your must type y for yes or n for no')
+
+			if QH in ['Y','y']:
+				pair_source = ColumnDataSource(data={key:(bokeh_column(pair_table[key]) if key in pair_columns else pair_table[key]) for key in pair_table})
+				pair_datatable = DataTable(source=pair_source, columns=[TableColumn(field=key,title=key) for key in ['variable','site1','site2']+pair_columns], width=900, height=800)
+				print(' -writting',pair_name+'.html','...')
+				outfile = open(os.path.join(save_path,pair_name+'.html'),'w')
+				outfile.write(file_html(widgetbox(pair_datatable,width=900),CDN,pair_name))
+				outfile.close()
+
+		########################
+		# FREQly averaged data #
+		########################
+
+		if QF in ['N','n'] and not pair_mode:
+			FREQ_DATA = {}
+
+			span = int(ceil((tf-t0).total_seconds()/frequency))
+
+			milestone = time.time()
+			print('Dividing',SELECT,'time range in',span,'intervals of',FREQ)
+
+			# edges of the intervals as datetime64, each time is then assigned to its interval with a binary search
+			step = np.timedelta64((time_step.days*24*3600+time_step.seconds)*10**6+time_step.microseconds,'us')
+			edges = np.datetime64(t0,'us')+np.arange(span+1)*step
+
+			select_ID = time_bin_index(np.asarray(DATA[SELECT]['datetime'],dtype='datetime64[us]'),edges)
+			select_count = np.bincount(select_ID[select_ID>=0],minlength=span)
+
+			print('\ntimes DONE in',time.time()-milestone,'seconds')
+			print(SELECT,'has',np.count_nonzero(select_count),'intervals of',FREQ,'with data within the time range\n')
+
+			# arguments of match_site for each site
+			arg_list = []
+			for site in DATA:
+				if site != SELECT:
+					comn_var = [var for var in DATA[site] if var in DATA[SELECT]]
+					var_list = []
+					for var in comn_var:
+						if len(DATA[site][var]) == len(DATA[site]['time']):		
+							if False not in [elem not in var for elem in ['date','year','day','hour','lat','lon','km','Ver']]:
+								var_list.append(var)
+					site_data = {var:DATA[site][var] for var in var_list}
+					site_data['datetime'] = DATA[site]['datetime']
+					arg_list.append((site,site_data,var_list,edges,select_count))
+
+			milestone = time.time()
+			print('Matching and averaging',len(arg_list),'sites with',workers,'process(es) ...')
+			if workers>1:
+				pool = Pool(workers)
+				results = pool.map(match_site,arg_list)
+				pool.close()
+				pool.join()
+			else:
+				results = [match_site(args) for args in arg_list]
+			del arg_list
+			print('matching and averaging DONE in',time.time()-milestone,'seconds\n')
 
-		milestone = time.time()
-		print('Dividing',SELECT,'time range in',span,'intervals of',FREQ)
-		tmin = t0
-		temp = [[] for i in range(span)]
-		for interval in range(span):
-			progress(interval,span,char=SELECT)
-			tmax = tmin+time_step
-			times = DATA[SELECT]['datetime'][(DATA[SELECT]['datetime']>=tmin) & (DATA[SELECT]['datetime']<tmax)]
-			times_ID=np.nonzero(np.in1d(DATA[SELECT]['datetime'],times))[0]
-			temp[interval] = [j for j in times_ID]
-			tmin = tmax
-
-		print('\ntimes DONE in',time.time()-milestone,'seconds')
-		print(SELECT,'has',len([i for i in temp if i!=[]]),'intervals of',FREQ,'with data within the time range\n')
+			select_means = {} # averages of the reference site in each interval
+			for site,matched,freq_site_data in results:
 
-		for site in DATA:
+				print(site+':')
 
-			freq_data = {}
-
-			freq_site_data = {}
-			freq_select_data = {}
-
-			if site != SELECT:
-
-				milestone = time.time()
-				print(site+':\nMatching and averaging:')
-				tmin = t0
-				temp1 = [[] for i in range(span)]
-				# this loop can be very time consuming if the frequency of matching/averaging is small
-				for interval in range(span):
-					progress(interval,span,char=site)
-					tmax=tmin+time_step
-					if len(temp[interval])>0:
-						times = DATA[site]['datetime'][(DATA[site]['datetime'] >= tmin) & (DATA[site]['datetime'] < tmax)]
-						if len(times)>0:
-							times_ID = np.nonzero(np.in1d(DATA[site]['datetime'],times))[0]
-							temp1[interval] = [j for j in times_ID]
-						else:
-							temp1[interval] = []
-					else:
-						temp1[interval] = []
-					tmin=tmax
-				try:
-					if len([i for i in temp1 if i!=[]])==0:
-						print('\nmatching DONE in',time.time()-milestone,'seconds')
-						print('(1) Matching intervals of',FREQ,'within the time range: 0 /',len([i for i in temp if i!=[]]),'\n')
-						continue
-				except NameError:
-					print('\n',site,' has no data within the time range\n')
+				if np.count_nonzero(matched)==0:
+					print('(1) Matching intervals of',FREQ,'within the time range: 0 /',np.count_nonzero(select_count),'\n')
 					continue
 
-				tp=[i for i in temp if i!=[] and temp1[temp.index(i)]!=[]] # Matching indices for data in DATA[SELECT]
-				tp1=[i for i in temp1 if i!=[] and temp[temp1.index(i)]!=[]] # Matching indices for data in DATA[site]
-
-				print('\nmatching and averaging DONE in',time.time()-milestone,'seconds') # the averaging is in fact done after that but it takes less than 0.01 seconds for each site
+				freq_select_data = {}
+				for var in freq_site_data:
+					if var not in select_means:
+						select_means[var] = bin_means(select_ID,DATA[SELECT][var],span)[1]
+					freq_select_data[var] = select_means[var][matched]
 
-				if len(tp)!=len(tp1):
-					print('WARNING: length of matches is different: tp1=',len(tp1),'; tp=',len(tp))
+				# times of the intervals from the mean times of the site, truncated to the second
+				freq_times = (np.array(freq_site_data['time']*24*3600,dtype=np.float64).astype('int64')).astype('datetime64[s]')
+				freq_select_data['datetime'] = freq_times
+				freq_site_data['datetime'] = freq_times.copy()
 
-				comn_var = [var for var in DATA[site] if var in DATA[SELECT]]
-				for var in comn_var:
-					if len(DATA[site][var]) == len(DATA[site]['time']):		
-						if False not in [elem not in var for elem in ['date','year','day','hour','lat','lon','km','Ver']]:
-							freq_select_data[var] = np.array([sum([DATA[SELECT][var][j] for j in i])/len(i) for i in tp])
-							freq_site_data[var] = np.array([sum([DATA[site][var][j] for j in i])/len(i) for i in tp1])
+				print('(2) Matching','intervals of',FREQ,'within the time range: ',np.count_nonzero(matched),'/',np.count_nonzero(select_count),'\n')
 
-				freq_select_data['datetime'] = np.array([datetime(*time.gmtime(i*24*3600)[:6]) for i in freq_site_data['time'][:]])
-				freq_site_data['datetime'] = np.array([datetime(*time.gmtime(i*24*3600)[:6]) for i in freq_site_data['time'][:]])
+				FREQ_DATA[site] = {site:freq_site_data,SELECT:freq_select_data}
+			del results
 				
-				print('(2) Matching','intervals of',FREQ,'within the time range: ',len(tp),'/',len([i for i in temp if i!=[]]),'\n')
 
-				freq_data[site] = freq_site_data
-				freq_data[SELECT] = freq_select_data
-
-				FREQ_DATA[site] = freq_data
-				
-
-	for site in DATA:
-		ID = DATA.keys().index(site)
-		color = kelly_colors.keys()[ID]
-		DATA[site]['color'] = kelly_colors[color]
+		for site in DATA:
+			ID = DATA.keys().index(site)
+			color = kelly_colors.keys()[ID]
+			DATA[site]['color'] = kelly_colors[color]
 
-	np.save(os.path.join(save_path,'DATA.npy'),DATA)
+		np.save(os.path.join(save_path,'DATA.npy'),DATA)
 	
-	if QF in ['N','n']:
-		np.save(os.path.join(save_path,'FREQ_DATA_'+'_'.join(FREQ.split())+'_'+SELECT+'.npy'),FREQ_DATA)
-
-else: 
-	try:
-		DATA = np.load(os.path.join(save_path,'DATA.npy')).item()
-	except IOError:
-		print("You can't skip to plots because the data files don't exist\nExiting now ...\n")
-		sys.exit()
-
-QP = ''
-while QP not in ['D','d','F','f']:
-	QP=raw_input("\nPlot with DATA or FREQ_DATA? (d/f):\n")
-	if QP not in ['D','d','F','f']:
-		print('Your must type d for DATA or f for FREQ_DATA')
+		if QF in ['N','n'] and not pair_mode:
+			save_freq_data(os.path.join(save_path,'FREQ_DATA_'+'_'.join(FREQ.split())+'_'+SELECT),FREQ_DATA,SELECT,FREQ)
 
+	else: 
+		try:
+			DATA = np.load(os.path.join(save_path,'DATA.npy')).item()
+		except IOError:
+			print("You can't skip to plots because the data files don't exist\nExiting now ...\n")
+			sys.exit()
 
-# for DATA
-all_latitudes = sorted([DATA[site]['lat_deg'][0] for site in DATA])[::-1]
-
-ALL_site_lat = {} # latitude per site in an ordered dictionary
-
-for lat in all_latitudes:
-	ALL_site_lat[all_latitudes.index(lat)] = {}
-	for site in DATA:
-		if DATA[site]['lat_deg'][0] == lat:
-			ALL_site_lat[all_latitudes.index(lat)][site] = lat
+	QP = ''
+	while QP not in ['D','d','F','f']:
+		QP=raw_input("\nPlot with DATA or FREQ_DATA? (d/f):\n")
+		if QP not in ['D','d','F','f']:
+			print('Your must type d for DATA or f for FREQ_DATA')
 
-#########
-# Plots #
-#########
 
-print('\nVariables:\n','  '.join([var for var in DATA[DATA.keys()[0]]]),'\n')
+	# for DATA
+	all_latitudes = sorted([DATA[site]['lat_deg'][0] for site in DATA])[::-1]
 
-if QP in ['D','d']:
+	ALL_site_lat = {} # latitude per site in an ordered dictionary
 
-	which=(raw_input('What plot do you want? xaxis,yaxis ( e.g. datetime,xair ):\n')).split(',')
+	for lat in all_latitudes:
+		ALL_site_lat[all_latitudes.index(lat)] = {}
+		for site in DATA:
+			if DATA[site]['lat_deg'][0] == lat:
+				ALL_site_lat[all_latitudes.index(lat)][site] = lat
 
-	sources = {}
-	for site in DATA:
-		sources[site] = ColumnDataSource(data = {'x':DATA[site][which[0]],'y':DATA[site][which[1]]})
+	#########
+	# Plots #
+	#########
 
-	print('Plotting:')
+	print('\nVariables:\n','  '.join([var for var in DATA[DATA.keys()[0]]]),'\n')
 
-	lat_ordered_sites = [[key for key in dic][0] for dic in [ALL_site_lat[ID] for ID in ALL_site_lat]] # sites ordered by decreasing latitude
+	if QP in ['D','d']:
 
-	min_x = min([DATA[site][which[0]][0] for site in DATA])
-	max_x = max([DATA[site][which[0]][-1] for site in DATA])
+		which=(raw_input('What plot do you want? xaxis,yaxis ( e.g. datetime,xair ):\n')).split(',')
 
-	min_y = min([min(DATA[site][which[1]]) for site in DATA])
-	max_y = max([max(DATA[site][which[1]]) for site in DATA])
+		sources = {}
+		for site in DATA:
+			sources[site] = ColumnDataSource(data = {'x':bokeh_column(DATA[site][which[0]]),'y':bokeh_column(DATA[site][which[1]])})
 
-	# we will set the y axis range at +/- 10% of the data max amplitude
-	ampli = max_y - min_y
-	min_y = min_y - ampli*0.1/100
-	max_y = max_y + ampli*0.1/100
+		print('Plotting:')
 
-	milestone = time.time()
+		lat_ordered_sites = [[key for key in dic][0] for dic in [ALL_site_lat[ID] for ID in ALL_site_lat]] # sites ordered by decreasing latitude
 
-	if type(min_x) == datetime:
-		fig = figure(output_backend = "webgl", title = 'TCCON '+which[1]+' vs '+which[0], y_range=[min_y,max_y], plot_width = 900, plot_height = 650, tools = TOOLS, toolbar_location = 'above', x_axis_type='datetime', x_range = Range1d(min_x,max_x)) 
-	else:
-		fig = figure(output_backend = "webgl", title = 'TCCON '+which[1]+' vs '+which[0], y_range=[min_y,max_y], plot_width = 900, plot_height = 650, tools = TOOLS, toolbar_location = 'above', x_range = Range1d(int(min_x),ceil(max_x))) 
+		min_x,max_x = x_limits([DATA[site][which[0]] for site in DATA])
 
-	plots=[]
-	for site in lat_ordered_sites:
-		plots.append( fig.scatter(x='x',y='y',color=DATA[site]['color'],alpha=0.5,source=sources[site]) )
+		min_y = min([min(DATA[site][which[1]]) for site in DATA])
+		max_y = max([max(DATA[site][which[1]]) for site in DATA])
 
-	N_plots = range(len(plots))
+		# we will set the y axis range at +/- 10% of the data max amplitude
+		ampli = max_y - min_y
+		min_y = min_y - ampli*0.1/100
+		max_y = max_y + ampli*0.1/100
 
-	legend=Legend(items=[(lat_ordered_sites[i],[plots[i]]) for i in N_plots],location=(0,0))
-	fig.add_layout(legend,'right')
-	fig.yaxis.axis_label = which[1]
-	fig.xaxis.axis_label = which[0]
+		milestone = time.time()
 
-	checkbox = CheckboxGroup(labels=[site+' '+str(round(all_latitudes[lat_ordered_sites.index(site)],2)) for site in lat_ordered_sites],active=[],width=200)
+		if type(min_x) == datetime:
+			fig = figure(output_backend = "webgl", title = 'TCCON '+which[1]+' vs '+which[0], y_range=[min_y,max_y], plot_width = 900, plot_height = 650, tools = TOOLS, toolbar_location = 'above', x_axis_type='datetime', x_range = Range1d(min_x,max_x)) 
+		else:
+			fig = figure(output_backend = "webgl", title = 'TCCON '+which[1]+' vs '+which[0], y_range=[min_y,max_y], plot_width = 900, plot_height = 650, tools = TOOLS, toolbar_location = 'above', x_range = Range1d(min_x,max_x)) 
 
-	iterable = [('p'+str(i),plots[i]) for i in N_plots]+[('checkbox',checkbox)]
+		plots=[]
+		for site in lat_ordered_sites:
+			plots.append( fig.scatter(x='x',y='y',color=DATA[site]['color'],alpha=0.5,source=sources[site]) )
 
-	checkbox_code = """var indexOf = [].indexOf || function(item) { for (var i = 0, l = this.length; i < l; i++) { if (i in this && this[i] === item) return i; } return -1; };"""
-	checkbox_code += ''.join(['p'+str(i)+'.visible = indexOf.call(checkbox.active, '+str(i)+') >= 0;' for i in N_plots])
-	checkbox.callback = CustomJS(args={key: value for key,value in iterable}, code=checkbox_code)
+		N_plots = range(len(plots))
 
-	clear_button = Button(label='Clear all',width=200)
-	clear_button_code = """checkbox.set("active",[]);"""+checkbox_code
-	clear_button.callback = CustomJS(args={key: value for key,value in iterable}, code=clear_button_code)
+		legend=Legend(items=[(lat_ordered_sites[i],[plots[i]]) for i in N_plots],location=(0,0))
+		fig.add_layout(legend,'right')
+		fig.yaxis.axis_label = which[1]
+		fig.xaxis.axis_label = which[0]
 
-	check_button = Button(label='Check all',width=200)
-	check_button_code = """checkbox.set("active","""+str(N_plots)+""");"""+checkbox_code
-	check_button.callback = CustomJS(args={key: value for key,value in iterable}, code=check_button_code)
+		checkbox = CheckboxGroup(labels=[site+' '+str(round(all_latitudes[lat_ordered_sites.index(site)],2)) for site in lat_ordered_sites],active=[],width=200)
 
-	group = widgetbox(checkbox,clear_button,check_button)
+		iterable = [('p'+str(i),plots[i]) for i in N_plots]+[('checkbox',checkbox)]
 
-	grid = gridplot([[fig,group]])
+		checkbox_code = """var indexOf = [].indexOf || function(item) { for (var i = 0, l = this.length; i < l; i++) { if (i in this && this[i] === item) return i; } return -1; };"""
+		checkbox_code += ''.join(['p'+str(i)+'.visible = indexOf.call(checkbox.active, '+str(i)+') >= 0;' for i in N_plots])
+		checkbox.callback = CustomJS(args={key: value for key,value in iterable}, code=checkbox_code)
 
-	print(' -writting TCCON_'+which[0]+'_'+which[1]+'.html')
-	outfile=open(os.path.join(save_path,'TCCON_'+which[0]+'_'+which[1]+'.html'),'w')
-	outfile.write(file_html(grid,CDN,which[1]))
-	outfile.close()
-	print('TCCON_'+which[0]+'_'+which[1]+'.html DONE in', time.time()-milestone,'seconds\n')
+		clear_button = Button(label='Clear all',width=200)
+		clear_button_code = """checkbox.set("active",[]);"""+checkbox_code
+		clear_button.callback = CustomJS(args={key: value for key,value in iterable}, code=clear_button_code)
 
-else:
-	# for FREQ_DATA
+		check_button = Button(label='Check all',width=200)
+		check_button_code = """checkbox.set("active","""+str(N_plots)+""");"""+checkbox_code
+		check_button.callback = CustomJS(args={key: value for key,value in iterable}, code=check_button_code)
 
-	freq_filenames = [i for i in os.listdir(save_path) if 'FREQ_DATA' in i]
+		group = widgetbox(checkbox,clear_button,check_button)
 
-	rangelist = range(len(freq_filenames))
+		grid = gridplot([[fig,group]])
 
-	for i in rangelist:
-		print('\t',i,'-',freq_filenames[i])
+		print(' -writting TCCON_'+which[0]+'_'+which[1]+'.html')
+		outfile=open(os.path.join(save_path,'TCCON_'+which[0]+'_'+which[1]+'.html'),'w')
+		outfile.write(file_html(grid,CDN,which[1]))
+		outfile.close()
+		print('TCCON_'+which[0]+'_'+which[1]+'.html DONE in', time.time()-milestone,'seconds\n')
 
-	Qid = ''
-	while Qid not in rangelist:
-		try:
-			Qid = int(raw_input('\n\nWhich file to use?:\n'))
-		except ValueError: 
-			pass
-		if Qid not in rangelist:
-			print('You must enter the corresponding number')
+	else:
+		# for FREQ_DATA
+
+		freq_filenames = sorted([i for i in os.listdir(save_path) if 'FREQ_DATA' in i]) # FREQ_DATA folders, and .npy files from older versions
+
+		rangelist = range(len(freq_filenames))
+
+		for i in rangelist:
+			print('\t',i,'-',freq_filenames[i])
+
+		Qid = ''
+		while Qid not in rangelist:
+			try:
+				Qid = int(raw_input('\n\nWhich file to use?:\n'))
+			except ValueError: 
+				pass
+			if Qid not in rangelist:
+				print('You must enter the corresponding number')
+
+		freq_path = os.path.join(save_path,freq_filenames[Qid])
+		if os.path.isdir(freq_path):
+			freq_index = read_freq_index(freq_path)
+			SELECT = freq_index['select']
+			FREQ = freq_index['freq']
+			variabs = ['datetime']+freq_index['sites'][sorted(freq_index['sites'])[0]]['variables']
+		else:
+			FREQ_DATA = np.load(freq_path).item()
+			SELECT = freq_filenames[Qid].split('_')[-1].split('.')[0]
 
-	FREQ_DATA = np.load(os.path.join(save_path,freq_filenames[Qid])).item()
-	SELECT = freq_filenames[Qid].split('_')[-1].split('.')[0]
+			FREQ = ' '.join(freq_filenames[Qid].split('_')[2:4])
 
-	FREQ = ' '.join(freq_filenames[Qid].split('_')[2:4])
+			arbit = FREQ_DATA.keys()[0]
+			variabs = FREQ_DATA[arbit][arbit].keys()
+		print('\n\nVariables:\n')
 
-	arbit = FREQ_DATA.keys()[0]
-	variabs = FREQ_DATA[arbit][arbit].keys()
-	print('\n\nVariables:\n')
+		for i in range(len(variabs)):
+			print('\t',i,' - ',variabs[i])
 
-	for i in range(len(variabs)):
-		print('\t',i,' - ',variabs[i])
+		numtab = ''
+		vartoplot = []
+		while len(numtab)<1:
+			numtab=raw_input('\n\nWhat variable do you want to use? (give a series of comma separated numbers corresponding to each variable):\n')
 
-	numtab = ''
-	vartoplot = []
-	while len(numtab)<1:
-		numtab=raw_input('\n\nWhat variable do you want to use? (give a series of comma separated numbers corresponding to each variable):\n')
+		vartoplot = [variabs[int(i)] for i in numtab.split(',')]
 
-	vartoplot = [variabs[int(i)] for i in numtab.split(',')]
+		if os.path.isdir(freq_path):
+			FREQ_DATA = load_freq_data(freq_path,variables=vartoplot) # only read the variables to plot
 
-	latitudes = sorted([DATA[site]['lat_deg'][0] for site in FREQ_DATA])[::-1] # latitudes of sites in decreasing order.
+		latitudes = sorted([DATA[site]['lat_deg'][0] for site in FREQ_DATA])[::-1] # latitudes of sites in decreasing order.
 
-	site_lat = {}
+		site_lat = {}
 
-	for lat in latitudes:
-		site_lat[latitudes.index(lat)] = {}
-		for site in FREQ_DATA:
-			if DATA[site]['lat_deg'][0] == lat:
-				site_lat[latitudes.index(lat)][site] = lat
+		for lat in latitudes:
+			site_lat[latitudes.index(lat)] = {}
+			for site in FREQ_DATA:
+				if DATA[site]['lat_deg'][0] == lat:
+					site_lat[latitudes.index(lat)][site] = lat
 
-	lat_ordered_sites = [[key for key in dic][0] for dic in [site_lat[ID] for ID in site_lat]]
+		lat_ordered_sites = [[key for key in dic][0] for dic in [site_lat[ID] for ID in site_lat]]
 
-	tabs = []
-	TOOLS = "pan,wheel_zoom,box_zoom,undo,redo,reset,box_select,save"
+		tabs = []
+		TOOLS = "pan,wheel_zoom,box_zoom,undo,redo,reset,box_select,save"
 
-	temp = [0 for i in FREQ_DATA]
+		temp = [0 for i in FREQ_DATA]
 
-	columns = [ 
-					TableColumn(field='site',title='Site'),
-					TableColumn(field='latitude',title='Latitude'),
-					TableColumn(field='N',title='N'),
-					TableColumn(field='RMS',title='RMS'),
-					TableColumn(field='Bias',title='Bias'),
-					TableColumn(field='Scatter',title='Scatter'),
-					TableColumn(field='R',title='R'),
-					]
+		columns = [ 
+						TableColumn(field='site',title='Site'),
+						TableColumn(field='latitude',title='Latitude'),
+						TableColumn(field='N',title='N'),
+						TableColumn(field='RMS',title='RMS'),
+						TableColumn(field='Bias',title='Bias'),
+						TableColumn(field='Scatter',title='Scatter'),
+						TableColumn(field='R',title='R'),
+						]
 
-	milestone = time.time()
+		milestone = time.time()
 
-	freq_sources = {}
-	freq_cor_sources = {}
+		freq_sources = {}
+		freq_cor_sources = {}
 
-	for var in vartoplot:
+		for var in vartoplot:
 
-		table_source = ColumnDataSource( data = {'site':lat_ordered_sites,'latitude':[round(DATA[i]['lat_deg'][0],2) for i in lat_ordered_sites],'N':temp,'RMS':temp,'Bias':temp,'Scatter':temp,'R':temp} )
+			table_source = ColumnDataSource( data = {'site':lat_ordered_sites,'latitude':[round(DATA[i]['lat_deg'][0],2) for i in lat_ordered_sites],'N':temp,'RMS':temp,'Bias':temp,'Scatter':temp,'R':temp} )
 		
-		data_table = DataTable(source=table_source, columns=columns, width= 700, height=400)
-
-		if var == 'xair':
-			prec = '4'
-		else:
-			prec = '2'
-
-		txt = PreText(text='The table must be displayed with increasing # before you start a new selection',width = 1000)
-
-		count = 0
-		for site in lat_ordered_sites:
-			freq_sources[site]={site:{},SELECT:{}}
-			freq_sources[site][site] = ColumnDataSource(data={'x':FREQ_DATA[site][site]['datetime'],'y':FREQ_DATA[site][site][var],'nicetime':[dat.strftime('%d-%m-%Y %H:%M') for dat in FREQ_DATA[site][site]['datetime']]})
-			freq_sources[site][SELECT] = ColumnDataSource(data={'x':FREQ_DATA[site][SELECT]['datetime'],'y':FREQ_DATA[site][SELECT][var]})
+			data_table = DataTable(source=table_source, columns=columns, width= 700, height=400)
 
-			freq_cor_sources[site] = ColumnDataSource(data={'x':[],'y':[]})
-
-			freq_sources[site][site].callback = CustomJS(args = dict(s2=freq_sources[site][SELECT],dt=data_table,scor=freq_cor_sources[site]), code="""
-			var inds = cb_obj.get('selected')['1d'].indices;
-			var d1 = cb_obj.get('data');
-			var d2 = s2.get('data');
-			var tab = dt.get('source').get('data');
-			var dcor = scor.get('data');
-
-			var difm = 0;
-			var difm2 = 0;
-			var scat = 0;
+			if var == 'xair':
+				prec = '4'
+			else:
+				prec = '2'
+
+			txt = PreText(text='The table must be displayed with increasing # before you start a new selection',width = 1000)
+
+			count = 0
+			for site in lat_ordered_sites:
+				freq_sources[site]={site:{},SELECT:{}}
+				# times are formatted in the browser (e.g. with a '@x{%d-%m-%Y %H:%M}' tooltip and a 'datetime' formatter) instead of embedding a string for each point
+				freq_sources[site][site] = ColumnDataSource(data={'x':bokeh_column(FREQ_DATA[site][site]['datetime']),'y':bokeh_column(FREQ_DATA[site][site][var])})
+				freq_sources[site][SELECT] = ColumnDataSource(data={'x':bokeh_column(FREQ_DATA[site][SELECT]['datetime']),'y':bokeh_column(FREQ_DATA[site][SELECT][var])})
+
+				freq_cor_sources[site] = ColumnDataSource(data={'x':[],'y':[]})
+
+				# prefix sums of the matched data, the statistics of a selected time window are then given by the difference of two values
+				offset,sums = prefix_sums(freq_sources[site][site].data['x'],freq_sources[site][site].data['y'],freq_sources[site][SELECT].data['y'])
+				freq_sum_source = ColumnDataSource(data=sums)
+
+				freq_sources[site][site].callback = CustomJS(args = dict(s2=freq_sources[site][SELECT],dt=data_table,scor=freq_cor_sources[site],sums=freq_sum_source), code="""
+				var inds = cb_obj.get('selected')['1d'].indices;
+				var d1 = cb_obj.get('data');
+				var d2 = s2.get('data');
+				var tab = dt.get('source').get('data');
+				var dcor = scor.get('data');
+				var c = sums.get('data');
+				var offset = """+repr(float(offset))+""";
+
+				if (inds.length == 0) {
+					tab['N']["""+str(count)+"""] = 0;
+					tab['RMS']["""+str(count)+"""] = 0;
+					tab['Bias']["""+str(count)+"""] = 0;
+					tab['Scatter']["""+str(count)+"""] = 0;
+					tab['R']["""+str(count)+"""] = 0;
+					dcor['x'] = [];
+					dcor['y'] = [];
+					dt.change.emit();
+					scor.change.emit();
+					return;
+				}
 
-			var ym1 = 0;
-			var ym2 = 0;
+				// time window of the selection
+				var t0 = Infinity;
+				var t1 = -Infinity;
+				for (var i=0; i < inds.length; i++){
+					t0 = Math.min(t0,d1['x'][inds[i]]);
+					t1 = Math.max(t1,d1['x'][inds[i]]);
+				}
 
-			var T1 = 0;
-			var T2 = 0;
-			var T3 = 0;
+				// first and last positions of the window in the sorted times of the prefix sums
+				function bisect(t,right) {
+					var a = 0;
+					var b = c['t'].length;
+					while (a < b) {
+						var m = (a+b) >> 1;
+						if (c['t'][m] < t || (right && c['t'][m] == t)) {a = m+1;} else {b = m;}
+					}
+					return a;
+				}
+				var lo = bisect(t0,false);
+				var hi = bisect(t1,true)-1;
+
+				var n = 0;
+				var sum1 = 0;
+				var sum2 = 0;
+				var sum11 = 0;
+				var sum22 = 0;
+				var sum12 = 0;
+
+				if (hi-lo+1 == inds.length) {
+					// all the points of the time window are selected: differences of the prefix sums
+					function win(key) {return c[key][hi] - (lo>0 ? c[key][lo-1] : 0);}
+					n = win('n');
+					sum1 = win('s1');
+					sum2 = win('s2');
+					sum11 = win('s11');
+					sum22 = win('s22');
+					sum12 = win('s12');
+
+					dcor['x'] = new Float64Array(hi-lo+1);
+					dcor['y'] = new Float64Array(hi-lo+1);
+					for (var i=lo; i <= hi; i++){
+						dcor['x'][i-lo] = d2['y'][c['order'][i]];
+						dcor['y'][i-lo] = d1['y'][c['order'][i]];
+					}
+				} else {
+					dcor['x'] = new Float64Array(inds.length);
+					dcor['y'] = new Float64Array(inds.length);
+					for (var i=0; i < inds.length; i++){
+						var a = d1['y'][inds[i]] - offset;
+						var b = d2['y'][inds[i]] - offset;
+						dcor['x'][i] = d2['y'][inds[i]];
+						dcor['y'][i] = d1['y'][inds[i]];
+						if (isNaN(a) || isNaN(b)) {continue;}
+						n += 1;
+						sum1 += a;
+						sum2 += b;
+						sum11 += a*a;
+						sum22 += b*b;
+						sum12 += a*b;
+					}
+				}
 
-			dcor['x'] = [];
-			dcor['y'] = [];
+				// N is the number of selected points where both sites have data, like the statistics
+				tab['N']["""+str(count)+"""] = n;
+
+				if (n == 0) {
+					tab['RMS']["""+str(count)+"""] = 0;
+					tab['Bias']["""+str(count)+"""] = 0;
+					tab['Scatter']["""+str(count)+"""] = 0;
+					tab['R']["""+str(count)+"""] = 0;
+					dt.change.emit();
+					scor.change.emit();
+					return;
+				}
 
-			tab['N']["""+str(count)+"""] = inds.length;
+				var difm = (sum1-sum2)/n;
+				var difm2 = (sum11+sum22-2*sum12)/n;
+				var scat = Math.max(sum11+sum22-2*sum12-n*difm*difm,0);
 
+				tab['RMS']["""+str(count)+"""] = Math.sqrt(difm2).toFixed("""+prec+""");
+				tab['Bias']["""+str(count)+"""] = difm.toFixed("""+prec+""");
+				tab['Scatter']["""+str(count)+"""] = Math.sqrt(scat/(n-1)).toFixed("""+prec+""");
+				tab['R']["""+str(count)+"""] = ((n*sum12-sum1*sum2)/Math.sqrt((n*sum11-sum1*sum1)*(n*sum22-sum2*sum2))).toFixed("""+prec+""");
 
-			if (inds.length == 0) {
-				tab['RMS']["""+str(count)+"""] = 0;
-				tab['Bias']["""+str(count)+"""] = 0;
-				tab['Scatter']["""+str(count)+"""] = 0;
-				tab['R']["""+str(count)+"""] = 0;
 				dt.change.emit();
-				return;
-			}
+				scor.change.emit();
+				""")
+				count += 1
 
-			for (i=0; i < inds.length; i++){
-				difm += d1['y'][inds[i]] - d2['y'][inds[i]];
-				difm2 += Math.pow(d1['y'][inds[i]] - d2['y'][inds[i]],2);
-				ym1 += d1['y'][inds[i]];
-				ym2 += d2['y'][inds[i]];
+			min_x = np.datetime64(min([FREQ_DATA[site][site]['datetime'][0] for site in FREQ_DATA]),'us').astype(datetime)
+			max_x = np.datetime64(max([FREQ_DATA[site][site]['datetime'][-1] for site in FREQ_DATA]),'us').astype(datetime)
 
-				dcor['x'].push(d2['y'][inds[i]]);
-				dcor['y'].push(d1['y'][inds[i]]);
-			}
+			min_y = min([min(abs(FREQ_DATA[site][site][var])) for site in FREQ_DATA])
+			max_y = max([max(FREQ_DATA[site][site][var]) for site in FREQ_DATA])
 
-			difm /= inds.length;
-			difm2 /= inds.length;
-			ym1 /= inds.length;
-			ym2 /= inds.length;
+			ampli = max_y - min_y
 
-			for (i=0; i < inds.length; i++){
-				scat += Math.pow(d1['y'][inds[i]] - d2['y'][inds[i]] - difm,2);
-			}
+			# we will set the y axis range at +/- 10% of the data max amplitude
+			min_y = min_y - ampli*0.1/100
+			max_y = max_y + ampli*0.1/100
 
-			for (i=0; i < inds.length; i++){
-				T1 += (d1['y'][inds[i]] - ym1)*(d2['y'][inds[i]] - ym2);
-				T2 += Math.pow(d1['y'][inds[i]] - ym1,2);
-				T3 += Math.pow(d2['y'][inds[i]] - ym2,2);
-			}
+			fig = figure(output_backend = "webgl", title = 'TCCON '+var+' vs '+'datetime', y_range=[min_y,max_y], plot_width = 900, plot_height = 650, tools = TOOLS, x_axis_type='datetime', x_range = Range1d(min_x,max_x))
 
-			tab['RMS']["""+str(count)+"""] = Math.sqrt(difm2).toFixed("""+prec+""");
-			tab['Bias']["""+str(count)+"""] = difm.toFixed("""+prec+""");
-			tab['Scatter']["""+str(count)+"""] = Math.sqrt(scat/(inds.length -1)).toFixed("""+prec+""");
-			tab['R']["""+str(count)+"""] = (T1/Math.sqrt(T2*T3)).toFixed("""+prec+""");
+			fig.tools[-2].dimensions='width' # only allow the box select tool to select data along the X axis (will select all Y data in a given X range)
 
-			dt.change.emit();
-			scor.change.emit();
-			""")
-			count += 1
+			fig.tools[-2].callback = CustomJS(args=dict(txt=txt),code="""
+				var sel = cb_data["geometry"];
+			
+				var startsec = sel["x0"]/1000;
+				var start = new Date(0);
 
-		min_x = min([FREQ_DATA[site][site]['datetime'][0] for site in FREQ_DATA])
-		max_x = max([FREQ_DATA[site][site]['datetime'][-1] for site in FREQ_DATA])
+				start.setUTCSeconds(startsec)
 
-		min_y = min([min(abs(FREQ_DATA[site][site][var])) for site in FREQ_DATA])
-		max_y = max([max(FREQ_DATA[site][site][var]) for site in FREQ_DATA])
+				var startstring = ("0" + start.getDate()).slice(-2) + "-" + ("0"+(start.getMonth()+1)).slice(-2) + "-" +start.getFullYear() + " " + ("0" + start.getHours()).slice(-2) + ":" + ("0" + start.getMinutes()).slice(-2);
 
-		ampli = max_y - min_y
+				var finishsec = sel["x1"]/1000;
+				var finish = new Date(0);
 
-		# we will set the y axis range at +/- 10% of the data max amplitude
-		min_y = min_y - ampli*0.1/100
-		max_y = max_y + ampli*0.1/100
-
-		fig = figure(output_backend = "webgl", title = 'TCCON '+var+' vs '+'datetime', y_range=[min_y,max_y], plot_width = 900, plot_height = 650, tools = TOOLS, x_axis_type='datetime', x_range = Range1d(min_x,max_x))
-
-		fig.tools[-2].dimensions='width' # only allow the box select tool to select data along the X axis (will select all Y data in a given X range)
+				finish.setUTCSeconds(finishsec)
 
-		fig.tools[-2].callback = CustomJS(args=dict(txt=txt),code="""
-			var sel = cb_data["geometry"];
-			
-			var startsec = sel["x0"]/1000;
-			var start = new Date(0);
+				var finishstring = ("0" + finish.getDate()).slice(-2) + "-" + ("0"+(finish.getMonth()+1)).slice(-2) + "-" +finish.getFullYear() + " " + ("0" + finish.getHours()).slice(-2) + ":" + ("0" + finish.getMinutes()).slice(-2);
 
-			start.setUTCSeconds(startsec)
+				txt.text = 'Selection range from '+startstring + ' to ' + finishstring;
 
-			var startstring = ("0" + start.getDate()).slice(-2) + "-" + ("0"+(start.getMonth()+1)).slice(-2) + "-" +start.getFullYear() + " " + ("0" + start.getHours()).slice(-2) + ":" + ("0" + start.getMinutes()).slice(-2);
+				txt.change.emit(); 
+				""")
 
-			var finishsec = sel["x1"]/1000;
-			var finish = new Date(0);
+			plots=[]
+			for site in lat_ordered_sites:
+				plots.append( fig.scatter(x='x',y='y',color=DATA[site]['color'],alpha=0.5,source=freq_sources[site][site]) )
+				plots.append( fig.scatter(x='x',y='y',color='black',alpha=0.5,source=freq_sources[site][SELECT]) )
 
-			finish.setUTCSeconds(finishsec)
+			N_plots = range(len(plots))
 
-			var finishstring = ("0" + finish.getDate()).slice(-2) + "-" + ("0"+(finish.getMonth()+1)).slice(-2) + "-" +finish.getFullYear() + " " + ("0" + finish.getHours()).slice(-2) + ":" + ("0" + finish.getMinutes()).slice(-2);
+			N_plots2 = range(len(plots)/2)
 
-			txt.text = 'Selection range from '+startstring + ' to ' + finishstring;
+			even_plots = [i for i in N_plots if i%2 == 0]
 
-			txt.change.emit(); 
-			""")
+			legend=Legend(items=[(SELECT,[plots[1]])]+[(lat_ordered_sites[i],[plots[even_plots[i]]]) for i in range(len(lat_ordered_sites))],location=(0,0))
+			fig.add_layout(legend,'right')
+			fig.yaxis.axis_label = var
+			fig.xaxis.axis_label = 'Time'
 
-		plots=[]
-		for site in lat_ordered_sites:
-			plots.append( fig.scatter(x='x',y='y',color=DATA[site]['color'],alpha=0.5,source=freq_sources[site][site]) )
-			plots.append( fig.scatter(x='x',y='y',color='black',alpha=0.5,source=freq_sources[site][SELECT]) )
+			# correlation plot
+			corfig = figure(output_backend = "webgl", title = 'Correlations', plot_width = 400, plot_height = 400, x_range = [min_y,max_y], y_range = [min_y,max_y]) 
+			corfig.toolbar.logo = None
+			corfig.toolbar_location = None
+			corfig.xaxis.axis_label = ' '.join([SELECT,var])
+			corfig.yaxis.axis_label = ' '.join(['sites',var])
 
-		N_plots = range(len(plots))
+			corplots = []
+			linerange = list(np.arange(0,int(max_y),ceil(max_y)/10.0))+[max_y]
+			for site in lat_ordered_sites:
+				corplots.append( corfig.scatter(x='x',y='y',color=DATA[site]['color'],alpha=0.5,source=freq_cor_sources[site]) )
+		
+			corfig.line(x=linerange,y=linerange,color='black')
 
-		N_plots2 = range(len(plots)/2)
+			N_corplots = range(len(corplots))
 
-		even_plots = [i for i in N_plots if i%2 == 0]
+			checkbox = CheckboxGroup(labels=lat_ordered_sites,active=[],width=200)
 
-		legend=Legend(items=[(SELECT,[plots[1]])]+[(lat_ordered_sites[i],[plots[even_plots[i]]]) for i in range(len(lat_ordered_sites))],location=(0,0))
-		fig.add_layout(legend,'right')
-		fig.yaxis.axis_label = var
-		fig.xaxis.axis_label = 'Time'
-
-		# correlation plot
-		corfig = figure(output_backend = "webgl", title = 'Correlations', plot_width = 400, plot_height = 400, x_range = [min_y,max_y], y_range = [min_y,max_y]) 
-		corfig.toolbar.logo = None
-		corfig.toolbar_location = None
-		corfig.xaxis.axis_label = ' '.join([SELECT,var])
-		corfig.yaxis.axis_label = ' '.join(['sites',var])
-
-		corplots = []
-		linerange = list(np.arange(0,int(max_y),ceil(max_y)/10.0))+[max_y]
-		for site in lat_ordered_sites:
-			corplots.append( corfig.scatter(x='x',y='y',color=DATA[site]['color'],alpha=0.5,source=freq_cor_sources[site]) )
-		
-		corfig.line(x=linerange,y=linerange,color='black')
+			iterable = [('p'+str(i),plots[i]) for i in N_plots]+[('pcor'+str(i),corplots[i]) for i in N_corplots]+[('checkbox',checkbox)]
 
-		N_corplots = range(len(corplots))
+			checkbox_code = """var indexOf = [].indexOf || function(item) { for (var i = 0, l = this.length; i < l; i++) { if (i in this && this[i] === item) return i; } return -1; };"""
+			checkbox_code += ''.join(['p'+str(i)+'.visible = indexOf.call(checkbox.active, '+str(i/2)+') >= 0; p'+str(i+1)+'.visible= indexOf.call(checkbox.active, '+str(i/2)+') >= 0; pcor'+str(i/2)+'.visible = indexOf.call(checkbox.active, '+str(i/2)+') >= 0;' for i in range(0,len(N_plots),2)])
+			checkbox.callback = CustomJS(args={key: value for key,value in iterable}, code=checkbox_code)
 
-		checkbox = CheckboxGroup(labels=lat_ordered_sites,active=[],width=200)
+			clear_button = Button(label='Clear all',width=200)
+			clear_button_code = """checkbox.set("active",[]);"""+checkbox_code
+			clear_button.callback = CustomJS(args={key: value for key,value in iterable}, code=clear_button_code)
 
-		iterable = [('p'+str(i),plots[i]) for i in N_plots]+[('pcor'+str(i),corplots[i]) for i in N_corplots]+[('checkbox',checkbox)]
+			check_button = Button(label='Check all',width=200)
+			check_button_code = """checkbox.set("active","""+str(N_plots2)+""");"""+checkbox_code
+			check_button.callback = CustomJS(args={key: value for key,value in iterable}, code=check_button_code)
 
-		checkbox_code = """var indexOf = [].indexOf || function(item) { for (var i = 0, l = this.length; i < l; i++) { if (i in this && this[i] === item) return i; } return -1; };"""
-		checkbox_code += ''.join(['p'+str(i)+'.visible = indexOf.call(checkbox.active, '+str(i/2)+') >= 0; p'+str(i+1)+'.visible= indexOf.call(checkbox.active, '+str(i/2)+') >= 0; pcor'+str(i/2)+'.visible = indexOf.call(checkbox.active, '+str(i/2)+') >= 0;' for i in range(0,len(N_plots),2)])
-		checkbox.callback = CustomJS(args={key: value for key,value in iterable}, code=checkbox_code)
+			download_button = Button(label='Save Table to CSV', width = 200)
+			download_button.callback = CustomJS(args=dict(dt=data_table),code="""
+			var tab = dt.get('source').get('data');
+			var filetext = 'site,latitude,N,RMS,Bias,Scatter,R'+String.fromCharCode(10);
+			for (i=0; i < tab['site'].length; i++) {
+			    var currRow = [tab['site'][i].toString(),
+			                   tab['latitude'][i].toString(),
+			                   tab['N'][i].toString(),
+			                   tab['RMS'][i].toString(),
+			                   tab['Bias'][i].toString(),
+			                   tab['Scatter'][i].toString(),
+			                   tab['R'][i].toString()+String.fromCharCode(10)];
+
+			    var joined = currRow.join();
+			    filetext = filetext.concat(joined);
+			}
 
-		clear_button = Button(label='Clear all',width=200)
-		clear_button_code = """checkbox.set("active",[]);"""+checkbox_code
-		clear_button.callback = CustomJS(args={key: value for key,value in iterable}, code=clear_button_code)
+			var filename = 'data_result.csv';
+			var blob = new Blob([filetext], { type: 'text/csv;charset=utf-8;' });
 
-		check_button = Button(label='Check all',width=200)
-		check_button_code = """checkbox.set("active","""+str(N_plots2)+""");"""+checkbox_code
-		check_button.callback = CustomJS(args={key: value for key,value in iterable}, code=check_button_code)
+		    var link = document.createElement("a");
+		    link = document.createElement('a')
+		    link.href = URL.createObjectURL(blob);
+		    link.download = filename
+		    link.target = "_blank";
+		    link.style.visibility = 'hidden';
+		    link.dispatchEvent(new MouseEvent('click'))
 
-		download_button = Button(label='Save Table to CSV', width = 200)
-		download_button.callback = CustomJS(args=dict(dt=data_table),code="""
-		var tab = dt.get('source').get('data');
-		var filetext = 'site,latitude,N,RMS,Bias,Scatter,R'+String.fromCharCode(10);
-		for (i=0; i < tab['site'].length; i++) {
-		    var currRow = [tab['site'][i].toString(),
-		                   tab['latitude'][i].toString(),
-		                   tab['N'][i].toString(),
-		                   tab['RMS'][i].toString(),
-		                   tab['Bias'][i].toString(),
-		                   tab['Scatter'][i].toString(),
-		                   tab['R'][i].toString()+String.fromCharCode(10)];
-
-		    var joined = currRow.join();
-		    filetext = filetext.concat(joined);
-		}
-
-		var filename = 'data_result.csv';
-		var blob = new Blob([filetext], { type: 'text/csv;charset=utf-8;' });
-
-	    var link = document.createElement("a");
-	    link = document.createElement('a')
-	    link.href = URL.createObjectURL(blob);
-	    link.download = filename
-	    link.target = "_blank";
-	    link.style.visibility = 'hidden';
-	    link.dispatchEvent(new MouseEvent('click'))
-
-		""")
+			""")
 
-		group = widgetbox(checkbox,clear_button,check_button)
+			group = widgetbox(checkbox,clear_button,check_button)
 
-		grid = gridplot([[fig,group],[download_button,txt],[data_table,corfig]],toolbar_location='left')
+			grid = gridplot([[fig,group],[download_button,txt],[data_table,corfig]],toolbar_location='left')
 
-		tabs.append(Panel(child=grid,title=var))
+			tabs.append(Panel(child=grid,title=var))
 
-	final=Tabs(tabs=tabs)
+		final=Tabs(tabs=tabs)
 
-	print('\n -writting FREQ_TCCON_'+'_'.join(FREQ.split())+'_'+SELECT+'.html'+' ...')
-	outfile=open(os.path.join(save_path,'FREQ_TCCON_'+'_'.join(FREQ.split())+'_'+SELECT+'.html'),'w')
-	outfile.write(file_html(final,CDN,'FREQ_TCCON'))
-	outfile.close()
-	print('FREQ_TCCON.html DONE in', time.time()-milestone,'seconds\n')
+		print('\n -writting FREQ_TCCON_'+'_'.join(FREQ.split())+'_'+SELECT+'.html'+' ...')
+		outfile=open(os.path.join(save_path,'FREQ_TCCON_'+'_'.join(FREQ.split())+'_'+SELECT+'.html'),'w')
+		outfile.write(file_html(final,CDN,'FREQ_TCCON'))
+		outfile.close()
+		print('FREQ_TCCON.html DONE in', time.time()-milestone,'seconds\n')
 
-###########
-# THE END #
-###########
+	###########
+	# THE END #
+	###########
 
-print('TCCON_comp.py DONE in',time.time()-codestart,'seconds')
+	print('TCCON_comp.py DONE in',time.time()-codestart,'seconds')
@@ -66,7 +66,7 @@ def read_spt(path):
 
 	DATA['header'] = head
 
-	content_T = np.array([[elem for elem in line.split()] for line in content[3:]],dtype=np.float).T # transpose of the file content after the header, so content_T[i] is the ith column
+	content_T = np.ascontiguousarray(np.array([[elem for elem in line.split()] for line in content[3:]],dtype=np.float64).T) # transpose of the file content after the header, so content_T[i] is the ith column; contiguous so that bokeh can encode the columns in binary
 
 	DATA['columns'] = {}
 	for var in head:
@@ -268,7 +268,7 @@ for spec_ID,spectrum in enumerate(select_spectra):
 	#fig_resid.add_tools(HoverTool(mode='vline',line_policy='prev',names=['residuals'],tooltips={'index':'$index','(x;y)':'($~x{0.00} ; @resid{0.000})'}))
 
 	# set up a dummy legend for the residual figure so that it aligns with the spectrum figure
-	dummy = fig_resid.line(x=freq,y=[0 for i in range(len(residuals))],color='white',visible=False,alpha=0)
+	dummy = fig_resid.line(x='Freq',y='const',color='white',visible=False,alpha=0,source=source_list[spectrum])
 	fig_resid_legend=Legend(items=[('                 ',[dummy])],location=(0,0),border_line_alpha=0)
 	fig_resid.add_layout(fig_resid_legend,'right')
 	
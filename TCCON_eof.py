@@ -76,6 +76,14 @@ import calendar
 #netcdf reader
 import netCDF4
 
+#sidecar files with the full resolution data and the data of each tab
+import json
+import zlib
+import base64
+
+#read files in parallel
+from multiprocessing import Pool
+
 #round up
 from math import ceil
 
@@ -85,6 +93,7 @@ from bokeh.models import Panel, Tabs, CustomJS, ColumnDataSource, RadioGroup, Di
 from bokeh.layouts import gridplot, widgetbox
 from bokeh.resources import CDN
 from bokeh.embed import file_html
+from bokeh.events import Reset
 
 # dictionaries with sorted keys
 import collections
@@ -104,6 +113,20 @@ save_name = 'tccon_series.html'
 # tab_name will appear in the internet tab when you open the page
 tab_name = 'TCCON'
 
+# number of files to read at the same time, can be set up to the number of cores
+workers = 1
+
+# target number of points for each variable embedded in the html file, 0 embeds all the data
+# the points are picked from the variables of the time series and 'Custom' panels, the other variables are kept at the same times
+# with downsampling, the full resolution data of the time series panels is written to a sidecar .js file next to the html file
+# and the full resolution data of each variable of the 'Custom' and 'Key' panels to its own .js file in a folder next to the html file
+# they are loaded when zooming in, and the full data is shown when the zoomed range has less than 10*downsample points
+downsample = 0
+
+# set to True to only embed the data of the first tab in the html file
+# the data of each other tab is written to its own compressed .js file next to the html file, and is loaded when the tab is first opened
+lazy_panels = False
+
 # associate a keyword with a color. Variables including the keyword will be plotted with that color. (be careful with co, co2 and o2 ! )
 # red is the default color for variables that do not include any of the keywords in colors_dict
 # note: if you use 'all' for the flag, only flag 0 data will use the colors, flag != 0 data will be grey
@@ -268,7 +291,7 @@ bok_struct = OrderedDict([
 # Functions #
 #############
 
-def merged_tccon_data(path,diag_var=[],diag_key=[],skip_list=[],flag=''):
+def merged_tccon_data(path,diag_var=[],diag_key=[],skip_list=[],flag='',workers=1):
 	'''
 	reads TCCON data from several files in a given path
 	files must be of the same type (either .nc, .eof, .eof.csv)
@@ -279,6 +302,7 @@ def merged_tccon_data(path,diag_var=[],diag_key=[],skip_list=[],flag=''):
 		diag_var :	list of full variable names to be read from the files
 		diag_key :	list of keywords; all variables that include a keyword will be read
 		flag     :	if flag = 'all', data with any flag will be read, otherwise only data with the specified flag will be read
+		workers  :	number of files read at the same time in different processes
 	
 	Output:
 		dictionary of the merged data
@@ -295,31 +319,97 @@ def merged_tccon_data(path,diag_var=[],diag_key=[],skip_list=[],flag=''):
 		print('You need netCDF or .eof tccon file_list to run this program')
 		sys.exit()
 
-	# loop over file_list and merge all the data in a dictionary, this will skip any data that is not properly time sorted
+	# read all the files, each variable is collected in a list of per-file arrays and concatenated only once at the end
 	print('\nGetting data:')
-	all_files_data = {}
-	for tccon_file in file_list:
+	arg_list = [(os.path.join(path,tccon_file),mode,diag_var,diag_key,skip_list,flag) for tccon_file in file_list]
+	if workers>1:
+		# each file is read in its own process; the netCDF library is not thread safe so netcdf files are not read in threads
+		pool = Pool(workers)
+		file_data_list = pool.map(read_tccon_file,arg_list) # keeps the order of file_list
+		pool.close()
+		pool.join()
+	else:
+		file_data_list = [read_tccon_file(args) for args in arg_list]
+
+	return merge_file_data(file_data_list)
+
+def read_tccon_file(args):
+	'''
+	read_tccon wrapper used by merged_tccon_data, args is a (path,mode,variables,key_variables,skip_list,flag) tuple
+	'''
 
-		print('\t-',tccon_file)
+	path,mode,variables,key_variables,skip_list,flag = args
 
-		file_path = os.path.join(path,tccon_file)
+	print('\t-',os.path.basename(path))
 
-		file_data = read_tccon(file_path,mode=mode,variables=diag_var,key_variables=diag_key,skip_list=skip_list,flag=flag)
+	return read_tccon(path,mode=mode,variables=list(variables),key_variables=key_variables,skip_list=skip_list,flag=flag) # read_tccon can modify the variables list
 
-		if len(all_files_data.keys())==0:
-			for key,value in file_data.iteritems():
-				all_files_data[key] = np.array(value)
-		else:
-			for key in ['xtime']+[i for i in file_data if i!='xtime']:
-				for time_id,new_time in enumerate(file_data['xtime']):
-					if new_time>all_files_data['xtime'][len(file_data)+time_id-1]:
-						#all_files_data[key] = np.append(all_files_data[key],file_data[key][time_id])
-						all_files_data[key] = np.append(all_files_data[key],file_data[key][time_id:])
-						break
-					else:
-						print('Time overlap:',new_time,'<',all_files_data['xtime'][-1])
+def missing_values(column,size):
+	'''
+	returns an array of 'size' missing values that can be concatenated with 'column': NaN for numbers, NaT for times, and empty strings for strings
+	'''
 
-	return {key:value for key,value in all_files_data.iteritems()}
+	column = np.asarray(column)
+
+	if column.dtype.kind in 'fc':
+		return np.full(size,np.nan,dtype=column.dtype)
+	elif column.dtype.kind in 'mM':
+		return np.full(size,'NaT',dtype=column.dtype)
+	elif column.dtype.kind in 'SUO':
+		return np.full(size,'',dtype=column.dtype)
+	else: # integers and booleans cannot be NaN, the merged column will be float
+		return np.full(size,np.nan)
+
+def merge_file_data(file_data_list):
+	'''
+	merge a list of read_tccon outputs (in chronological order) in one dictionary
+	for each file, data that is not later than the last time of the previous files is skipped (time overlap)
+	variables that are not in all the files are filled with missing values (see missing_values) for the files that do not have them
+	'''
+
+	file_data_list = [file_data for file_data in file_data_list if len(file_data.get('xtime',[]))>0]
+
+	if len(file_data_list)==0:
+		return {}
+
+	# all the variables, in the order they first appear, with an example column to get their type
+	var_list = []
+	example = {}
+	for file_data in file_data_list:
+		for key in file_data:
+			if key not in example:
+				var_list.append(key)
+				example[key] = file_data[key]
+
+	missing = [key for key in var_list if False in [key in file_data for file_data in file_data_list]]
+	if len(missing)>0:
+		print('Variables not in all the files, they are filled with missing values:',', '.join(missing))
+
+	all_files_data = {key:[] for key in var_list}
+	last_time = None
+	for file_data in file_data_list:
+		file_time = file_data['xtime'] # datetime64 array from read_tccon
+
+		# index of the first time after the last time of the previous files
+		start = 0
+		if last_time is not None:
+			start = np.searchsorted(file_time,last_time,side='right')
+			if start>0:
+				print('Time overlap: skipping',start,'values up to',last_time)
+		if start==len(file_time):
+			continue
+
+		for key in var_list:
+			if key in file_data:
+				all_files_data[key].append( np.asarray(file_data[key])[start:] )
+			else:
+				all_files_data[key].append( missing_values(example[key],len(file_time)-start) )
+
+		last_time = file_time[-1]
+
+	all_files_data = {key:np.concatenate(value) for key,value in all_files_data.items()}
+
+	return all_files_data
 
 def read_tccon(path,mode='eof',variables=[],key_variables=[],skip_list=[],flag='all'):
 	'''
@@ -415,7 +505,9 @@ def read_tccon(path,mode='eof',variables=[],key_variables=[],skip_list=[],flag='
 
 		f.close()
 
-	DATA['xtime'] = [datetime(int(DATA['year'][i]),1,1)+timedelta(days=int(DATA['day'][i])-1,hours=float(DATA['hour'][i])) for i in range(len(DATA['hour']))]
+	# times as a datetime64 array, bokeh sends it to the browser in binary
+	year_start = (np.array(DATA['year'],dtype=int)-1970).astype('datetime64[Y]').astype('datetime64[us]')
+	DATA['xtime'] = year_start + np.round( (np.array(DATA['day'],dtype=int)-1)*86400E6 + np.array(DATA['hour'],dtype=np.float64)*3600E6 ).astype('timedelta64[us]')
 
 	del DATA['year']
 	del DATA['day']
@@ -423,6 +515,119 @@ def read_tccon(path,mode='eof',variables=[],key_variables=[],skip_list=[],flag='
 
 	return DATA
 
+def lttb(x,y,n_out):
+	'''
+	Largest-Triangle-Three-Buckets downsampling of a time series
+	returns the indices of the n_out points of (x,y) that best keep the shape of the series; NaNs are never selected
+
+	x,y: arrays of floats
+	n_out: number of points to keep
+	'''
+
+	valid = np.where(np.isfinite(y))[0]
+	n = len(valid)
+
+	if (n_out>=n) or (n_out<3):
+		return valid
+
+	xv = x[valid]
+	yv = y[valid]
+
+	# the first and last points are kept, the others are split in n_out-2 buckets
+	edges = np.linspace(1,n-1,n_out-1).astype(int)
+
+	keep = np.zeros(n_out,dtype=int)
+	keep[-1] = n-1
+	a = 0 # the point selected in the previous bucket
+	for i in range(n_out-2):
+		start,end = edges[i],edges[i+1]
+
+		# average point of the next bucket
+		if i<n_out-3:
+			next_start,next_end = edges[i+1],edges[i+2]
+		else:
+			next_start,next_end = n-1,n
+		avg_x = xv[next_start:next_end].mean()
+		avg_y = yv[next_start:next_end].mean()
+
+		# keep the point that makes the largest triangle with the previous point and the next average point
+		area = np.abs( (xv[a]-avg_x)*(yv[start:end]-yv[a]) - (xv[a]-xv[start:end])*(avg_y-yv[a]) )
+		a = start+np.argmax(area)
+		keep[i+1] = a
+
+	return valid[keep]
+
+def downsample_data(data,n_out,var_list):
+	'''
+	downsample the output of merged_tccon_data
+	each variable in var_list is downsampled with lttb() and the union of the selected indices is kept for all variables so they still share the same times
+	var_list should only have the plotted variables, the union over hundreds of variables would keep most of the data
+	if var_list is empty, n_out evenly spaced points are kept
+	'''
+
+	x = np.array(data['xtime'],dtype='datetime64[ms]').astype(np.int64).astype(np.float64)
+
+	keep = [np.array([0,len(x)-1])]
+	if len(var_list) == 0:
+		keep.append( np.linspace(0,len(x)-1,n_out).astype(int) )
+	for var in var_list:
+		keep.append( lttb(x,np.asarray(data[var],dtype=np.float64),n_out) )
+	keep = np.unique(np.concatenate(keep))
+
+	print('Downsampled from',len(x),'to',len(keep),'points')
+
+	return {var:np.asarray(data[var])[keep] for var in data}
+
+def write_full_data(path,data,var_list):
+	'''
+	write the full resolution data of the variables in var_list to a .js file that defines window.tccon_full
+	times are written in milliseconds since 1970-01-01 like bokeh does for datetime axes
+	'''
+
+	outfile = open(path,'w')
+	outfile.write('window.tccon_full = {\n')
+	outfile.write('"xtime":'+json.dumps(np.array(data['xtime'],dtype='datetime64[ms]').astype(np.int64).tolist())+',\n')
+	for var in var_list:
+		outfile.write(json.dumps(var)+':'+json.dumps(np.asarray(data[var],dtype=np.float64).tolist())+',\n') # NaN is valid javascript
+	outfile.write('};\n')
+	outfile.close()
+
+def write_chunk(path,chunk_id,data,var_list):
+	'''
+	write the variables in var_list to a .js file that stores them in window.tccon_chunks[chunk_id]
+	each variable is written as a zlib compressed little-endian float64 array encoded in base64
+	'''
+
+	outfile = open(path,'w')
+	outfile.write('window.tccon_chunks = window.tccon_chunks || {};\n')
+	outfile.write('window.tccon_chunks['+json.dumps(chunk_id)+'] = {\n')
+	for var in var_list:
+		column = zlib.compress(np.ascontiguousarray(data[var],dtype='<f8').tobytes())
+		outfile.write(json.dumps(var)+':"'+base64.b64encode(column).decode('ascii')+'",\n')
+	outfile.write('};\n')
+	outfile.close()
+
+def write_full_columns(folder,data,var_list):
+	'''
+	write the full resolution data of each variable in var_list to its own .js file in 'folder' with write_chunk(), the chunk of a variable is 'full:'+var
+	times are written in milliseconds since 1970-01-01 like bokeh does for datetime axes
+	returns a dictionary {var:file name}
+	'''
+
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+
+	files = OrderedDict()
+	for var_ID,var in enumerate(var_list):
+		files[var] = '{}.js'.format(var_ID)
+		if var == 'xtime':
+			column = np.array(data['xtime'],dtype='datetime64[ms]').astype(np.int64)
+		else:
+			column = data[var]
+		write_chunk(os.path.join(folder,files[var]),'full:'+var,{var:column},[var])
+
+	return files
+
 def descend_values(dic):
 	'''
 	gets all the values in a dictionnary and put them in a 1d list
@@ -710,6 +915,284 @@ if __name__ == "__main__":
 	txt.change.emit(); 
 	"""
 
+	# with downsampling, load the full resolution data when zooming in on the time series panels
+	zoom_code = """
+	function bisect(x,val) {
+		var lo = 0;
+		var hi = x.length;
+		while (lo<hi) {
+			var mid = (lo+hi)>>1;
+			if (x[mid]<val) {lo = mid+1;} else {hi = mid;}
+		}
+		return lo;
+	}
+
+	function update() {
+		var full = window.tccon_full;
+		if (typeof window.tccon_low === 'undefined') {window.tccon_low = {};}
+
+		var lo = bisect(full["xtime"],rng.start);
+		var hi = bisect(full["xtime"],rng.end);
+
+		for (var i=0;i<sources.length;i++) {
+			var source = sources[i];
+			if (!(i in window.tccon_low)) {
+				if (source.data["xtime"].length == 0) {continue;} // tab not loaded yet
+				window.tccon_low[i] = source.data;
+			}
+
+			if (hi-lo <= info.data["max_points"][0]) {
+				var data = {};
+				for (var key in window.tccon_low[i]) {data[key] = full[key].slice(lo,hi);}
+				source.data = data;
+			} else if (source.data !== window.tccon_low[i]) {
+				source.data = window.tccon_low[i];
+			}
+			source.change.emit();
+		}
+	}
+
+	if (typeof window.tccon_full === 'undefined') {
+		if (!window.tccon_full_loading) {
+			window.tccon_full_loading = true;
+			var script = document.createElement('script');
+			script.src = info.data["sidecar"][0];
+			script.onload = update;
+			document.head.appendChild(script);
+		}
+		return;
+	}
+
+	clearTimeout(window.tccon_zoom_timer);
+	window.tccon_zoom_timer = setTimeout(update,300);
+	"""
+
+	# put back the downsampled data with the "Reset" tool, otherwise the figures would be reset to the range of the zoomed data
+	zoom_reset_code = """
+	if (typeof window.tccon_low === 'undefined') {return;}
+	clearTimeout(window.tccon_zoom_timer);
+	for (var i in window.tccon_low) {
+		sources[i].data = window.tccon_low[i];
+		sources[i].change.emit();
+	}
+	"""
+
+	# functions used by the 'Custom' and 'Key' panels to load the full resolution data of their variables when zooming in
+	full_code = """
+	function bisect(x,val) {
+		var lo = 0;
+		var hi = x.length;
+		while (lo<hi) {
+			var mid = (lo+hi)>>1;
+			if (x[mid]<val) {lo = mid+1;} else {hi = mid;}
+		}
+		return lo;
+	}
+
+	// each column is a zlib compressed float64 array encoded in base64
+	function decode(text) {
+		var bytes = Uint8Array.from(atob(text),function(c){return c.charCodeAt(0);});
+		var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+		return new Response(stream).arrayBuffer().then(function(buffer){return new Float64Array(buffer);});
+	}
+
+	// returns a promise of the full resolution columns of the variables in 'keys', each file is only loaded once
+	function load_full(keys) {
+		var files = JSON.parse(info.data["files"][0]);
+		if (typeof window.tccon_full_var === 'undefined') {window.tccon_full_var = {};}
+		return Promise.all(keys.map(function(key){
+			if (!(key in window.tccon_full_var)) {
+				window.tccon_full_var[key] = new Promise(function(resolve,reject){
+					var script = document.createElement('script');
+					script.src = info.data["folder"][0]+'/'+files[key];
+					script.onload = function(){
+						var chunk = window.tccon_chunks['full:'+key];
+						delete window.tccon_chunks['full:'+key];
+						decode(chunk[key]).then(resolve);
+					};
+					script.onerror = reject;
+					document.head.appendChild(script);
+				});
+			}
+			return window.tccon_full_var[key];
+		})).then(function(columns){
+			var full = {};
+			for (var i=0;i<keys.length;i++) {full[keys[i]] = columns[i];}
+			return full;
+		});
+	}
+
+	// returns the [lo,hi) indices of the full resolution data to show, or null if the downsampled data should be shown
+	function full_range(x) {
+		var lo = bisect(x,rng.start);
+		var hi = bisect(x,rng.end);
+		if ((hi-lo > info.data["max_points"][0]) || ((lo == 0) && (hi == x.length))) {return null;}
+		return [lo,hi];
+	}
+
+	function color(vartoplot,colo) {
+		var colors = S_save.data["colors"][0];
+		for (var key in colors) {
+		if (vartoplot.includes(key)) {colo = colors[key]}
+		}
+		return colo;
+	}
+
+	// the callback runs at most once per zoom, 300ms after the last change of the range
+	function later(refine,id) {
+		if (typeof window.tccon_zoom_timers === 'undefined') {window.tccon_zoom_timers = {};}
+		clearTimeout(window.tccon_zoom_timers[id]);
+		window.tccon_zoom_timers[id] = setTimeout(refine,300);
+	}
+	"""
+
+	# fill the 'Custom' panel with the downsampled data, or the full resolution data of the zoomed range
+	custom_zoom_code = """
+	function show(x,y,yer,flag,colo) {
+		var main = {"x":x,"y":y,"colo":[]};
+		for (var i=0;i<flag.length;i++) {
+		if (flag[i]==0) {main["colo"].push(colo);} else {main["colo"].push("grey");}
+		}
+		S_main.data = main;
+		S_main.change.emit();
+		if (typeof S_err !== 'undefined') {
+			S_err.data = {"x":x,"y":yer};
+			S_err.change.emit();
+		}
+	}
+
+	// put back the downsampled data if the full resolution data is shown
+	function low() {
+		if (!window.tccon_refined[S_main.id]) {return;}
+		window.tccon_refined[S_main.id] = false;
+		var all = S_all.data;
+		var vartoplot = S_save.data["varlist"][radio.active];
+		show(all["xtime"],all[vartoplot],all[vartoplot+'_error'],all["flag"],color(vartoplot));
+	}
+
+	function refine() {
+		var vartoplot = S_save.data["varlist"][radio.active];
+		if (S_main.data["y"].length == 0) {return;} // no variable selected yet
+		var keys = ["xtime","flag",vartoplot];
+		if (typeof S_err !== 'undefined') {keys.push(vartoplot+'_error');}
+		load_full(keys).then(function(full){
+			if (S_save.data["varlist"][radio.active] !== vartoplot) {return;} // another variable was selected meanwhile
+			var inds = full_range(full["xtime"]);
+			if (inds === null) {low(); return;}
+			var state = JSON.stringify([vartoplot,inds]);
+			if (window.tccon_refined[S_main.id] === state) {return;}
+			window.tccon_refined[S_main.id] = state;
+			var lo = inds[0];
+			var hi = inds[1];
+			var yer = (typeof S_err !== 'undefined') ? full[vartoplot+'_error'].slice(lo,hi) : [];
+			show(full["xtime"].slice(lo,hi),full[vartoplot].slice(lo,hi),yer,full["flag"].slice(lo,hi),color(vartoplot));
+		});
+	}
+
+	if (typeof window.tccon_refined === 'undefined') {window.tccon_refined = {};}
+	"""
+
+	# fill the 'Key' panel with the downsampled data, or the full resolution data of the zoomed range
+	# the three sources are filled together so that they keep the same rows, and the selection is cleared as its indices are not valid anymore
+	key_zoom_code = """
+	function show(x,y1,y2,flag) {
+		var v1 = in0.value;
+		var v2 = in1.value;
+		var d1 = {"x":x,"y":[],"colo":[]};
+		var d2 = {"x":x,"y":[],"colo":[]};
+		var dfill = {"x":x,"y":[],"colo":[]};
+		var c1 = v1 ? color(v1,'red') : 'red';
+		var c2 = v2 ? color(v2,'red') : 'red';
+		for (var i=0;i<flag.length;i++) {
+			if (v1) {d1["colo"].push(flag[i]==0 ? c1 : "grey");}
+			if (v2) {d2["colo"].push(flag[i]==0 ? c2 : "grey");}
+			dfill["colo"].push(flag[i]==0 ? "red" : "grey");
+		}
+		if (v1) {d1["y"] = y1; dfill["y"] = y1;}
+		if (v2) {d2["y"] = y2; dfill["x"] = y2;}
+
+		var sources = [k1,k2,S_fill];
+		var data = [d1,d2,dfill];
+		for (var i=0;i<sources.length;i++) {
+			sources[i].selected['1d'].indices = [];
+			sources[i].data = data[i];
+			sources[i].change.emit();
+		}
+		dt.source.data['N'][0] = 0;
+		dt.source.data['R'][0] = 0;
+		dt.change.emit();
+	}
+
+	// put back the downsampled data if the full resolution data is shown
+	function low() {
+		if (!window.tccon_refined[k1.id]) {return;}
+		window.tccon_refined[k1.id] = false;
+		var all = S_all.data;
+		show(all["xtime"],all[in0.value],all[in1.value],all["flag"]);
+	}
+
+	function refine() {
+		var v1 = in0.value;
+		var v2 = in1.value;
+		if (!v1 && !v2) {return;} // no variable selected yet
+		var keys = ["xtime","flag"];
+		if (v1) {keys.push(v1);}
+		if (v2) {keys.push(v2);}
+		load_full(keys).then(function(full){
+			if ((in0.value !== v1) || (in1.value !== v2)) {return;} // another variable was selected meanwhile
+			var inds = full_range(full["xtime"]);
+			if (inds === null) {low(); return;}
+			var state = JSON.stringify([v1,v2,inds]);
+			if (window.tccon_refined[k1.id] === state) {return;}
+			window.tccon_refined[k1.id] = state;
+			var lo = inds[0];
+			var hi = inds[1];
+			show(full["xtime"].slice(lo,hi),v1 ? full[v1].slice(lo,hi) : [],v2 ? full[v2].slice(lo,hi) : [],full["flag"].slice(lo,hi));
+		});
+	}
+
+	if (typeof window.tccon_refined === 'undefined') {window.tccon_refined = {};}
+	"""
+
+	# with lazy_panels, load the data of a tab the first time it is opened
+	tab_code = """
+	var info = chunk_info[cb_obj.active];
+	if (typeof window.tccon_chunk_loading === 'undefined') {window.tccon_chunk_loading = {};}
+	if ((typeof info === 'undefined') || (cb_obj.active in window.tccon_chunk_loading)) {return;}
+	window.tccon_chunk_loading[cb_obj.active] = true;
+
+	var tab_ID = cb_obj.active;
+	var target = targets[info["source"]];
+
+	// each column is a zlib compressed float64 array encoded in base64
+	function decode(text) {
+		var bytes = Uint8Array.from(atob(text),function(c){return c.charCodeAt(0);});
+		var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+		return new Response(stream).arrayBuffer().then(function(buffer){return new Float64Array(buffer);});
+	}
+
+	function fill() {
+		var chunk = window.tccon_chunks[tab_ID];
+		var keys = Object.keys(chunk);
+		Promise.all(keys.map(function(key){return decode(chunk[key]);})).then(function(columns){
+			if (target === S_all) {
+				for (var i=0;i<keys.length;i++) {S_all.data[keys[i]] = columns[i];}
+			} else {
+				var data = {"xtime":S_all.data["xtime"]};
+				for (var i=0;i<keys.length;i++) {data[keys[i]] = columns[i];}
+				target.data = data;
+			}
+			target.change.emit();
+			delete window.tccon_chunks[tab_ID];
+		});
+	}
+
+	var script = document.createElement('script');
+	script.src = info["file"];
+	script.onload = fill;
+	document.head.appendChild(script);
+	"""
+
 	key_notes = """
 	<font size=4><b>Notes:</b></font><font size=2></br>
 	</br>
@@ -752,7 +1235,90 @@ if __name__ == "__main__":
 	TOOLS = "pan,wheel_zoom,box_zoom,undo,redo,reset,save"
 
 	# special bokh object to store data inside the HTML page
-	all_source = ColumnDataSource(data=merged_tccon_data(path=path,diag_var=diag_var,diag_key=diag_key,skip_list=['_Version','ak_','prio','checksum','graw','spectrum','ada'],flag=flag), id='all_source')
+	merged_data = merged_tccon_data(path=path,diag_var=diag_var,diag_key=diag_key,skip_list=['_Version','ak_','prio','checksum','graw','spectrum','ada'],flag=flag,workers=workers)
+
+	general_panels = [panel_key for panel_key in bok_struct if True not in [elem in panel_key for elem in ['Custom','Key','Diag']]]
+	first_panel = list(bok_struct.keys())[0]
+
+	# variables needed by each panel; the time series panels have their own sources, 'Custom' and 'Key' panels are filled from all_source by the callbacks
+	panel_var = OrderedDict()
+	for panel_key in bok_struct:
+		if 'Key' in panel_key: # any variable can be selected in the 'Key' panels
+			panel_var[panel_key] = sorted([var for var in merged_data if var!='xtime'])
+			continue
+		panel_var[panel_key] = []
+		for fig_key in bok_struct[panel_key]:
+			panel_var[panel_key] += [var for var in bok_struct[panel_key][fig_key]['lines'] if var in merged_data]
+			if bok_struct[panel_key][fig_key]['errlines'] is True:
+				panel_var[panel_key] += [var+'_error' for var in bok_struct[panel_key][fig_key]['lines'] if var+'_error' in merged_data]
+		if 'Custom' in panel_key:
+			panel_var[panel_key] += ['flag']
+		panel_var[panel_key] = sorted(set(panel_var[panel_key]))
+
+	series_var = sorted(set([var for panel_key in general_panels for var in panel_var[panel_key]]))
+	custom_var = sorted(set([var for panel_key in bok_struct if 'Custom' in panel_key for var in panel_var[panel_key] if var!='flag']))
+
+	if downsample:
+		print('\nDownsampling to',downsample,'points per variable ...')
+		source_data = downsample_data(merged_data,downsample,sorted(set(series_var+custom_var)))
+		full_name = save_name.replace('.html','_full.js')
+		if series_var:
+			print('\nWritting',full_name,'...')
+			write_full_data(os.path.join(save_path,full_name),merged_data,series_var)
+		# the 'Custom' and 'Key' panels load the full resolution data of the selected variable when zooming in
+		full_folder = save_name.replace('.html','_full')
+		refine_var = sorted(set([var for panel_key in bok_struct if True in [elem in panel_key for elem in ['Custom','Key']] for var in panel_var[panel_key]]))
+		full_files = {}
+		if refine_var:
+			print('\nWritting',full_folder,'...')
+			full_files = write_full_columns(os.path.join(save_path,full_folder),merged_data,['xtime','flag']+[var for var in refine_var if var!='flag'])
+		full_info = ColumnDataSource(data={'max_points':[10*downsample],'sidecar':[full_name],'folder':[full_folder],'files':[json.dumps(full_files)]}) # passed to the zoom callbacks
+	else:
+		source_data = merged_data
+	del merged_data
+
+	column_names = sorted(source_data.keys())
+
+	if lazy_panels:
+		# only the times, the flags, and the data of the first tab are embedded in the html file
+		embed_var = ['xtime','flag']
+		if first_panel not in general_panels:
+			embed_var += panel_var[first_panel]
+		all_source = ColumnDataSource(data={var:source_data[var] for var in source_data if var in embed_var}, id='all_source')
+	else:
+		all_source = ColumnDataSource(data=source_data, id='all_source')
+
+	# sources of the time series panels
+	if downsample and not lazy_panels:
+		series_source = ColumnDataSource(data={var:source_data[var] for var in ['xtime']+series_var}) # the time series panels share one source that is updated when zooming
+	else:
+		series_source = all_source
+	panel_source = OrderedDict()
+	for panel_key in general_panels:
+		if not lazy_panels:
+			panel_source[panel_key] = series_source
+		elif panel_key == first_panel:
+			panel_source[panel_key] = ColumnDataSource(data={var:source_data[var] for var in ['xtime']+panel_var[panel_key]})
+		else:
+			panel_source[panel_key] = ColumnDataSource(data={var:np.array([]) for var in ['xtime']+panel_var[panel_key]}) # filled when the tab is opened
+
+	# write the data of the other tabs in separate files
+	chunk_info = {}
+	if lazy_panels:
+		for panel_ID,panel_key in enumerate(bok_struct):
+			if panel_key == first_panel:
+				continue
+			chunk_var = [var for var in panel_var[panel_key] if var not in all_source.data]
+			if chunk_var == []:
+				continue
+			chunk_name = save_name.replace('.html','_tab{}.js'.format(panel_ID))
+			print('\nWritting',chunk_name,'...')
+			write_chunk(os.path.join(save_path,chunk_name),panel_ID,source_data,chunk_var)
+			if panel_key in general_panels:
+				chunk_info[panel_ID] = {'file':chunk_name,'source':'s{}'.format(general_panels.index(panel_key))}
+			else:
+				chunk_info[panel_ID] = {'file':chunk_name,'source':'S_all'}
+	del source_data
 
 	main_source_list = [] # this source will be empty and filled from all_source via callbacks
 	err_source_list = [] # this source will be empty and filled from all_source via callbacks
@@ -765,6 +1331,7 @@ if __name__ == "__main__":
 	# making the plot based on the bok_struct dictionary
 
 	tabs = [] # the different panels in the final bokeh plot
+	series_figs = [] # the figures of the time series panels
 	for panel_key in bok_struct:
 		fig_list = [] # the different figures in the panel
 		if True not in [elem in panel_key for elem in ['Custom','Key','Diag']]: # general case
@@ -788,24 +1355,25 @@ if __name__ == "__main__":
 					if bok_struct[panel_key][fig_key]['errlines'] is True:
 						if len(colo)==1:
 							colo = colo[0]
-							fig_list[-2].scatter(x='xtime',y=plot_var,color=colo,source=all_source)
+							fig_list[-2].scatter(x='xtime',y=plot_var,color=colo,source=panel_source[panel_key])
 						else:
-							fig_list[-2].scatter(x='xtime',y=plot_var,source=all_source)
+							fig_list[-2].scatter(x='xtime',y=plot_var,source=panel_source[panel_key])
 					
-						fig_list[-1].scatter(x='xtime',y=plot_var+'_error',color='black',source=all_source)
+						fig_list[-1].scatter(x='xtime',y=plot_var+'_error',color='black',source=panel_source[panel_key])
 						fig_list[-1].yaxis.axis_label = 'Error'
 
 						fig_list[-2].yaxis.axis_label = plot_var
 					else:
 						if len(colo)==1:
 							colo = colo[0]
-							fig_list[-1].scatter(x='xtime',y=plot_var,color=colo,source=all_source)
+							fig_list[-1].scatter(x='xtime',y=plot_var,color=colo,source=panel_source[panel_key])
 						else:
-							fig_list[-1].scatter(x='xtime',y=plot_var,source=all_source)
+							fig_list[-1].scatter(x='xtime',y=plot_var,source=panel_source[panel_key])
 
 						fig_list[-1].yaxis.axis_label = plot_var
 
 				grid = gridplot( [[fig] for fig in fig_list],toolbar_location='left',tools=TOOLS )
+			series_figs += fig_list
 
 		if 'Custom' in panel_key: # first special case, custom plots
 
@@ -861,9 +1429,21 @@ if __name__ == "__main__":
 												),  
 										code=code)
 
+				if downsample: # show the full resolution data of the new variable if the figure is zoomed in
+					callback.args = dict(callback.args,rng=fig_list[0].x_range,info=full_info)
+					callback.code = full_code+custom_zoom_code+'var radio = cb_obj;\nlow();\nlater(refine,S_main.id);\n'+callback.code
+
 				radiogroup = RadioGroup(labels=var_list,active=0,callback=callback)
 				radiobox = widgetbox(radiogroup,width=100)
 
+				if downsample: # load the full resolution data when zooming in
+					zoom_args = dict(callback.args,radio=radiogroup)
+					zoom_callback = CustomJS(args=zoom_args,code=full_code+custom_zoom_code+'later(refine,S_main.id);\n')
+					fig_list[0].x_range.js_on_change('start',zoom_callback)
+					fig_list[0].x_range.js_on_change('end',zoom_callback)
+					for fig in fig_list:
+						fig.js_on_event(Reset,CustomJS(args=zoom_args,code=full_code+custom_zoom_code+'low();\n'))
+
 				if bok_struct[panel_key][fig_key]['errlines'] is True:
 					grid = gridplot([[fig_list[1]],[fig_list[0],radiobox]],toolbar_location='left',tools=TOOLS)
 				else:
@@ -873,7 +1453,7 @@ if __name__ == "__main__":
 
 			fig_key = [i for i in bok_struct[panel_key]][0] # there is only one key in "Key" panels
 			key_list = bok_struct[panel_key][fig_key]['lines']
-			var_list = list(flatten([[var for var in sorted(all_source.data.keys()) if key in var] for key in key_list]))
+			var_list = list(flatten([[var for var in column_names if key in var] for key in key_list]))
 			key_tools = "box_zoom,wheel_zoom,box_select,pan,undo,redo,reset,save"
 
 			# sources
@@ -901,8 +1481,8 @@ if __name__ == "__main__":
 			menu = [(plot_var,plot_var) for plot_var in var_list]
 			#input_0 = AutocompleteInput(title="Figure 1:", value=None,completions=sorted(all_source.data.keys()),width=200)
 			#input_1 = AutocompleteInput(title="Figure 2:", value=None,completions=sorted(all_source.data.keys()),width=200)
-			input_0 = Select(title="Figure 1:", value=None,options=sorted(all_source.data.keys()),width=200)
-			input_1 = Select(title="Figure 2:", value=None,options=sorted(all_source.data.keys()),width=200)			
+			input_0 = Select(title="Figure 1:", value=None,options=column_names,width=200)
+			input_1 = Select(title="Figure 2:", value=None,options=column_names,width=200)			
 			data_table = DataTable(source=table_source, columns=[ TableColumn(field='N',title='N'),TableColumn(field='R',title='R'),], width=200, height=55)
 			select_text = Div(text='',width = 450) # text div that will be updated with the selected range of date within the BoxSelect tool
 			notes = Div(text=key_notes,width=600)
@@ -942,6 +1522,17 @@ if __name__ == "__main__":
 										),  
 								code=input_code+key_source_code.replace('cb_obj','S_main'))
 
+			if downsample: # show the full resolution data of the new variable if the figures are zoomed in, and load it when zooming in
+				zoom_args = dict(S_all=all_source,S_save=save_source_list[-1],S_fill=main_source_list[-3],k1=main_source_list[-1],k2=main_source_list[-2],in0=input_0,in1=input_1,dt=data_table,rng=fig_list[0].x_range,info=full_info)
+				for input_select in [input_0,input_1]:
+					input_select.callback.args = dict(input_select.callback.args,**zoom_args)
+					input_select.callback.code = full_code+key_zoom_code+'low();\nlater(refine,k1.id);\n'+input_select.callback.code
+				zoom_callback = CustomJS(args=zoom_args,code=full_code+key_zoom_code+'later(refine,k1.id);\n')
+				fig_list[0].x_range.js_on_change('start',zoom_callback)
+				fig_list[0].x_range.js_on_change('end',zoom_callback)
+				for fig in fig_list[:2]:
+					fig.js_on_event(Reset,CustomJS(args=zoom_args,code=full_code+key_zoom_code+'low();\n'))
+
 			# layout the final grid
 			notebox = widgetbox(select_text,data_table,notes,width=650)
 			dropbox_0 = widgetbox(dum,input_0,width=210) # I use the dummy div widget to have the input button ~aligned with the center of the figure 
@@ -951,10 +1542,30 @@ if __name__ == "__main__":
 
 		tabs.append( Panel(child=grid,title=panel_key) )
 
+	if downsample and series_var:
+		zoom_sources = []
+		for source in panel_source.values():
+			if source not in zoom_sources:
+				zoom_sources.append(source)
+		zoom_args = {'s{}'.format(i):source for i,source in enumerate(zoom_sources)}
+		zoom_args['rng'] = save_fig.x_range
+		zoom_args['info'] = full_info
+		sources_code = 'var sources = ['+','.join(['s{}'.format(i) for i in range(len(zoom_sources))])+'];\n'
+		zoom_callback = CustomJS(args=zoom_args,code=sources_code+zoom_code)
+		save_fig.x_range.js_on_change('start',zoom_callback)
+		save_fig.x_range.js_on_change('end',zoom_callback)
+		for fig in series_figs:
+			fig.js_on_event(Reset,CustomJS(args=zoom_args,code=sources_code+zoom_reset_code))
+
 	if len(tabs) == 1:
 		final = tabs[0].child
 	else:
 		final=Tabs(tabs=tabs)
+		if chunk_info:
+			tab_args = {'s{}'.format(general_panels.index(panel_key)):panel_source[panel_key] for panel_key in general_panels}
+			tab_args['S_all'] = all_source
+			target_code = 'var chunk_info = '+json.dumps(chunk_info)+';\nvar targets = {'+','.join(['{0}:{0}'.format(key) for key in sorted(tab_args)])+'};\n'
+			final.js_on_change('active',CustomJS(args=tab_args,code=target_code+tab_code))
 
 	print('\nWritting',save_name,'...')
 	outfile=open(os.path.join(save_path,save_name),'w')
@@ -24,7 +24,9 @@ import os
 
 import sys
 
-import subprocess
+import struct
+
+import mmap
 
 import numpy as np
 
@@ -34,8 +36,12 @@ import netCDF4
 
 import collections
 
+import calendar
+
 from datetime import datetime,timedelta
 
+from collections import OrderedDict
+
 #############
 # Functions #
 #############
@@ -119,36 +125,206 @@ def flatten(obj,keep=[]):
 			else:
 				yield item
 
+# OPUS parameter blocks, the key is given by bits 4-9 of the block type in the directory
+OPUS_PARAM_BLOCKS = {
+						1:'Data Parameters',
+						2:'Instrument Status Parameters',
+						3:'Acquisition Parameters',
+						4:'FT Parameters',
+						5:'Plot and Display Parameters',
+						6:'Optics Parameters',
+						7:'GC Parameters',
+						8:'Library Search Parameters',
+						9:'Communication Parameters',
+						10:'Sample Origin Parameters',
+					}
+
+# OPUS data blocks, the key is given by bits 10-16 of the block type in the directory; used to name the 'Data Parameters' blocks
+OPUS_DATA_BLOCKS = {1:'Sc',2:'Ig',3:'Ph',4:'AB',5:'TR'}
+
+# OPUS sample/reference type, the key is given by bits 2-3 of the block type in the directory
+OPUS_DATA_TYPES = {1:'Sm',2:'Rf'}
+
+OPUS_MAGIC = 0xFEFE0A0A
+
+def opus_block_name(block_type):
+	'''
+	name of an OPUS parameter block from its block type in the directory, returns None for blocks that are not parameter blocks
+	'''
+
+	param = (block_type>>4) & 0x3F
+	if param not in OPUS_PARAM_BLOCKS:
+		return None
+
+	name = OPUS_PARAM_BLOCKS[param]
+
+	if param == 1: # the data status parameters are specific to a data block e.g. 'Data Parameters IgSm'
+		data = (block_type>>10) & 0x7F
+		if data in OPUS_DATA_BLOCKS:
+			name += ' '+OPUS_DATA_BLOCKS[data]
+			if data in [1,2,3]:
+				name += OPUS_DATA_TYPES.get((block_type>>2) & 0x3,'')
+
+	return name
+
+def read_opus_params(mm,pointer,length):
+	'''
+	read the parameters of one OPUS parameter block
+
+	mm: memory map (or string) of the OPUS file
+	pointer: byte offset of the block
+	length: length of the block in bytes
+
+	each parameter is stored as: 3 letters name + null byte, int16 type, int16 size (in 16 bit words), value
+	'''
+
+	params = OrderedDict()
+
+	pos = pointer
+	end = min(pointer+length,len(mm))
+	while pos+8 <= end:
+		name = mm[pos:pos+4].split(b'\0')[0]
+		if not isinstance(name,str):
+			name = name.decode('latin-1')
+		param_type,size = struct.unpack('<hh',mm[pos+4:pos+8])
+		pos += 8
+		if name == 'END' or name == '':
+			break
+		raw = mm[pos:pos+2*size]
+		pos += 2*size
+
+		if param_type == 0:
+			val = str(struct.unpack('<i',raw[:4])[0])
+		elif param_type == 1:
+			val = '%.15g' % struct.unpack('<d',raw[:8])[0] # OpusHdr is a perl script, perl prints numbers with 15 significant digits
+		else: # 2=string; 3=enum; 4=senum
+			val = raw.split(b'\0')[0]
+			if not isinstance(val,str):
+				val = val.decode('latin-1')
+			val = val.strip()
+
+		params[name] = val
+
+	return params
+
 def read_opus_header(igram_file_path):
 	'''
-	use the perl progran OpusHdr to read the acquisition parameters and return them in a dictionary
+	read the acquisition parameters of an OPUS file and return them in a dictionary
 
 	igram_file_path: full path to Opus file
+
+	The output is a nested dictionary {block_name:{parameter:value}}, like the output of the OpusHdr program from GGGPATH/i2s/scripts (all values are strings)
+	Only the file header, the directory, and the parameter blocks are read through a memory map, the interferograms are never read.
 	'''
 
-	GGGPATH = os.environ['GGGPATH']
+	data = {}
+
+	infile = open(igram_file_path,'rb')
+	try:
+		try:
+			mm = mmap.mmap(infile.fileno(),0,access=mmap.ACCESS_READ)
+		except ValueError: # empty file
+			print('in function read_opus_header(): empty file',igram_file_path)
+			return data
+	finally:
+		infile.close() # the memory map stays valid after the file is closed
+
+	try:
+		if len(mm)<24 or struct.unpack('<I',mm[:4])[0] != OPUS_MAGIC:
+			print('in function read_opus_header():',igram_file_path,'is not an OPUS file')
+			return data
+
+		# file header: magic number, program version, pointer to the directory, max size of the directory, current size of the directory
+		version, dir_pointer, dir_max, dir_size = struct.unpack('<dIII',mm[4:24])
+
+		# directory: block type, block length (in 4 byte words), block pointer
+		for i in range(dir_size):
+			entry = dir_pointer+12*i
+			if entry+12 > len(mm):
+				break
+			block_type, block_length, block_pointer = struct.unpack('<III',mm[entry:entry+12])
+
+			key = opus_block_name(block_type)
+			if key is None or block_pointer==dir_pointer:
+				continue
+
+			data[key] = read_opus_params(mm,block_pointer,4*block_length) # OpusHdr prints blocks of the same type with the same name, so like with its output the last one is kept
+	finally:
+		mm.close()
 
-	cwd = os.path.join(GGGPATH,'i2s','scripts') # path
+	return data
 
-	proc = subprocess.Popen(['./OpusHdr',igram_file_path], stdout=subprocess.PIPE,shell=False,cwd=os.path.join(GGGPATH,'i2s','scripts'))
-	tmp = proc.stdout.read() # shell output of OpusHdr
-	prompt = tmp.split('\n')
+def read_opus_headers(igram_file_list):
+	'''
+	read the acquisition parameters of several OPUS files
 
-	data = {}
+	igram_file_list: list of full paths to Opus files, or the path to a folder with only Opus files in it
 
-	for line in prompt:
-		if (':' not in line) and (line!=''):
-			key = line.strip()
-			data[key] = {}
-		elif line!='':
-			try:
-				subkey,val = [x.strip() for x in line.split(': ')]
-			except ValueError:
-				pass
+	returns an ordered dictionary {igram_file_path:read_opus_header(igram_file_path)} sorted by file path
+	'''
+
+	if type(igram_file_list)==str and os.path.isdir(igram_file_list):
+		igram_file_list = [os.path.join(igram_file_list,i) for i in os.listdir(igram_file_list)]
+
+	return OrderedDict([(path,read_opus_header(path)) for path in sorted(igram_file_list)])
+
+def write_opus_header(path,header,igram_size=0):
+	'''
+	write a synthetic OPUS file with the given parameters; used to build a corpus of OPUS headers to check read_opus_header against
+
+	path: full path to the output file
+	header: nested dictionary {block_name:{parameter:value}} with block names from OPUS_PARAM_BLOCKS (with a data code for 'Data Parameters')
+			python int values are written as INT32, float values as REAL64, and strings as STRING
+	igram_size: number of float32 points of a dummy interferogram block written after the parameter blocks
+	'''
+
+	param_codes = {val:key for key,val in OPUS_PARAM_BLOCKS.items()}
+	data_codes = {val:key for key,val in OPUS_DATA_BLOCKS.items()}
+	type_codes = {val:key for key,val in OPUS_DATA_TYPES.items()}
+
+	blocks = []
+	for block_name in header:
+		base_name = block_name.split(' (')[0] # e.g. 'Data Parameters IgSm (2)' for the second channel
+		if base_name.startswith('Data Parameters'):
+			block_type = param_codes['Data Parameters']<<4
+			suffix = base_name.split()[-1]
+			if suffix[:2] in data_codes:
+				block_type += (data_codes[suffix[:2]]<<10) + (type_codes.get(suffix[2:],0)<<2)
+		else:
+			block_type = param_codes[base_name]<<4
+
+		content = b''
+		for name,val in header[block_name].items():
+			if type(val) == int:
+				param_type, raw = 0, struct.pack('<i',val)
+			elif type(val) == float:
+				param_type, raw = 1, struct.pack('<d',val)
 			else:
-				data[key][subkey] = val
+				param_type, raw = 2, val.encode('latin-1')+b'\0'
+				raw += b'\0'*(-len(raw)%4)
+			content += struct.pack('<4shh',name.encode('latin-1'),param_type,len(raw)//2)+raw
+		content += struct.pack('<4shh',b'END',0,0)
+		content += b'\0'*(-len(content)%4)
 
-	return data
+		blocks.append((block_type,content))
+
+	if igram_size:
+		blocks.append(((data_codes['Ig']<<10)+(type_codes['Sm']<<2)+1,struct.pack('<{}f'.format(igram_size),*[0.0]*igram_size)))
+
+	dir_pointer = 24
+	dir_size = len(blocks)+1 # the directory also lists itself
+	pointer = dir_pointer+12*dir_size
+
+	directory = struct.pack('<III',13<<20,dir_size*3,dir_pointer)
+	for block_type,content in blocks:
+		directory += struct.pack('<III',block_type,len(content)//4,pointer)
+		pointer += len(content)
+
+	with open(path,'wb') as outfile:
+		outfile.write(struct.pack('<IdIII',OPUS_MAGIC,920622.0,dir_pointer,dir_size,dir_size))
+		outfile.write(directory)
+		for block_type,content in blocks:
+			outfile.write(content)
 
 def read_col(path):
 	'''
@@ -180,25 +356,134 @@ def read_col(path):
 
 	return DATA
 
-def read_mav(path):
+def index_mav(path):
 	'''
-	.mav files contain a priori information
+	.mav files have one block of a priori information for each spectrum (or .mod file), each block starts with a 'Next Spectrum:' line
+
+	build a byte offset index of all the blocks in one pass over the file, returns a dictionary with:
+		'spectrum'	: list of the names given in the 'Next Spectrum:' lines
+		'start'		: byte offset of the start of each block
+		'end'		: byte offset of the end of each block
+		'first_line': number of lines before the first 'Next Spectrum:' line, the layout of each block is relative to that line
 	'''
 
-	DATA = {}
+	MAV_INDEX = {'spectrum':[],'start':[],'end':[],'first_line':0}
 
-	infile = open(path,'r')
-	content = infile.readlines()
+	infile = open(path,'rb')
+	mm = mmap.mmap(infile.fileno(),0,access=mmap.ACCESS_READ)
 	infile.close()
 
-	content_T = np.array([[float(elem) for elem in line.split()] for line in content[9:]]).T
+	pos = mm.find(b'Next Spectrum')
+	if pos == -1: # a single block without a 'Next Spectrum:' line
+		MAV_INDEX['spectrum'] = ['']
+		MAV_INDEX['start'] = [0]
+	else:
+		MAV_INDEX['first_line'] = mm[:pos].count(b'\n')
+
+	while pos != -1:
+		eol = mm.find(b'\n',pos)
+		if eol == -1:
+			eol = len(mm)
+		name = mm[pos:eol].split(b':',1)[-1].strip()
+		if not isinstance(name,str):
+			name = name.decode('latin-1')
+		MAV_INDEX['spectrum'].append(name)
+		MAV_INDEX['start'].append(pos)
+		pos = mm.find(b'Next Spectrum',eol)
+
+	MAV_INDEX['end'] = MAV_INDEX['start'][1:]+[len(mm)]
+
+	mm.close()
+
+	MAV_INDEX['start'] = np.array(MAV_INDEX['start'])
+	MAV_INDEX['end'] = np.array(MAV_INDEX['end'])
+
+	return MAV_INDEX
+
+def parse_mav_block(text,first_line=0):
+	'''
+	parse the content of one .mav block (from its 'Next Spectrum:' line to the next one) into a dictionary
+	'''
+
+	if not isinstance(text,str):
+		text = text.decode('latin-1')
 
-	header=content[6].split()
+	content = text.splitlines()
+
+	DATA = OrderedDict()
+
+	header = content[6-first_line].split()
+
+	content_T = np.fromstring(' '.join(content[9-first_line:]),sep=' ').reshape(-1,len(header)).T
 
 	for var in header:
 		DATA[var] = content_T[header.index(var)]
 
-	DATA['tropalt'] = float(content[3].split(':')[1])
+	DATA['tropalt'] = float(content[3-first_line].split(':')[1])
+
+	return DATA
+
+def read_mav(path,block=0,mav_index=None):
+	'''
+	.mav files contain a priori information
+
+	block: index of the block to read, or the name of its spectrum (as in the 'Next Spectrum:' lines)
+	mav_index: output of index_mav(path), it will be computed if not given; give it when reading several blocks from the same file
+
+	only the bytes of the requested block are read, through a memory map
+	'''
+
+	if mav_index is None:
+		mav_index = index_mav(path)
+
+	if not isinstance(block,(int,np.integer)):
+		block = mav_index['spectrum'].index(block)
+
+	infile = open(path,'rb')
+	mm = mmap.mmap(infile.fileno(),0,access=mmap.ACCESS_READ)
+	infile.close()
+
+	DATA = parse_mav_block(mm[mav_index['start'][block]:mav_index['end'][block]],first_line=mav_index['first_line'])
+
+	mm.close()
+
+	return DATA
+
+def read_all_mav(path,mav_index=None):
+	'''
+	read all the blocks of a .mav file and stack them in a 3-D array
+
+	returns a dictionary with:
+		'spectrum'	: list of the names given in the 'Next Spectrum:' lines
+		'header'	: list of the variable names
+		'tropalt'	: array of the tropopause altitude of each block
+		'data'		: array of shape (number of blocks, number of variables, number of levels), DATA['data'][i][header.index(var)] is var in the ith block
+	blocks with fewer levels than the others are padded with NaNs
+	'''
+
+	if mav_index is None:
+		mav_index = index_mav(path)
+
+	infile = open(path,'rb')
+	mm = mmap.mmap(infile.fileno(),0,access=mmap.ACCESS_READ)
+	infile.close()
+
+	blocks = [parse_mav_block(mm[start:end],first_line=mav_index['first_line']) for start,end in zip(mav_index['start'],mav_index['end'])]
+
+	mm.close()
+
+	header = [var for var in blocks[0] if var!='tropalt']
+	nlev = max([len(block[header[0]]) for block in blocks])
+
+	DATA = {}
+	DATA['spectrum'] = mav_index['spectrum']
+	DATA['header'] = header
+	DATA['tropalt'] = np.array([block['tropalt'] for block in blocks])
+	DATA['data'] = np.full((len(blocks),len(header),nlev),np.nan)
+
+	for i,block in enumerate(blocks):
+		for j,var in enumerate(header):
+			DATA['data'][i,j,:len(block[var])] = block[var]
 
 	return DATA
 
@@ -254,7 +539,7 @@ def read_spt(path):
 
 	DATA['header'] = head
 
-	content_T = np.array([[elem for elem in line.split()] for line in content[3:]],dtype=np.float).T
+	content_T = np.ascontiguousarray(np.array([[elem for elem in line.split()] for line in content[3:]],dtype=np.float64).T) # contiguous columns can be sent to bokeh in binary
 
 	DATA['columns'] = {}
 	for var in head:
@@ -462,6 +747,179 @@ def read_runlog(path):
 
 	return DATA
 
+def runlog_index_path(path):
+	'''
+	path to the index file of a runlog, it is saved next to the runlog
+	'''
+	return path+'.idx.npz'
+
+def build_runlog_index(path,save=True):
+	'''
+	build an index of a runlog in one pass over the file, returns a dictionary with:
+		'header'	: column names of the runlog
+		'spectrum'	: spectrum name of each row (rows with the wrong number of columns are skipped, like in read_runlog)
+		'offset'	: byte offset of each row in the runlog
+		'time'		: time of each row in fractional days since 1970-01-01 (from the Year, Day, and Hour columns)
+		'name_order': indices that sort 'spectrum'
+		'time_order': indices that sort 'time'
+		'size','mtime': size and modification time of the runlog when the index was built
+
+	if save is True the index is saved next to the runlog (see runlog_index_path)
+	'''
+
+	header = []
+	spectrum = []
+	offset = []
+	year = []
+	day = []
+	hour = []
+
+	pos = 0
+	infile = open(path,'rb')
+	for line in infile:
+		line_pos = pos
+		pos += len(line)
+		if not isinstance(line,str):
+			line = line.decode('latin-1')
+		if not header:
+			if 'Spectrum' in line:
+				header = line.split()
+				year_ID,day_ID,hour_ID = [header.index(var) for var in ['Year','Day','Hour']]
+			continue
+		split_line = line.split()
+		if len(split_line)!=len(header):
+			continue
+		spectrum.append(split_line[0])
+		offset.append(line_pos)
+		year.append(split_line[year_ID])
+		day.append(split_line[day_ID])
+		hour.append(split_line[hour_ID])
+	infile.close()
+
+	year = np.array(year,dtype=int)
+	jan1 = (year-1970).astype('datetime64[Y]').astype('datetime64[D]').astype(int) # days from 1970-01-01 to January 1st of each year
+
+	RUNLOG_INDEX = {}
+	RUNLOG_INDEX['header'] = np.array(header)
+	RUNLOG_INDEX['spectrum'] = np.array(spectrum)
+	RUNLOG_INDEX['offset'] = np.array(offset,dtype=np.int64)
+	RUNLOG_INDEX['time'] = jan1+np.array(day,dtype=np.float64)-1+np.array(hour,dtype=np.float64)/24.0
+	RUNLOG_INDEX['name_order'] = np.argsort(RUNLOG_INDEX['spectrum'],kind='mergesort')
+	RUNLOG_INDEX['time_order'] = np.argsort(RUNLOG_INDEX['time'],kind='mergesort')
+	RUNLOG_INDEX['size'] = os.path.getsize(path)
+	RUNLOG_INDEX['mtime'] = os.path.getmtime(path)
+
+	if save:
+		np.savez(runlog_index_path(path),**RUNLOG_INDEX)
+
+	return RUNLOG_INDEX
+
+def load_runlog_index(path):
+	'''
+	load the index of a runlog, it is built (and saved) if it does not exist or if the runlog changed since it was built
+
+	the sorted spectrum names and times are added under 'sorted_spectrum' and 'sorted_time' for the lookups
+	'''
+
+	index_path = runlog_index_path(path)
+
+	RUNLOG_INDEX = {}
+	if os.path.exists(index_path):
+		npz = np.load(index_path)
+		RUNLOG_INDEX = {key:npz[key] for key in npz.files}
+		npz.close()
+		if (int(RUNLOG_INDEX['size'])!=os.path.getsize(path)) or (float(RUNLOG_INDEX['mtime'])!=os.path.getmtime(path)):
+			print('in function load_runlog_index():',path,'changed since its index was built')
+			RUNLOG_INDEX = {}
+
+	if not RUNLOG_INDEX:
+		RUNLOG_INDEX = build_runlog_index(path)
+
+	RUNLOG_INDEX['sorted_spectrum'] = RUNLOG_INDEX['spectrum'][RUNLOG_INDEX['name_order']]
+	RUNLOG_INDEX['sorted_time'] = RUNLOG_INDEX['time'][RUNLOG_INDEX['time_order']]
+
+	return RUNLOG_INDEX
+
+def read_runlog_rows(path,rows,runlog_index=None):
+	'''
+	read the given rows of a runlog without parsing the whole file
+
+	rows: list of row indices (as in the index, malformed lines are not counted)
+	runlog_index: output of load_runlog_index(path), it will be loaded if not given
+
+	returns a dictionary like read_runlog, with only the requested rows
+	'''
+
+	if runlog_index is None:
+		runlog_index = load_runlog_index(path)
+
+	header = [str(var) for var in runlog_index['header']]
+
+	infile = open(path,'rb')
+	mm = mmap.mmap(infile.fileno(),0,access=mmap.ACCESS_READ)
+	infile.close()
+
+	content = []
+	for pos in runlog_index['offset'][rows]:
+		eol = mm.find(b'\n',pos)
+		if eol == -1: # last line without a newline
+			eol = len(mm)
+		line = mm[pos:eol]
+		if not isinstance(line,str):
+			line = line.decode('latin-1')
+		content.append(line.split())
+
+	mm.close()
+
+	DATA = {}
+
+	content_T = np.array(content).reshape(-1,len(header)).T
+
+	for var in header:
+		try:
+			DATA[var] = [float(elem) for elem in content_T[header.index(var)]]
+		except ValueError:
+			DATA[var] = content_T[header.index(var)]
+
+	return DATA
+
+def runlog_lookup(path,spectrum,runlog_index=None):
+	'''
+	get the runlog row of a given spectrum with a binary search in the runlog index
+
+	returns a dictionary like read_runlog for that one row, or an empty dictionary if the spectrum is not in the runlog
+	'''
+
+	if runlog_index is None:
+		runlog_index = load_runlog_index(path)
+
+	ID = np.searchsorted(runlog_index['sorted_spectrum'],spectrum)
+
+	if ID==len(runlog_index['sorted_spectrum']) or runlog_index['sorted_spectrum'][ID]!=spectrum:
+		print('in function runlog_lookup():',spectrum,'not in',path)
+		return {}
+
+	return read_runlog_rows(path,[runlog_index['name_order'][ID]],runlog_index=runlog_index)
+
+def runlog_range(path,start,end,runlog_index=None):
+	'''
+	get the runlog rows with start <= time < end with a binary search in the runlog index
+
+	start and end are UTC datetime objects
+
+	returns a dictionary like read_runlog with the rows in chronological order
+	'''
+
+	if runlog_index is None:
+		runlog_index = load_runlog_index(path)
+
+	start = calendar.timegm(start.timetuple())/24.0/3600.0
+	end = calendar.timegm(end.timetuple())/24.0/3600.0
+
+	first,last = np.searchsorted(runlog_index['sorted_time'],[start,end])
+
+	return read_runlog_rows(path,runlog_index['time_order'][first:last],runlog_index=runlog_index)
+
 def read_isotopologs(path):
 	"""
 	isotopologs.dat contains information on the isotopologues of each gas.
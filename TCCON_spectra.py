@@ -71,7 +71,7 @@ def read_spt(path):
 
 	DATA['header'] = head
 
-	content_T = np.array([[elem for elem in line.split()] for line in content[3:]],dtype=np.float).T # transpose of the file content after the header, so content_T[i] is the ith column
+	content_T = np.ascontiguousarray(np.array([[elem for elem in line.split()] for line in content[3:]],dtype=np.float64).T) # transpose of the file content after the header, so content_T[i] is the ith column; contiguous so that bokeh can encode the columns in binary
 
 	DATA['columns'] = {}
 	for var in head:
@@ -185,6 +185,11 @@ for spectrum in select_spectra:
 	residuals = spt_data['resid'] # 100*(calculated - measured)
 	sigma_rms = spt_data['rms_resid'] # sqrt(mean(residuals**2))
 
+	# all the lines of the spectrum share one data source so the frequencies are only written once in the html file
+	source = ColumnDataSource(data={var:spt_data['columns'][var] for var in header})
+	source.data['resid'] = residuals
+	source.data['const'] = np.zeros(len(residuals))
+
 	## start bokeh plot
 	TOOLS = "box_zoom,wheel_zoom,pan,undo,redo,reset,crosshair,save" #tools for bokeh figures
 
@@ -207,20 +212,20 @@ for spectrum in select_spectra:
 	plots = []
 	for j in range(len(species)-3):
 		try:
-			plots.append(fig.line(x=freq,y=species[j+3],color=colors[header[j+3]],line_width=2,name=header[j+3]))
+			plots.append(fig.line(x=header[0],y=header[j+3],color=colors[header[j+3]],line_width=2,name=header[j+3],source=source))
 		except KeyError:
 			print('KeyError:',header[j+3],'is not specified in the "colors" dictionary, you need to add it with an associated color')
 			sys.exit()
 		# each line has a associated hovertool with a callback that looks at the checkboxes status for the tool visibility.
-		fig.add_tools( HoverTool(mode='vline',line_policy='prev',renderers=[plots[j]],names=[header[j+3]],tooltips=OrderedDict( [('name',header[j+3]),('index','$index'),('(x;y)','(@x{0.00} ; @y{0.000})')] ) ) )
+		fig.add_tools( HoverTool(mode='vline',line_policy='prev',renderers=[plots[j]],names=[header[j+3]],tooltips=OrderedDict( [('name',header[j+3]),('index','$index'),('(x;y)','(@'+header[0]+'{0.00} ; @'+header[j+3]+'{0.000})')] ) ) )
 
 	# adding the measured spectrum
-	plots.append(fig.line(x=freq,y=tm,color='black',line_width=2,name='Tm'))
-	fig.add_tools( HoverTool(mode='vline',line_policy='prev',renderers=[plots[j+1]],names=['Tm'],tooltips=OrderedDict( [('name','Measured'),('index','$index'),('(x;y)','(@x{0.00} ; @y{0.000})')] ) ) )
+	plots.append(fig.line(x=header[0],y=header[1],color='black',line_width=2,name='Tm',source=source))
+	fig.add_tools( HoverTool(mode='vline',line_policy='prev',renderers=[plots[j+1]],names=['Tm'],tooltips=OrderedDict( [('name','Measured'),('index','$index'),('(x;y)','(@'+header[0]+'{0.00} ; @'+header[1]+'{0.000})')] ) ) )
 	
 	# adding the calculated spectrum
-	plots.append(fig.line(x=freq,y=tc,color='chartreuse',line_width=2,name='Tc'))
-	fig.add_tools( HoverTool(mode='vline',line_policy='prev',renderers=[plots[j+2]],names=['Tc'],tooltips=OrderedDict( [('name','Calculated'),('index','$index'),('(x;y)','(@x{0.00} ; @y{0.000})')] ) ) )
+	plots.append(fig.line(x=header[0],y=header[2],color='chartreuse',line_width=2,name='Tc',source=source))
+	fig.add_tools( HoverTool(mode='vline',line_policy='prev',renderers=[plots[j+2]],names=['Tc'],tooltips=OrderedDict( [('name','Calculated'),('index','$index'),('(x;y)','(@'+header[0]+'{0.00} ; @'+header[2]+'{0.000})')] ) ) )
 
 	# legend outside of the figure
 	fig_legend=Legend(items=[(header[j+3],[plots[j]]) for j in range(len(species)-3)]+[('Measured',[plots[-2]]),('Calculated',[plots[-1]])],location=(0,0),border_line_alpha=0)
@@ -229,11 +234,11 @@ for spectrum in select_spectra:
 	fig.legend.inactive_fill_alpha = 0.6
 
 	# now the residual figure
-	fig_resid.line(x=freq,y=residuals,color='black',name='residuals')
+	fig_resid.line(x=header[0],y='resid',color='black',name='residuals',source=source)
 	fig_resid.add_tools(HoverTool(mode='vline',line_policy='prev',names=['residuals'],tooltips={'index':'$index','(x;y)':'($x{0.00} ; $y{0.000})'}))
 
 	# set up a dummy legend for the residual figure so that it aligns with the spectrum figure
-	dummy = fig_resid.line(x=freq,y=[0 for i in range(len(freq))],color='white',visible=False,alpha=0)
+	dummy = fig_resid.line(x=header[0],y='const',color='white',visible=False,alpha=0,source=source)
 	fig_resid_legend=Legend(items=[('               ',[dummy])],location=(0,0),border_line_alpha=0)
 	fig_resid.add_layout(fig_resid_legend,'right')
 	
@@ -0,0 +1,212 @@
+'''
+Cache of the data arrays read by main.py
+
+The cache lives in memory and is shared by all the sessions of the bokeh server.
+Each (date input, site, variable) array is also saved in its own .npy file so that the cache survives server restarts.
+The total size of the files is kept under max_size by removing the least recently used arrays.
+The arrays are saved without pickles (strings are saved with a fixed width), so loading a file from the cache folder cannot run code.
+The lock of the cache is only held to update the entries, the files are read and written outside of it.
+'''
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+_caches = {} # one DataCache per cache folder, so that all sessions share it
+_caches_lock = threading.Lock() # sessions can be created at the same time
+
+def get_cache(folder,max_size):
+	'''
+	returns the DataCache for 'folder', creating it the first time it is asked for
+	'''
+	with _caches_lock:
+		if folder not in _caches:
+			_caches[folder] = DataCache(folder,max_size)
+		return _caches[folder]
+
+def _remove_files(folder,file_list):
+	'''
+	remove the files in file_list from 'folder', ignoring the files that are already removed
+	'''
+	for file_name in file_list:
+		try:
+			os.remove(os.path.join(folder,file_name))
+		except OSError:
+			pass
+
+def _write_atomic(path,write):
+	'''
+	call write(file_object) on a temporary file and then rename it to 'path'
+	a reader will either see the complete old file or the complete new file
+	'''
+	tmp_path = path+'.tmp'
+	with open(tmp_path,'wb') as outfile:
+		write(outfile)
+	try:
+		os.rename(tmp_path,path)
+	except OSError: # on windows rename does not overwrite existing files
+		os.remove(path)
+		os.rename(tmp_path,path)
+
+class DataCache(object):
+	'''
+	Least recently used cache of numpy arrays keyed by (date_val,site,var)
+
+	'entries' is ordered from the least to the most recently used key, each value is [array or None,size in bytes,file name]
+	Arrays found on disk at startup are only read when they are first asked for.
+	'''
+	def __init__(self,folder,max_size):
+		self.folder = folder
+		self.max_size = max_size
+		self.size = 0
+		self.entries = OrderedDict()
+		self.lock = threading.Lock() # protects entries and size
+		self.writing = set() # keys of the arrays being written by put()
+		self.index_lock = threading.Lock() # only one thread writes index.json at a time
+		self.index_count = 0 # number of changes of the entries, so that an older index is not written over a newer one
+		self.index_written = 0
+
+		if self.max_size == 0:
+			return
+
+		if not os.path.isdir(self.folder):
+			os.makedirs(self.folder)
+
+		self.index_file = os.path.join(self.folder,'index.json')
+		try:
+			with open(self.index_file,'r') as infile:
+				index = json.load(infile)
+		except (IOError,ValueError):
+			index = []
+
+		for date_val,site,var,file_name,size in index:
+			if os.path.exists(os.path.join(self.folder,file_name)):
+				self.entries[(date_val,site,var)] = [None,size,file_name]
+				self.size += size
+		evicted = self._evict()
+		_remove_files(self.folder,evicted)
+		if len(evicted)!=0 or len(self.entries)!=len(index): # the removed files must not stay in the index
+			self._save_index(self._index_snapshot())
+
+		if len(self.entries)!=0:
+			print 'Cache found:',len(self.entries),'arrays,',self.size/1E6,'MB'
+			print 'If you added or modified files since last time, remove the',self.folder,'folder and run the program again, load times will initially be longer'
+
+	def _index_snapshot(self):
+		'''
+		returns (change count,index) with the keys, file names and sizes of the entries in least to most recently used order
+		must be called with the lock held
+		'''
+		self.index_count += 1
+		return self.index_count,[[key[0],key[1],key[2],entry[2],entry[1]] for key,entry in self.entries.items()]
+
+	def _save_index(self,snapshot):
+		'''
+		write an index from _index_snapshot() to index.json, unless a newer one was already written
+		'''
+		count,index = snapshot
+		with self.index_lock:
+			if count<=self.index_written:
+				return
+			_write_atomic(self.index_file,lambda outfile: outfile.write(json.dumps(index).encode('utf-8')))
+			self.index_written = count
+
+	def _evict(self):
+		'''
+		remove the least recently used entries until the cache size is under max_size
+		returns the file names of the removed entries, they should be removed with _remove_files() after releasing the lock
+		'''
+		evicted = []
+		while self.size>self.max_size and len(self.entries)!=0:
+			key,(value,size,file_name) = self.entries.popitem(last=False)
+			self.size -= size
+			evicted.append(file_name)
+			print 'Removing',key,'from cache'
+		return evicted
+
+	def get(self,date_val,site,var_list):
+		'''
+		returns a dictionary {var:array} if all the variables in var_list are cached for date_val and site, or None otherwise
+		'''
+		if self.max_size == 0:
+			return None
+
+		keys = [(date_val,site,var) for var in var_list]
+		with self.lock:
+			if False in [key in self.entries for key in keys]:
+				return None
+
+			result = {}
+			to_load = []
+			for key in keys:
+				entry = self.entries.pop(key) # pop and re-insert to mark the entry as the most recently used
+				self.entries[key] = entry
+				if entry[0] is None:
+					to_load.append((key,entry[2]))
+				else:
+					result[key[2]] = entry[0]
+
+		# arrays found on disk at startup are read outside of the lock
+		for key,file_name in to_load:
+			try:
+				value = np.load(os.path.join(self.folder,file_name),allow_pickle=False)
+			except (IOError,ValueError): # removed meanwhile, or saved with a pickle by an older version
+				with self.lock:
+					entry = self.entries.pop(key,None)
+					if entry is not None:
+						self.size -= entry[1]
+						snapshot = self._index_snapshot()
+				if entry is not None:
+					self._save_index(snapshot)
+				return None
+			with self.lock:
+				if key in self.entries and self.entries[key][2] == file_name:
+					self.entries[key][0] = value
+			result[key[2]] = value
+
+		return result
+
+	def put(self,date_val,site,var,value):
+		'''
+		add an array to the cache and write it to its own file; arrays that are already cached are only marked as recently used
+		'''
+		if self.max_size == 0:
+			return
+
+		key = (date_val,site,var)
+		with self.lock:
+			if key in self.entries:
+				self.entries[key] = self.entries.pop(key)
+				return
+			if key in self.writing: # another session is already caching it
+				return
+			self.writing.add(key)
+
+		try:
+			value = np.asarray(value)
+			if value.dtype.kind == 'O': # strings are saved with a fixed width so that no pickle is needed
+				value = value.astype(str)
+			if value.nbytes>self.max_size:
+				print 'Not caching',key,': it is larger than the cache max size'
+				return
+
+			file_name = hashlib.md5(repr(key).encode('utf-8')).hexdigest()+'.npy'
+			file_path = os.path.join(self.folder,file_name)
+			_write_atomic(file_path,lambda outfile: np.save(outfile,value,allow_pickle=False))
+			size = os.path.getsize(file_path)
+
+			with self.lock:
+				print 'Caching',key,':',len(value),'values'
+				self.entries[key] = [value,size,file_name]
+				self.size += size
+				evicted = self._evict()
+				snapshot = self._index_snapshot()
+		finally:
+			with self.lock:
+				self.writing.discard(key)
+
+		_remove_files(self.folder,evicted)
+		self._save_index(snapshot)
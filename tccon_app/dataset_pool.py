@@ -0,0 +1,114 @@
+'''
+Pool of open netCDF files shared by all the sessions and callbacks of the bokeh server
+
+Opening a netCDF file and parsing its metadata is slow for the large private files, so files stay open between loads.
+The least recently used files are closed when more than max_open files are open, and a file is reopened if it was modified since it was opened.
+'''
+
+import os
+import atexit
+import threading
+from collections import OrderedDict
+import numpy as np
+import netCDF4
+
+class DatasetPool(object):
+	'''
+	'handles' maps each file path to [netCDF4.Dataset,modification time] from the least to the most recently used file
+	The netCDF library is not thread safe, so the files are only accessed while holding 'lock'
+	The lock is taken for each read, so the reads of different sessions are interleaved instead of waiting for whole loads
+	'user_loads' is the number of loads requested by users that are reading files, in any session; background reads (e.g. prefetching) give way to them
+	'''
+	def __init__(self,max_open=32,chunk_size=100000):
+		self.max_open = max_open
+		self.chunk_size = chunk_size # number of records of each lock of a background read
+		self.handles = OrderedDict()
+		self.lock = threading.Lock()
+		self.user_loads = 0
+		self.user_loads_lock = threading.Lock()
+
+	def _close(self,path):
+		try:
+			self.handles.pop(path)[0].close()
+		except RuntimeError: # the file was already closed
+			pass
+
+	def _dataset(self,path):
+		'''
+		returns the open netCDF file at 'path', it must be called with the lock held
+		'''
+		mtime = os.path.getmtime(path)
+		if path in self.handles and self.handles[path][1]!=mtime: # the file was modified, reopen it
+			self._close(path)
+
+		if path in self.handles:
+			self.handles[path] = self.handles.pop(path) # pop and re-insert to mark the file as the most recently used
+		else:
+			self.handles[path] = [netCDF4.Dataset(path,'r'),mtime]
+			while len(self.handles)>self.max_open:
+				self._close(next(iter(self.handles)))
+
+		return self.handles[path][0]
+
+	def variables(self,path):
+		'''
+		returns the list of the variables of the netCDF file at 'path'
+		'''
+		with self.lock:
+			return [var for var in self._dataset(path).variables]
+
+	def read(self,path,var,start_id=None,end_id=None):
+		'''
+		returns the records start_id to end_id of the variable 'var' of the netCDF file at 'path'
+		'''
+		with self.lock:
+			return self._dataset(path).variables[var][start_id:end_id]
+
+	def nbytes(self,path,var,start_id=None,end_id=None):
+		'''
+		returns the size in bytes of the records start_id to end_id of 'var', from its type and shape without reading it
+		'''
+		with self.lock:
+			variable = self._dataset(path).variables[var]
+			shape = list(variable.shape)
+			itemsize = np.dtype(variable.dtype).itemsize
+		shape[0] = len(range(*slice(start_id,end_id).indices(shape[0])))
+		return int(np.prod(shape))*itemsize
+
+	def read_background(self,path,var,start_id=None,end_id=None):
+		'''
+		same as read() for the reads that were not requested by a user, returns None as soon as a user load is running
+		the records are read by chunks of chunk_size and the lock is released between chunks, so a user load waits for at most one chunk
+		'''
+		with self.lock:
+			start_id,end_id = slice(start_id,end_id).indices(len(self._dataset(path).variables[var]))[:2]
+
+		chunks = []
+		for chunk_start in range(start_id,max(end_id,start_id+1),self.chunk_size):
+			if self.user_loads!=0:
+				return None
+			with self.lock:
+				chunks.append(self._dataset(path).variables[var][chunk_start:min(chunk_start+self.chunk_size,end_id)])
+
+		if len(chunks)==1:
+			return chunks[0]
+		return np.ma.concatenate(chunks)
+
+	def start_load(self):
+		'''
+		counts a load requested by a user until end_load() is called, background reads give way to it
+		'''
+		with self.user_loads_lock:
+			self.user_loads += 1
+
+	def end_load(self):
+		with self.user_loads_lock:
+			self.user_loads -= 1
+
+	def close_all(self):
+		with self.lock:
+			for path in list(self.handles):
+				self._close(path)
+
+dataset_pool = DatasetPool()
+atexit.register(dataset_pool.close_all)
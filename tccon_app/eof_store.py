@@ -0,0 +1,122 @@
+'''
+Columnar store of .eof.csv files
+
+Reading from a .eof.csv file means parsing the whole file, even to plot one variable over a few days.
+This program converts the .eof.csv files of a folder once into one store per site, the app then reads it like the netcdf files:
+
+	python eof_store.py path/to/eof_folder [path/to/tccon_app/data]
+
+Each store is a folder named like the site files (xxYYYYMMDD_YYYYMMDD.eofstore) with one .npy file per column, sorted by time.
+The columns are memory mapped when read, so only the columns and the time range that are plotted are read from disk.
+If stores are in the 'data' folder of the app, the .eof.csv files in that folder are ignored.
+'''
+
+import os
+import sys
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+store_ext = '.eofstore'
+
+def csv_times(df):
+	'''
+	convert the year,day,hour columns of a .eof.csv file in fractional days since 1970
+	'''
+	year_start = (df['year'].values.astype(int)-1970).astype('datetime64[Y]').astype('datetime64[D]').astype(np.float64)
+	return year_start+np.floor(df['day'].values)-1+df['hour'].values/24.0
+
+def store_columns(path):
+	'''
+	returns the list of columns of the store at 'path', in the order of the .eof.csv files
+	'''
+	with open(os.path.join(path,'columns.json'),'r') as infile:
+		return json.load(infile)
+
+def read_column(path,var,start_id=None,end_id=None):
+	'''
+	returns the values of the column 'var' of the store at 'path' between start_id and end_id
+	'''
+	column = np.load(os.path.join(path,var+'.npy'),mmap_mode='r')
+	return np.array(column[start_id:end_id])
+
+def column_nbytes(path,var,start_id=None,end_id=None):
+	'''
+	returns the size in bytes of the values of the column 'var' of the store at 'path' between start_id and end_id, without reading them
+	'''
+	return np.load(os.path.join(path,var+'.npy'),mmap_mode='r')[start_id:end_id].nbytes
+
+def read_times(path):
+	'''
+	returns the time index of the store at 'path' (fractional days since 1970)
+	'''
+	return np.load(os.path.join(path,'time_index.npy'))
+
+def write_store(path,df):
+	'''
+	write the columns of the dataframe 'df' sorted by time in a new store at 'path'
+	the store is written in a temporary folder that is renamed at the end, so an interrupted conversion does not leave an incomplete store
+	'''
+	times = csv_times(df)
+	order = np.argsort(times,kind='mergesort')
+
+	tmp_path = path+'.tmp'
+	if os.path.isdir(tmp_path):
+		shutil.rmtree(tmp_path)
+	os.makedirs(tmp_path)
+
+	np.save(os.path.join(tmp_path,'time_index.npy'),times[order])
+	for var in df.columns:
+		values = np.asarray(df[var].values)[order]
+		if values.dtype.kind == 'O': # strings are saved with a fixed width so that they can be memory mapped
+			values = values.astype(str)
+		np.save(os.path.join(tmp_path,var+'.npy'),values)
+	with open(os.path.join(tmp_path,'columns.json'),'w') as outfile:
+		json.dump(list(df.columns),outfile)
+
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	os.rename(tmp_path,path)
+
+def convert(eof_folder,store_folder):
+	'''
+	convert all the .eof.csv files in 'eof_folder' into one store per site in 'store_folder'
+	'''
+	eof_file_list = sorted([i for i in os.listdir(eof_folder) if '.eof.csv' in i])
+	if len(eof_file_list) == 0:
+		print 'No .eof.csv files in',eof_folder
+		return
+
+	if not os.path.isdir(store_folder):
+		os.makedirs(store_folder)
+
+	for prefix in sorted(set([i[:2] for i in eof_file_list])):
+		site_file_list = [i for i in eof_file_list if i[:2]==prefix]
+		print 'Reading',prefix,'files:',', '.join(site_file_list)
+		df = pd.concat([pd.read_csv(os.path.join(eof_folder,site_file),header=2) for site_file in site_file_list],ignore_index=True)
+
+		min_date = min([site_file[2:10] for site_file in site_file_list])
+		max_date = max([site_file[11:19] for site_file in site_file_list])
+		store_name = prefix+min_date+'_'+max_date+store_ext
+
+		# remove previous stores of the site, they may have a different date range
+		for old_store in [i for i in os.listdir(store_folder) if i[:2]==prefix and i.endswith(store_ext) and i!=store_name]:
+			shutil.rmtree(os.path.join(store_folder,old_store))
+
+		write_store(os.path.join(store_folder,store_name),df)
+		print 'Wrote',store_name,':',len(df),'records,',len(df.columns),'columns'
+
+	print 'If the app already cached data from the .eof.csv files, remove the cache_eof folder in tccon_app/cache'
+
+if __name__ == '__main__':
+	if len(sys.argv) not in [2,3]:
+		print 'usage: python eof_store.py path/to/eof_folder [path/to/tccon_app/data]'
+		sys.exit(1)
+
+	eof_folder = sys.argv[1]
+	store_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)),'data')
+	if len(sys.argv) == 3:
+		store_folder = sys.argv[2]
+
+	convert(eof_folder,store_folder)
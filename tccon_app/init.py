@@ -11,10 +11,16 @@ def setup():
 
 	layout_mode = 'comp' # can be set to 'simple' or 'comp'; in 'simple' mode there is just one plot with one site and one variable to select
 
-	cache_max_size = 0 #2E8 # maximum size of the cache file (in bytes), any new cached data after that will remove the oldest data following certain rules (see add_cache function)
-	# set cache_max_size to 0 if you do not want to make a cache file (reading from netcdf files can be faster than from the cache file)
+	cache_max_size = 2E8 # maximum size of the cache (in bytes), any new cached data after that will remove the least recently used data (see data_cache.py)
+	# cached data is kept in memory and only new arrays are written to the 'cache' folder, so loading cached data is faster than reading from the netcdf files; set cache_max_size to 0 to disable the cache
 
-	# if you modify the plotting colors, you will need to remove your cache_dic.npy file; you will also need to edit the styles.css in tccon_app/templates/styles.css to match the new colors.
+	max_points = 3000 # maximum number of points of each site sent to the browser; when the x range of the figures has more points, only the min and max values of small time bins are shown, zoom in to see all the data
+	# set max_points to 0 to always send all the points in the figures (box selections statistics will then use all the points)
+
+	prefetch_max_size = 5E7 # maximum size (in bytes) of the variables read in advance and added to the cache after each load: the _error variables of the loaded variables and the last variables used for the site
+	# the reading in advance stops as soon as a load is started in any session; set prefetch_max_size to 0 to only read the selected variables; this is not done for .eof.csv files (see eof_store.py) or when the cache is disabled (cache_max_size = 0), and at most cache_max_size bytes are read
+
+	# if you modify the plotting colors, you will need to remove the folders in tccon_app/cache; you will also need to edit the styles.css in tccon_app/templates/styles.css to match the new colors.
 	main_color = 'yellowgreen' # this will be the color used for the flag=0 data; I use css 'YellowGreen' (#9ACD32) by default
 	main_color2 = 'plum' # the main color for data from the second site in 'comp' mode; I use css 'Plum' (#DDA0DD) by default
 	flag_color = 'grey' # this will be the color used for the flag!=0 data
@@ -136,4 +142,4 @@ def setup():
 				'pt':'Canada',
 			 }
 
-	return layout_mode, cache_max_size, main_color, main_color2, flag_color, hover_color, boxselecttool_dimensions, skip_list, T_FULL, T_LOC
+	return layout_mode, cache_max_size, max_points, prefetch_max_size, main_color, main_color2, flag_color, hover_color, boxselecttool_dimensions, skip_list, T_FULL, T_LOC
@@ -12,11 +12,15 @@ If both .eof.csv and .nc files are in the 'data' folder, the program will only '
 
 It is much slower to read from the .eof.csv files than it is to read from the netcdf files !
 And unlike the netcdf files, using the date input widget won't make loading of data subsets faster with the .eof.csv files.
+To avoid this, convert the .eof.csv files once with "python eof_store.py path/to/eof_folder", it will write one columnar store per site in the 'data' folder.
+The stores are read like the netcdf files, and if there are stores in the 'data' folder the .eof.csv files are ignored.
 
 All the file names must start with the format xxYYYYMMDD_YYYYMMDD , xx is the two letters site abbreviation
 
-The program will create a cache_dic.npy file in which it will save full time series of variables that correspond to previous inputs.
-The size of this cache file will be kept under 200 MB. If you like you can increase that size by changing the 'cache_max_size' value (in bytes) in the init.py file.
+The program keeps a cache of the full time series of variables that correspond to previous inputs, each one is also saved in its own file in the 'cache' folder.
+The size of the cache will be kept under 'cache_max_size' (in bytes, in init.py), set it to 0 to disable the cache.
+With the cache, after each load, the _error variables of the loaded variables and the last variables used for the site are also read in the background and cached, up to 'prefetch_max_size' bytes (in init.py).
+These background reads stop as soon as a user starts a load in any session.
 """
 
 #############
@@ -29,6 +33,8 @@ import netCDF4
 from datetime import datetime, timedelta
 import time
 import calendar
+from threading import Thread
+from functools import partial
 import numpy as np
 import pandas as pd
 
@@ -36,10 +42,15 @@ import bokeh
 from bokeh.io import curdoc
 from bokeh.plotting import figure
 from bokeh.models import ColumnDataSource, TextInput, Div, CustomJS, Button, TextInput, Select, HoverTool, BoxSelectTool, DataTable, TableColumn, LinearAxis, DataRange1d
-from bokeh.layouts import gridplot, widgetbox
+from bokeh.layouts import gridplot
 from bokeh.events import Reset
 
 from init import setup
+from data_cache import get_cache
+from site_index import get_site_index, time_slices
+from dataset_pool import dataset_pool
+from eof_store import store_ext, read_column, column_nbytes
+from site_data import data_columns, append_column, read_file
 
 #############
 #############
@@ -48,7 +59,9 @@ app_path = os.path.dirname(__file__)
 data_folder = os.path.join(app_path,'data')
 cache_folder = os.path.join(app_path,'cache')
 
-layout_mode, cache_max_size, main_color, main_color2, flag_color, hover_color, boxselecttool_dimensions, skip_list, T_FULL, T_LOC = setup()
+layout_mode, cache_max_size, max_points, prefetch_max_size, main_color, main_color2, flag_color, hover_color, boxselecttool_dimensions, skip_list, T_FULL, T_LOC = setup()
+
+doc = curdoc() # the document of this session; worker threads can only modify it through doc.add_next_tick_callback
 
 def linediv(color='lightblue',width=400):
 	"""
@@ -68,23 +81,24 @@ for key in T_FULL:
 		T_site[key] += '_'.join(T_FULL[key].split())
 
 netcdf = True
+eof_columns = False
 tccon_file_list = [i for i in os.listdir(data_folder) if '.nc' in i] # list of the netcdf files in the 'data' folder
 if len(tccon_file_list) == 0:
 	netcdf = False
+	eof_columns = True
+	tccon_file_list = [i for i in os.listdir(data_folder) if i.endswith(store_ext)] # list of the columnar stores made from .eof.csv files by eof_store.py
+if len(tccon_file_list) == 0:
+	eof_columns = False
 	tccon_file_list = [i for i in os.listdir(data_folder) if '.eof.csv' in i] # list of the .eof.csv files in the 'data' folder
 
 # list of TCCON 2 letters abbreviations from the files in the 'data' folder doing list(set(a)) prevents repeated elements in the final list
 prefix_list = list(set([i[:2] for i in tccon_file_list])) 
 
-# determine if the files are from the public or private archive
-public = True
-if netcdf:
-	f = netCDF4.Dataset(os.path.join(data_folder,tccon_file_list[0]),'r')
-	if 'flag' in [var for var in f.variables]:
-		public = False
-	f.close()
-else:
-	public = False
+# time index of the files of each site, it is built once when the server starts and shared by all sessions
+site_index = get_site_index(data_folder,tccon_file_list,netcdf)
+
+# determine if the files are from the public or private archive, from the variables in the site index so that no file is opened for each session
+public = netcdf and 'flag' not in site_index[sorted(site_index)[0]]['variables']
 
 # list of sites that will be available in the site_input selection widget; I add an empty string at the beginning so that the first site can be selected right away
 ordered_site_list = ['']+sorted([T_FULL[i] for i in prefix_list]) 
@@ -234,6 +248,9 @@ var T1 = 0;
 var T2 = 0;
 var T3 = 0;
 
+// the rows hidden with the flag input have NaN y values and are not used
+inds = inds.filter(function(i){return !isNaN(data['y1'][i]) && !isNaN(data['y2'][i]);});
+
 tab['N'][ROWID] = inds.length;
 
 if (inds.length == 0) {
@@ -310,190 +327,323 @@ txt.text = "";
 
 ## END OF TOOLS SETUP
 #################################################################################
-## DUMMY WIDGETS SETUP
-
-# dummy widgetbox with a dummy button to trigger the status_div loading counter; this will be hidden
-
-# javascript code for a dummy (invisible) button, it starts and stops a timer that will be displayed in the 'status_div' when data is loading
-dum_button_code = """
-if (cb_obj.button_type.includes('success')){
-var start = new Date();	
-var intervalID = setInterval(function(){var current = new Date(); var diff=((current-start)/1000.0).toFixed(1); status_div.text='Loading data: '+diff.toString()+' s';	}, 100)
-cb_obj.button_type = 'warning';
-} else {
-var noIntervals = setInterval(function(){});
-for (var i = 0; i<noIntervals; i++) { window.clearInterval(i);}
-status_div.text='Data loaded';
-cb_obj.button_type = 'success';
-}
-"""
-dum_button = Button(label='dummy_button',button_type='success',width=200,css_classes=["dum_button","hidden"]) # the dummy button itself
-dum_button.callback = CustomJS(args={'status_div':status_div},code=dum_button_code) # the callback of the button
-
-dum_text = TextInput(css_classes=["hidden"]) # dummy text input widget; it will be used to trigger the dummy button callback when the dropdown widgets are used.
-dum_text.js_on_change('value',CustomJS(code="click_dummy_button()")) # callback of the dummy 'dum_text' TextInput widget to trigger a button click on the dummy button 'dum_button'
-
-dum_alert = Div(text='<b>OOPS !</b> the widgets below are supposed to be hidden. Try refreshing the page',width=700,css_classes=["hidden"])
-
-dum_box = widgetbox(dum_alert,dum_button,dum_text,width=600,name='dummy box',css_classes=["hidden"])
-
-## END OF DUMMY WIDGETS SETUP
-#################################################################################
 ## CACHE SETUP
-# use a different cache file for each data type
+# use a different cache folder for each data type
 if netcdf and public:
-	cache_file = os.path.join(cache_folder,'cache_dic_pub.npy')
+	cache_dir = os.path.join(cache_folder,'cache_pub')
 elif netcdf:
-	cache_file = os.path.join(cache_folder,'cache_dic.npy')
-else:
-	cache_file = os.path.join(cache_folder,'cache_dic_eof.npy')
-
-# global variables to make the data reading faster, it will save entire time series corresponding to different inputs; size will be limited, see the add_cache function
-try:
-	cache_dic = np.load(cache_file).item()
-except IOError:
-	cache_dic = {}
-	np.save(cache_file,cache_dic)
+	cache_dir = os.path.join(cache_folder,'cache_nc')
 else:
-	print 'Cache dictionnary found:\nIf you added or modified files since last time, remove cache_dic.npy and run the program again, load times will initially be longer'
+	cache_dir = os.path.join(cache_folder,'cache_eof')
+
+# the cache is shared by all sessions; it keeps entire time series corresponding to different inputs, its size is limited by cache_max_size (see data_cache.py)
+data_cache = get_cache(cache_dir,cache_max_size)
 ## END OF CACHE SETUP
 #################################################################################
 
 ## END OF SETUP SECTION
 #########################################################################################################################################################################
 ## ADD_DATA FUNCTION
+def flag_values(flag):
+	'''
+	returns the integer flags from the 'flag' column; for .eof.csv files the column has strings like "flag variable = value"
+	'''
+	if netcdf:
+		return flag
+	return np.char.partition(flag.astype(str),' ')[:,0].astype(int)
+
 def add_data(data,x=None,y1=None,y2=None,colo=None,flag=None,spectrum=None):
 	'''
 	function to update a data dictionary based on the layout mode and data type
 	'''
 	if public and layout_mode=='simple':
-		return {'x' : np.append(data['x'],x),
-				'y1' : np.append(data['y1'],y1),
-				'colo' : np.append(data['colo'],colo),}
+		return {'x' : append_column(data['x'],x),
+				'y1' : append_column(data['y1'],y1),
+				'colo' : append_column(data['colo'],colo),}
 	elif not public and layout_mode=='simple':
-		return {'x' : np.append(data['x'],x),
-				'y1' : np.append(data['y1'],y1),
-				'colo' : np.append(data['colo'],colo),
-				'flag' : np.append(data['flag'],flag),
-				'spectrum': np.append(data['spectrum'],spectrum),}
+		return {'x' : append_column(data['x'],x),
+				'y1' : append_column(data['y1'],y1),
+				'colo' : append_column(data['colo'],colo),
+				'flag' : append_column(data['flag'],flag),
+				'spectrum': append_column(data['spectrum'],spectrum),}
 	elif public and layout_mode=='comp':
-		return {'x' : np.append(data['x'],x),
-				'y1' : np.append(data['y1'],y1),
-				'y2' : np.append(data['y2'],y2),
-				'colo' : np.append(data['colo'],colo),}
+		return {'x' : append_column(data['x'],x),
+				'y1' : append_column(data['y1'],y1),
+				'y2' : append_column(data['y2'],y2),
+				'colo' : append_column(data['colo'],colo),}
 	elif not public and layout_mode=='comp':
-		return {'x' : np.append(data['x'],x),
-				'y1' : np.append(data['y1'],y1),
-				'y2' : np.append(data['y2'],y2),
-				'colo' : np.append(data['colo'],colo),
-				'flag' : np.append(data['flag'],flag),
-				'spectrum': np.append(data['spectrum'],spectrum),}
+		return {'x' : append_column(data['x'],x),
+				'y1' : append_column(data['y1'],y1),
+				'y2' : append_column(data['y2'],y2),
+				'colo' : append_column(data['colo'],colo),
+				'flag' : append_column(data['flag'],flag),
+				'spectrum': append_column(data['spectrum'],spectrum),}
 ## END OF ADD_DATA FUNCTION
 #########################################################################################################################################################################
-## ADD_CACHE FUNCTION
-def add_cache(date_val,site,source_data,max_size=cache_max_size,first_var='',second_var=''):
+## VIEW FUNCTIONS
+# the data sources only hold the data shown in the current x range of the figures, decimated to at most ~max_points points
+# full_data holds all the loaded data of each site_ID, and full_x its times in milliseconds since 1970 (the units of the datetime x_range)
+# the flag input does not remove rows from full_data: full_shown is the mask of the rows with the selected flag (None without flag input), the other rows are sent with NaN y values
+# so changing the flag input keeps the same rows in the data sources, and only the y columns are sent again
+full_data = {1:{},2:{}}
+full_x = {1:np.array([]),2:np.array([])}
+full_shown = {1:None,2:None}
+view_change = [0] # number of x_range changes, used to only update the view after the last change of a zoom or pan
+data_extent = {1:None,2:None} # first and last time of the last data loaded for each site_ID
+
+def decimate(data,x_ms,x_start=None,x_end=None,shown=None):
 	'''
-	This function will add data to the cache_dic dictionnary in order to make load time shorter.
-	It will keep the size of the cache file below 'max_size' (in bytes)
-	Whenever that size is exceeded, it will remove the oldest cached data following certain priority rules.
-
-	note: I didn't extensively test those priority rules so it might remove unexpected fields when the cache gets over the max size.
+	returns the columns of 'data' to show between x_start and x_end (milliseconds since 1970), or over the whole data if they are not given
+	if there are more than max_points points in that range, the range is divided in max_points/4 bins and only the points with the min and max y1 and y2 of each bin are kept, so that outliers are still shown
+	shown is an optional mask of the rows to show (see full_shown), the y values of the other rows are NaN and they are not used for the min and max of the bins
+	'''
+	first_id,last_id = 0,len(x_ms)
+	if None not in [x_start,x_end]:
+		first_id,last_id = np.searchsorted(x_ms,[x_start,x_end])
+		# keep the neighbouring points on each side so that data does not disappear at the edges while panning
+		first_id,last_id = max(first_id-1,0),min(last_id+1,len(x_ms))
+		if first_id>=last_id: # the range is from previous data, show all the data
+			first_id,last_id = 0,len(x_ms)
+
+	if max_points==0 or last_id-first_id<=max_points:
+		inds = slice(first_id,last_id)
+	else:
+		x = x_ms[first_id:last_id]
+		if x[-1]==x[0]: # all the points have the same time
+			bins = np.zeros(len(x),dtype=int)
+		else:
+			bins = ((x-x[0])/(x[-1]-x[0])*(max_points//4-1)).astype(int)
+		keep = [np.array([0,len(x)-1])]
+		for var in ['y1','y2']:
+			if var in data:
+				y = np.asarray(data[var][first_id:last_id],dtype=np.float64)
+				valid = np.isfinite(y) # NaNs would be picked as the max of their bin
+				if shown is not None:
+					valid &= shown[first_id:last_id]
+				valid = np.flatnonzero(valid)
+				if len(valid)==0:
+					continue
+				order = valid[np.lexsort((y[valid],bins[valid]))] # sorted by bin, then by value
+				bin_start = np.flatnonzero(np.diff(bins[order])!=0)+1
+				keep += [order[np.append(0,bin_start)],order[np.append(bin_start-1,len(order)-1)]] # min and max of each bin
+		inds = first_id+np.unique(np.concatenate(keep))
+
+	view = {key:np.asarray(data[key])[inds] for key in data}
+	if shown is not None:
+		hidden = ~shown[inds]
+		for key in ['y1','y2']:
+			if key in view and len(view[key])==len(hidden):
+				view[key] = np.where(hidden,np.nan,np.asarray(view[key],dtype=np.float64))
+
+	return view
+
+def changed_rows(old_column,new_column):
 	'''
+	returns the indices of the values that differ between two columns of the same length, NaNs are equal to NaNs
+	'''
+	old_column = np.asarray(old_column)
+	new_column = np.asarray(new_column)
+	if old_column.dtype.kind=='M' or new_column.dtype.kind=='M': # compare datetime columns as datetime64
+		old_column = old_column.astype('datetime64[ms]')
+		new_column = new_column.astype('datetime64[ms]')
+	changed = old_column!=new_column
+	if not isinstance(changed,np.ndarray): # the columns cannot be compared (e.g. numbers and strings)
+		return np.arange(len(new_column))
+	if old_column.dtype.kind=='f' and new_column.dtype.kind=='f':
+		changed &= ~(np.isnan(old_column) & np.isnan(new_column))
+	return np.flatnonzero(changed)
+
+def show_view(site_source,view):
+	'''
+	sends the columns of 'view' to the browser through 'site_source', only sending what changed since the previous view:
+		- rows added at the end of an unchanged view are streamed
+		- columns with a few changed values are patched
+		- the other changed columns are replaced, unchanged columns are not sent again (e.g. only 'y1' is sent when a variable of a loaded site is changed)
+	'''
+	old_view = site_source.data
+	n_old = len(old_view['x'])
+	n_new = len(view['x'])
 
-	global cache_dic
+	if n_old==0 or n_new==0 or set(old_view)!=set(view):
+		site_source.data.update(view)
+		return
 
-	try:
-		cache_dic = np.load(cache_file).item()
-	except IOError:
-		print cache_file+' not found'
-		print 'Creating new empty '+cache_file
-		cache_dic = {}
-		np.save(cache_file,cache_dic)
-
-	stamp = datetime.now()
-
-	keep_loop = True
-	rewritten = False
-	it = 1
-	while keep_loop:
-		if os.path.getsize(cache_file)<max_size:
-			try:
-				type(cache_dic[date_val])
-			except KeyError:
-				print 'Caching new date input:',date_val
-				cache_dic[date_val] = {}
-				cache_dic[date_val]['stamp'] = stamp
+	if n_new>n_old and not any([len(changed_rows(old_view[key],view[key][:n_old])) for key in view]):
+		site_source.stream({key:view[key][n_old:] for key in view})
+		return
 
-			try:
-				type(cache_dic[date_val][site])
-			except KeyError:
-				print 'Caching new site input:',date_val,site
-				cache_dic[date_val][site] = {}
-				cache_dic[date_val][site]['stamp'] = stamp
+	if n_new!=n_old:
+		site_source.data.update(view)
+		return
 
-			try:
-				type(cache_dic[date_val][site]['x'])
-			except KeyError:
-				print 'Caching new time data:',date_val,site,len(source_data['x']),'values'
-				cache_dic[date_val][site]['x'] = source_data['x']
-
-			for var in source_data:
-				if var not in ['x','colo','']:
-					nice_var = var
-					if var=='y1':
-						nice_var = first_var
-					elif var=='y2':
-						nice_var = second_var
-
-					try:
-						type(cache_dic[date_val][site][nice_var])
-					except KeyError:
-						print 'Caching new variable:',date_val,site,nice_var,len(source_data[var]),'values'
-						cache_dic[date_val][site][nice_var] = {}
-						cache_dic[date_val][site][nice_var]['stamp'] = stamp
-						cache_dic[date_val][site][nice_var]['value'] = source_data[var]
-		else:
-			rewritten = True
-			while os.path.getsize(cache_file)>max_size:
-				site_list = list(set([[site for site in cache_dic[date_val] if site!='stamp'] for date_val in cache_dic][0])) # list(set()) removes duplicates
-				var_list = list(set([[[var for var in cache_dic[date_val][site] if var not in ['x','flag','spectrum','colo','stamp']] for site in cache_dic[date_val] if site!='stamp'] for date_val in cache_dic][0][0]))
-
-				# if there are more than 5 date_val, remove the oldest date_val
-				if len(cache_dic)>3:
-					del_date = min([(cache_dic[date_val]['stamp'],date_val) for date_val in cache_dic if date_val!=''])[1]
-					del cache_dic[del_date]
-					print 'Removing',del_date,'from cache'
-				# if there are more than 5 sites, remove the oldest site
-				elif len(site_list)>2:
-					del_site = min([[(cache_dic[date_val][site]['stamp'],(date_val,site)) for site in cache_dic[date_val] if site!='stamp'] for date_val in cache_dic][0])[1]
-					del cache_dic[del_site[0]][del_site[1]]
-					print 'Removing',del_site[0],del_site[1],'from cache'
-				# if there are more than 20 variables, remove the oldest variable (except for times, flags, colors, and spectrum names; those will only be removed when a site or date_val is removed)
-				elif len(var_list)>10:
-					del_var = min([[[(cache_dic[date_val][site][var]['stamp'],(date_val,site,cache_dic[date_val][site][var]['value'])) for var in cache_dic[date_val][site] if var not in ['x','flag','spectrum','colo','stamp']] for site in cache_dic[date_val] if site !='stamp'] for date_val in cache_dic][0][0])
-					del cache_dic[del_var[0]][del_var[1]][del_var[2]]
-					print 'Removing',del_var[0],del_var[1],del_var[2],'from cache'
-				print 'Saving new cache file ...'
-				np.save(cache_file,cache_dic)
-				print cache_file,'size:',os.path.getsize(cache_file)/1E6,'MB'
-
-		if os.path.getsize(cache_file)<max_size:
-			keep_loop = False
+	new_columns = {}
+	patches = {}
+	for key in view:
+		rows = changed_rows(old_view[key],view[key])
+		if len(rows)==0:
+			continue
+		if len(rows)<=n_new//10 and view[key].dtype.kind not in 'fM': # only the string columns are patched, number and time columns are replaced
+			patches[key] = zip(rows.tolist(),view[key][rows].tolist())
 		else:
-			print 'Cache is over',max_size/1E6,'MB after caching iteration',it
-			print 'If this does not stop iterating it means that the current selection alone is over the max_size'
-			it+=1
-	if not rewritten:
-		print 'Saving new cache file ...'
-		np.save(cache_file,cache_dic)
-		print cache_file,'size:',os.path.getsize(cache_file)/1E6,'MB'
+			new_columns[key] = view[key]
+
+	if len(new_columns)!=0:
+		site_source.data.update(new_columns)
+	if len(patches)!=0:
+		site_source.patch(patches)
+
+def set_full_data(site_ID,site_source,data,flag_mode=''):
+	'''
+	stores the loaded data of a site and shows it, decimated, in its data source
+	if the data covers the same times as the previous data of the site (e.g. when a variable or the flag input is changed), the current x range is kept, otherwise all the data is shown
+	with a flag_mode, only the rows with that flag are shown (see full_shown)
+	'''
+	x_ms = np.asarray(data['x']).astype('datetime64[ms]').astype(np.int64).astype(np.float64)
+	if np.any(np.diff(x_ms)<0):
+		order = np.argsort(x_ms,kind='mergesort')
+		x_ms = x_ms[order]
+		data = {key:np.asarray(data[key])[order] for key in data}
+	full_data[site_ID] = data
+	full_x[site_ID] = x_ms
+	full_shown[site_ID] = None
+	if flag_mode!='' and not public and len(x_ms)!=0:
+		full_shown[site_ID] = np.asarray(flag_values(np.asarray(data['flag'])))==int(flag_mode)
+	reset_stats(site_ID)
+
+	extent = None
+	if len(x_ms)!=0:
+		extent = (x_ms[0],x_ms[-1])
+
+	if extent is not None and extent==data_extent[site_ID]:
+		show_view(site_source,decimate(data,x_ms,fig.x_range.start,fig.x_range.end,shown=full_shown[site_ID]))
+	else:
+		show_view(site_source,decimate(data,x_ms,shown=full_shown[site_ID]))
+		update_view_later()
+	data_extent[site_ID] = extent
+
+def update_view_later(attr=None,old=None,new=None):
+	'''
+	callback of the x_range changes, zooming or panning changes the range many times so the view is only updated if there was no other change after 300 ms
+	'''
+	view_change[0] += 1
+	doc.add_timeout_callback(partial(update_view,view_change[0]),300)
+
+def update_view(change_ID):
+	'''
+	updates the data sources with the data in the current x range of the figures
+	'''
+	if change_ID != view_change[0]: # the x_range changed again since this update was scheduled
+		return
+
+	site_sources = [(1,source)]
+	if layout_mode == 'comp':
+		site_sources += [(2,source2)]
+
+	for site_ID,site_source in site_sources:
+		if len(full_x[site_ID])!=0:
+			show_view(site_source,decimate(full_data[site_ID],full_x[site_ID],fig.x_range.start,fig.x_range.end,shown=full_shown[site_ID]))
+## END OF VIEW FUNCTIONS
+#########################################################################################################################################################################
+## STATISTICS FUNCTIONS
+# statistics of the loaded data used by center() to scale the y axes, they are computed once when the data is loaded instead of each time the center_button is clicked
+# keys are tuples of (site_ID,column), e.g. ((1,'y1'),) for the first variable of the first site, or ((1,'y1'),(2,'y1')) when both sites show the same variable
+column_stats = {}
+
+def good_values(site_ID,column):
+	'''
+	returns the flag=0 values of a column of the loaded data (all the values for public files), only the rows shown with the flag input are used
+	'''
+	data = full_data[site_ID]
+	if column not in data or len(data[column])==0:
+		return np.array([])
+	values = np.asarray(data[column]).astype(np.float64)
+	if not public:
+		keep = np.asarray(data['colo'])!=flag_color
+		if full_shown[site_ID] is not None:
+			keep &= full_shown[site_ID]
+		values = values[keep]
+	return values
+
+def scale_stats(current_data):
+	'''
+	returns the statistics used to scale a y axis on 'current_data' while disregarding outliers, or None if there is no data:
+		- 'N': number of values used for the scaling
+		- 'mean','std','min','max' of the values used for the scaling
+		- 'constant': True if all the values used for the scaling are the same
+	'''
+	if len(current_data)==0:
+		return None
+
+	negatives = current_data[current_data<0] # negative values in the data
+	positives = current_data[current_data>0] # positives values in the data
+	zeroes = current_data[current_data==0]
+
+	mean_current_data = np.mean(current_data)
+
+	# I tried to define some rules to obtain a good scaling in different situations
+	if len(zeroes)==len(current_data): # if all the data is exactly 0; it will be a constant
+		pass
+	elif len(zeroes)>0.1*len(current_data): # if more than 10% of the data is exactly 0, it might be a dummy value, so I don't include those
+		current_data = current_data[current_data!=0]
+	elif len(negatives)==0:
+		current_data = current_data[(current_data<1.5*mean_current_data) & (current_data>0.5*mean_current_data)] # resample the data to get within +/- 50% of the mean
+	elif len(positives)==0:
+		current_data = current_data[(current_data>1.5*mean_current_data) & (current_data<0.5*mean_current_data)] # resample the data to get within +/- 50% of the mean
+	elif 0.5<(len(positives)/len(negatives))<1.5:
+		current_data = current_data[(current_data<2*np.mean(positives)) & (current_data>2*np.mean(negatives))] # resample the data to get within +20% of the positive mean and +20% of the negative mean
+
+	if len(current_data)==0:
+		return None
+
+	return {	'N':len(current_data),
+				'mean':np.mean(current_data),
+				'std':np.std(current_data),
+				'min':np.min(current_data),
+				'max':np.max(current_data),
+				'constant':bool(np.all(current_data==current_data[0])),
+			}
+
+def get_stats(keys):
+	'''
+	returns the scale_stats() of the loaded data for the given tuple of (site_ID,column), computing them the first time they are asked for
+	'''
+	if keys not in column_stats:
+		column_stats[keys] = scale_stats(np.concatenate([good_values(site_ID,column) for site_ID,column in keys]))
+	return column_stats[keys]
+
+def reset_stats(site_ID):
+	'''
+	removes the statistics of a site_ID after its data changed, and computes the statistics of its new data
+	'''
+	for keys in [keys for keys in column_stats if site_ID in [key[0] for key in keys]]:
+		del column_stats[keys]
+	for column in ['y1','y2']:
+		if column in full_data[site_ID]:
+			get_stats(((site_ID,column),))
+## END OF STATISTICS FUNCTIONS
+#########################################################################################################################################################################
+## ADD_CACHE FUNCTION
+def add_cache(date_val,site,source_data,first_var='',second_var=''):
+	'''
+	This function will add data to the shared data_cache in order to make load time shorter.
+	Each array is cached separately under (date_val,site,variable); the least recently used arrays are removed when the cache is over cache_max_size
+	'''
+	for var in source_data:
+		if var not in ['colo','']:
+			nice_var = var
+			if var=='y1':
+				nice_var = first_var
+			elif var=='y2':
+				nice_var = second_var
+			data_cache.put(date_val,site,nice_var,source_data[var])
 ## END OF ADD_CACHE FUNCTION
 #########################################################################################################################################################################
 ## INITIALIZE FUNCTION
-def initialize(var_list,site_source,site_ID,reset=True):
+def initialize(var_list,site_source,site_ID,reset=True,clear=True):
 	'''
 	Function that fills the var_input widgets with options and resets the data source
 	Also sets up the hovertool tooltips according to the file type and mode
+	With clear=False the data source keeps the previous data until the new data is shown, so that only the columns that change are sent to the browser
 	'''
 	if site_ID == 1:
 		site_var_input = var_input
@@ -521,21 +671,18 @@ def initialize(var_list,site_source,site_ID,reset=True):
 
 	# configure the source and HoverTool based on the type of file
 	if reset:
+		empty_data = {key:[] for key in data_columns(public,layout_mode)}
 		if public and layout_mode=='simple':
-			site_source.data.update({'x':[],'y1':[],'colo':[]})
 			fig.select_one(HoverTool).tooltips = [(var_input.value,'@y1'),('date','@x{%F %T}')]
 			fig.select_one(HoverTool).formatters = {'x':'datetime'}
 		elif not public and layout_mode=='simple':
-			site_source.data.update({'x':[],'y1':[],'colo':[],'flag':[],'spectrum':[]})
 			fig.select_one(HoverTool).tooltips = [(var_input.value,'@y1'),('spectrum','@spectrum'),('flag','@flag'),('date','@x{%F %T}')]
 			fig.select_one(HoverTool).formatters = {'x':'datetime'}
 		elif public and layout_mode=='comp':
-			site_source.data.update({'x':[],'y1':[],'y2':[],'colo':[]})
 			fig.select_one(HoverTool).tooltips = [('y','@y1'),('Fig2 y','@y2'),('date','@x{%F %T}')]
 			fig2.select_one(HoverTool).tooltips = [('y','@y2'),('Fig1 y','@y1'),('date','@x{%F %T}')]
 			corfig.select_one(HoverTool).tooltips = [('y','@y1'),('x','@y2'),('date','@x{%F %T}')]
 		elif not public and layout_mode=='comp':
-			site_source.data.update({'x':[],'y1':[],'y2':[],'colo':[],'flag':[],'spectrum':[]})
 			fig.select_one(HoverTool).tooltips = [('y','@y1'),('spectrum','@spectrum'),('flag','@flag'),('Fig2 y','@y2'),('date','@x{%F %T}')]
 			fig2.select_one(HoverTool).tooltips = [('y','@y2'),('spectrum','@spectrum'),('flag','@flag'),('Fig1 y','@y1'),('date','@x{%F %T}')]
 			corfig.select_one(HoverTool).tooltips = [('y','@y1'),('x','@y2'),('spectrum','@spectrum'),('flag','@flag'),('date','@x{%F %T}')]
@@ -543,6 +690,14 @@ def initialize(var_list,site_source,site_ID,reset=True):
 		if layout_mode == 'comp':
 			for curfig in [fig,fig2,corfig]:
 				curfig.select_one(HoverTool).formatters = {'x':'datetime'}
+
+		if clear:
+			site_source.data.update(empty_data)
+			data_extent[site_ID] = None
+		full_data[site_ID] = empty_data
+		full_x[site_ID] = np.array([])
+		full_shown[site_ID] = None
+		reset_stats(site_ID)
 ## END OF INITIALIZE FUNCTION
 #########################################################################################################################################################################
 ## SET_SITE FUNCTION
@@ -577,7 +732,6 @@ def set_site(site='',site_ID=0):
 		return
 	
 	prefix = [key for key in T_FULL if T_FULL[key]==site][0] # TCCON 2 letters abbreviation of the site
-	site_file_list = sorted([i for i in tccon_file_list if prefix in i]) # a list of the associated files
 
 	if layout_mode=='comp' and site_ID==1:
 		corfig = fig3
@@ -622,7 +776,7 @@ def set_site(site='',site_ID=0):
 
 		notes_div.text = notes.replace("a></font>","a></font>, <a href='"+T_site[prefix]+"'>"+site+"</a>") # updated the information widget with a link to the site's webpage
 
-	load_var(site_file_list,site,site_source,site_ID,mode="set_site")
+	load_var(site,site_source,site_ID,mode="set_site")
 ## END OF SET_SITE FUNCTION
 #########################################################################################################################################################################
 ## SET_VAR FUNCTION
@@ -640,9 +794,6 @@ def set_var(site='',site_ID=0):
 		initialize([],site_source,site_ID)
 		return
 
-	prefix = [key for key in T_FULL if T_FULL[key]==site][0] # TCCON 2 letters abbreviation of the site
-	site_file_list = sorted([i for i in tccon_file_list if prefix in i]) # a list of the associated files
-
 	fig.yaxis[0].axis_label = var_input.value
 	if layout_mode == 'comp':
 			fig.yaxis[1].axis_label = var_input3.value
@@ -658,7 +809,7 @@ def set_var(site='',site_ID=0):
 			fig4.yaxis[0].axis_label = var_input3.value
 			fig4.xaxis[0].axis_label = var_input4.value
 	
-	load_var(site_file_list,site,site_source,site_ID,mode="set_var")
+	load_var(site,site_source,site_ID,mode="set_var")
 ## END OF SET_VAR FUNCTION
 #########################################################################################################################################################################
 ## DUPLICATE_VAR FUNCTION
@@ -743,16 +894,48 @@ def load_data():
 ## END OF LOAD_DATA FUNCTION
 #########################################################################################################################################################################
 ## LOAD_VAR FUNCTION
-def load_var(site_file_list,site,site_source,site_ID,mode=""):
+loading = {} # progress of the loads running in worker threads, keyed by site_ID
+load_count = {1:0,2:0} # number of loads started for each site_ID, a load only updates its data source if no other load was started after it
+status_updates = [False] # True while update_status() is scheduled
+recent_vars = {} # the last variables loaded for each site, from the least to the most recently used
+
+def no_data_message(site,date_val,flag_mode):
+	'''
+	status text when there is no data for the inputs
+	'''
+	add_flag_message = ''
+	if flag_mode != '':
+		add_flag_message = ' with flag='+flag_mode
+	if date_val=='': # date_val empty mean the whole time range of the site has been evaluated
+		return site+' has no data'+add_flag_message # if you see this one then there is a problem with the netcdf file ...
+	elif len(date_val)==8: # if only 'firstdate' is given
+		return site+' has no data'+add_flag_message+' after '+date_val
+	else: # if 'firstdate-lastdate' is given
+		return site+' has no data'+add_flag_message+' for '+date_val
+
+def update_status():
+	'''
+	shows the progress of the running loads in the 'status_div', it reschedules itself until all loads are done
+	'''
+	if len(loading)==0:
+		status_updates[0] = False
+		return
+
+	status_div.text = '<br>'.join(['Loading {}: {}/{} files, {:.1f} s'.format(progress['site'],progress['files'],progress['nfiles'],time.time()-progress['start']) for site_ID,progress in sorted(loading.items())])
+	doc.add_timeout_callback(update_status,200)
+
+def load_var(site,site_source,site_ID,mode=""):
 	'''
 	Function called by set_site() and set_var() to load the variables matching site,variable, and date inputs
+	Data that is not cached is read by read_var() in a worker thread so that the server can keep answering other callbacks and sessions
 	'''
 
-	global cache_dic, all_var
+	global all_var
 
 	if site_ID==1:
 		no_flag_color = main_color
 		first_var = var_input.value
+		second_var = ''
 		if layout_mode == 'comp':
 			second_var = var_input2.value
 	elif site_ID==2:
@@ -762,7 +945,8 @@ def load_var(site_file_list,site,site_source,site_ID,mode=""):
 
 	date_val = date_input.value # can be of the form 'firstdate'-'lastdate' or just 'firstdate'
 
-	dum_text.value = str(time.time()) # click the timer button to start the loading countdown in the 'status_div' widget
+	prefix = [key for key in T_FULL if T_FULL[key]==site][0] # TCCON 2 letters abbreviation of the site
+	site_entry = site_index[prefix] # files, variables, and times of the site
 
 	filled_site_inputs = False
 	if layout_mode == 'simple':
@@ -772,269 +956,269 @@ def load_var(site_file_list,site,site_source,site_ID,mode=""):
 		if '' not in [first_var,second_var]:
 			filled_site_inputs = True
 
-	# check if there already is cached data that matches the inputs
-	no_cached_data = False
-	try:
-		type(cache_dic[date_val][site][first_var])
-	 	if layout_mode == 'comp':
-	 		type(cache_dic[date_val][site][second_var])
-	except KeyError:
-		no_cached_data = True
+	if filled_site_inputs and mode != 'set_site':
+		site_recent_vars = recent_vars.setdefault(site,[])
+		for var in [first_var,second_var]:
+			if var in site_recent_vars:
+				site_recent_vars.remove(var)
+			if var != '':
+				site_recent_vars.append(var)
+		del site_recent_vars[:-10] # only keep the last 10 variables
 
-	if cache_max_size == 0:
-		no_cached_data = True
+	# check if there already is cached data that matches the inputs
+	cache_var_list = ['x',first_var]
+	if layout_mode == 'comp':
+		cache_var_list += [second_var]
+	if not public:
+		cache_var_list += ['flag','spectrum']
+	cached = data_cache.get(date_val,site,cache_var_list) # None if any of the variables is not cached
+	no_cached_data = cached is None
 
+	flag_mode = ''
 	if not public:
 		flag_mode = flag_input.value
 		if flag_mode != '':
 			if not float(flag_mode).is_integer():
-				dum_text.value = str(time.time()+2) # click the timer button to start the loading countdown in the 'status_div' widget
-				time.sleep(0.1)
 				status_div.text = "The flag should be an integer"
 				return
 
-	if no_cached_data or mode=='set_site':
-		# loop over the TCCON files for the selected site
-		for filenum,site_file in enumerate(site_file_list):
-			if netcdf:
-				f = netCDF4.Dataset(os.path.join(data_folder,site_file),'r') # netcdf file reader
-				all_var = [var for var in f.variables if 'run' not in var]
-			else:
-				df = pd.read_csv(os.path.join(data_folder,site_file),header=2) # read the .eof.csv file
-				all_var = [var for var in list(df) if 'run' not in var]
-
-			# setup some initializations if it is the first file
-			if filenum==0:		
-				if not filled_site_inputs:
-					initialize(all_var,site_source,site_ID,reset=False) # fills variable inputs with options, does not reset the data source
-					dum_text.value = str(time.time()+3) # click the timer button again to stop the loading countdown in the 'status_div' widget
-					time.sleep(0.1)
-					status_div.text = '<font color="{}"><b>{}</b></font> still has an empty variable input'.format(no_flag_color,site)
-					return
-				if mode == 'set_site':
-					initialize(all_var,site_source,site_ID,reset=False) # fills variable inputs with options, does not reset the data source
-					dum_text.value = str(time.time()+7) # click the timer button again to stop the loading countdown in the 'status_div' widget
-					time.sleep(0.1)
-					status_div.text = 'Data ready to load'
-					return
-				
-				initialize(all_var,site_source,site_ID) # fills variable inputs with options,resets the data source, and setup hovertool tooltips
-				save_data = {key:[] for key in site_source.data}
-				new_data = {key:[] for key in site_source.data}					
-	
-			if netcdf:
-				nctime =  f.variables['time'][:] # fractional days since 1970
-			else:			
-				# for .eof.csv files convert year,day,hour in fractional days since 1970
-				nctime = np.array([(datetime(int(df.year[i]),1,1)+timedelta(days=df.day[i]-1)-datetime(1970,1,1)).days+df.hour[i]/24 for i in range(len(df))])
-
-			# use the value of the 'date_input' widget to determine the range of dates over which data should be fetched
-			try: # for the minimum of the range
-				# if the 'date_input' widget is empty, this will raise an exception
-				mindate = datetime.strptime(date_val.split('-')[0],'%Y%m%d') # if the date is entered wrong, this will raise an exception
-			except: # catch all exceptions
-				mindate = datetime(1970,1,1) # if an exception has been caught, just use a very early date
-
-			try: # for the maximum of the range 
-				# if the 'date_input' widget is empty, or if only the minimum date is given, this will raise an exception
-				maxdate = datetime.strptime(date_val.split('-')[1],'%Y%m%d') # if the date is entered wrong, this will raise an exception
-			except: # catch all exceptions
-				maxdate = datetime(2050,1,1) # if an exception has been caught, just use a very late date
-
-			# perform a quick check on date ranges based on file names to avoid looping over files for nothing
-			if filenum==0:
-				mindate_list = []
-				maxdate_list = []
-				for site_file in site_file_list:
-					mindate_list.append( datetime.strptime(site_file[2:10],'%Y%m%d') )
-					maxdate_list.append( datetime.strptime(site_file[11:19],'%Y%m%d') )
-
-				all_file_min_date = min(mindate_list)		# minimum YYYYMMDD of all files
-				all_file_max_date = max(maxdate_list)	# maximum YYYYMMDD of all files
-
-				# break out of the for loop if min or max dates from the file names are not compatible with the date input
-				if (mindate>all_file_max_date) or (maxdate<all_file_min_date):
-					dum_text.value = str(time.time()+3) # click the timer button to start the loading countdown in the 'status_div' widget
-					time.sleep(0.1)
-					status_div.text = site +' date range: '+all_file_min+'-'+all_file_max
-					if netcdf:
-						f.close() # close the netcdf reader
-					return
-				if mindate>maxdate:
-					dum_text.value = str(time.time()+3) # click the timer button to start the loading countdown in the 'status_div' widget
-					time.sleep(0.1)
-					status_div.text = 'Wrong date input'
-					if netcdf:
-						f.close() # close the netcdf reader
-					return
-
-			# for each file, fastforward to next iteration of the for loop if the dates in the file name are not compatible with the date input
-			file_min_date = datetime.strptime(site_file[2:10],'%Y%m%d')
-			file_max_date = datetime.strptime(site_file[11:19],'%Y%m%d')
-			if (mindate>file_max_date) or (maxdate<file_min_date):
-				if netcdf:
-					f.close() # close the netcdf reader
-				continue
-
-			mindate = calendar.timegm(mindate.timetuple())/24/3600
-			maxdate = calendar.timegm(maxdate.timetuple())/24/3600
+	all_var = site_entry['variables']
 
-			newtime = nctime[(nctime>=mindate) & (nctime<maxdate)] # list of times that satisfy the 'date_input' value (still fractional days since 1970)
+	if no_cached_data or mode=='set_site':
+		if not filled_site_inputs:
+			initialize(all_var,site_source,site_ID,reset=False) # fills variable inputs with options, does not reset the data source
+			status_div.text = '<font color="{}"><b>{}</b></font> still has an empty variable input'.format(no_flag_color,site)
+			return
+		if mode == 'set_site':
+			initialize(all_var,site_source,site_ID,reset=False) # fills variable inputs with options, does not reset the data source
+			status_div.text = 'Data ready to load'
+			return
 
-			# check that there is actual data in the time range, if not, go to the next (next iteration in for loop)
-			if len(newtime)==0:
-				continue
+		# use the value of the 'date_input' widget to determine the range of dates over which data should be fetched
+		try: # for the minimum of the range
+			# if the 'date_input' widget is empty, this will raise an exception
+			mindate = datetime.strptime(date_val.split('-')[0],'%Y%m%d') # if the date is entered wrong, this will raise an exception
+		except: # catch all exceptions
+			mindate = datetime(1970,1,1) # if an exception has been caught, just use a very early date
+
+		try: # for the maximum of the range 
+			# if the 'date_input' widget is empty, or if only the minimum date is given, this will raise an exception
+			maxdate = datetime.strptime(date_val.split('-')[1],'%Y%m%d') # if the date is entered wrong, this will raise an exception
+		except: # catch all exceptions
+			maxdate = datetime(2050,1,1) # if an exception has been caught, just use a very late date
+
+		mindate = calendar.timegm(mindate.timetuple())/24/3600
+		maxdate = calendar.timegm(maxdate.timetuple())/24/3600
+
+		# perform a quick check on date ranges based on file names to avoid looking for data for nothing
+		if (mindate>site_entry['max_day']) or (maxdate<site_entry['min_day']):
+			status_div.text = site +' date range: '+site_entry['min_date']+'-'+site_entry['max_date']
+			return
+		if mindate>maxdate:
+			status_div.text = 'Wrong date input'
+			return
 
-			start_id = np.where(nctime==newtime[0])[0][0] # ID of the starting time in the full time list of the file
-			end_id = np.where(nctime==newtime[-1])[0][0]+1 # ID of the end time in the full time list of the file
+		initialize(all_var,site_source,site_ID,clear=False) # fills variable inputs with options,resets the data source, and setup hovertool tooltips
 
-			try: # attempt to fetch data using start_id and end_id
-				add_x = np.array([datetime(*time.gmtime(i*24*3600)[:6]) for i in nctime[start_id:end_id]])
-				if netcdf:
-					add_y1 = f.variables[first_var][start_id:end_id]
-					add_y2 = ''
-					if layout_mode == 'comp':
-						add_y2 = f.variables[second_var][start_id:end_id]
+		# start reading the files in a worker thread; the document models are only modified in finish_load(), which is called by the server thread
+		file_slices = time_slices(site_entry,mindate,maxdate)
+		load_count[site_ID] += 1
+		progress = {'site':site,'files':0,'nfiles':len(file_slices),'start':time.time()}
+		loading[site_ID] = progress
+		if not status_updates[0]:
+			status_updates[0] = True
+			update_status()
 
-				else:
-					add_y1 = np.array(df[first_var][start_id:end_id])
-					add_y2 = ''
-					if layout_mode == 'comp':
-						add_y2 = np.array(df[second_var][start_id:end_id])
-
-				if not public:
-					if netcdf:
-						add_spectrum = np.array([''.join(elem) for elem in f.variables['spectrum'][start_id:end_id]])# name of spectra for the HoverTool
-						add_flag = f.variables['flag'][start_id:end_id].astype(int) # flags for the HoverTool
-					else:
-						add_spectrum = np.array([elem for elem in df['spectrum'][start_id:end_id]])
-						add_flag = np.array([' '.join([str(flag),all_var[flag],'=',str(df[all_var[flag]][start_id:end_id][ID])]) for ID,flag in enumerate(df['flag'][start_id:end_id])])
-				else:
-					add_spectrum = ''
-					add_flag = ''
-			except KeyError:
-				print 'KeyError'
-			else: # if the try didnt raise any exceptions, update the 'source' of the plots with new data
-				if not public:
-					if netcdf:
-						add_colo = np.array([no_flag_color if int(elem)==0 else flag_color for elem in add_flag])
-					else:
-						add_colo = np.array([no_flag_color if int(elem.split()[0])==0 else flag_color for elem in add_flag])
-
-					save_data = add_data(save_data,x=add_x,y1=add_y1,y2=add_y2,colo=add_colo,flag=add_flag,spectrum=add_spectrum)
-
-					if flag_mode != '':
-						if netcdf:
-							inds = add_flag==int(flag_mode)
-						else:
-							inds = [flag_mode==elem.split()[0] for elem in add_flag]
-						add_x = add_x[inds]
-						add_y1 = add_y1[inds]
-						add_colo = add_colo[inds]
-						add_spectrum = add_spectrum[inds]
-						add_flag = add_flag[inds]
-						if layout_mode == 'comp':
-							add_y2 = add_y2[inds]
-
-						if True not in inds:
-							continue
-
-				elif public:
-					add_colo = np.array([no_flag_color]*len(add_x))
-					save_data = add_data(save_data,x=add_x,y1=add_y1,y2=add_y2,colo=add_colo,flag=add_flag,spectrum=add_spectrum)
-
-				new_data = add_data(new_data,x=add_x,y1=add_y1,y2=add_y2,colo=add_colo,flag=add_flag,spectrum=add_spectrum)					
-
-				if filenum == 0:
-					print 'load_var() ...'
-				print site_file,'data read:',len(add_x),'new values'
-			if netcdf:
-				f.close() # close the netcdf reader		
-		else: # else clause of the for loop, this will execute if no 'break' was encountered
-			print 'Updating',site,'data source ...'
-			site_source.data.update(new_data)
-			del new_data			
-			if len(site_source.data['x'])==0: # no data
-				add_flag_message = ''
-				if flag_mode != '':
-					add_flag_message = ' with flag='+flag_mode
-				dum_text.value = str(time.time()+8) # click the timer button again to end the loading countdown
-				time.sleep(0.1)
-				if date_val=='': # date_val empty mean the whole time range of the site has been evaluated
-					status_div.text = site+' has no data'+add_flag_message # if you see this one then there is a problem with the netcdf file ...
-				elif len(date_val)==8: # if only 'firstdate' is given
-					status_div.text = site+' has no data'+add_flag_message+' after '+date_val
-				elif len(date_val)>8: # if 'firstdate-lastdate' is given
-					status_div.text = site+' has no data'+add_flag_message+' for '+date_val
-				return
-			print site,'data source updated:',len(site_source.data['x']),'values'
-		if len(site_source.data['y1'])!=0 and cache_max_size!=0:
-			if layout_mode == 'simple':
-				add_cache(date_val,site,save_data,first_var=first_var)
-			elif layout_mode == 'comp':
-				add_cache(date_val,site,save_data,first_var=first_var,second_var=second_var)
+		print 'load_var() ...'
+		dataset_pool.start_load() # prefetching in all the sessions stops until read_var() has read the files
+		worker = Thread(target=read_var,args=(site,site_ID,site_source,load_count[site_ID],progress,file_slices,all_var,first_var,second_var,flag_mode,no_flag_color,date_val))
+		worker.daemon = True
+		worker.start()
 
 	else: # else clause of 'if no_cached_data', this will execute if there is cached data corresponding to the inputs
-		initialize(all_var,site_source,site_ID) # fills variable inputs with options,resets the data site_source, and setup hovertool tooltips
+		initialize(all_var,site_source,site_ID,clear=False) # fills variable inputs with options,resets the data site_source, and setup hovertool tooltips
 		if not filled_site_inputs:
-			dum_text.value = str(time.time()+1) # click the timer button to start the loading countdown in the 'status_div' widget
-			time.sleep(0.1)
+			set_full_data(site_ID,site_source,full_data[site_ID]) # removes the previous data
 			status_div.text = site+' still has an empty variable input'
 			return
 
 		if not public:
-			if netcdf:
-				new_colo = np.array([no_flag_color if int(elem)==0 else flag_color for elem in cache_dic[date_val][site]['flag']['value']])
-			else:
-				new_colo = np.array([no_flag_color if int(elem.split()[0])==0 else flag_color for elem in cache_dic[date_val][site]['flag']['value']])
+			int_flag = flag_values(cached['flag'])
+			new_colo = np.where(int_flag==0,no_flag_color,flag_color)
 		
-			if flag_mode != '':
-				if netcdf:
-					inds = cache_dic[date_val][site]['flag']['value']==int(flag_mode)
-				else:
-					inds = [flag_mode==elem.split()[0] for elem in cache_dic[date_val][site]['flag']['value']]
-
-				if True not in inds:
-					dum_text.value = str(time.time()+5) # click the timer button again to end the loading countdown
-					time.sleep(0.1)
-					add_flag_message = ' with flag='+flag_mode
-					if date_val=='': # date_val empty mean the whole time range of the site has been evaluated
-						status_div.text = site+' has no data'+add_flag_message # if you see this one then there is a problem with the netcdf file ...
-					elif len(date_val)==8: # if only 'firstdate' is given
-						status_div.text = site+' has no data'+add_flag_message+' after '+date_val
-					elif len(date_val)>8: # if 'firstdate-lastdate' is given
-						status_div.text = site+' has no data'+add_flag_message+' for '+date_val
-					return
-			else:
-				inds = [True for elem in cache_dic[date_val][site]['flag']['value']]
+			if flag_mode != '' and not (int_flag==int(flag_mode)).any():
+				load_count[site_ID] += 1
+				loading.pop(site_ID,None)
+				set_full_data(site_ID,site_source,full_data[site_ID]) # removes the previous data
+				status_div.text = no_data_message(site,date_val,flag_mode)
+				return
 
-			add_x = cache_dic[date_val][site]['x'][inds]
-			add_y1 = cache_dic[date_val][site][first_var]['value'][inds]
-			add_colo = new_colo[inds]
-			add_flag = cache_dic[date_val][site]['flag']['value'][inds]
-			add_spectrum = cache_dic[date_val][site]['spectrum']['value'][inds]
+			# all the rows are kept, the rows with other flags are hidden by set_full_data()
+			add_x = cached['x']
+			add_y1 = cached[first_var]
+			add_colo = new_colo
+			add_flag = cached['flag']
+			add_spectrum = cached['spectrum']
 			add_y2 = ''
 			if layout_mode == 'comp':
-				add_y2 = cache_dic[date_val][site][second_var]['value'][inds]
+				add_y2 = cached[second_var]
 		
 		elif public:
-			add_x = cache_dic[date_val][site]['x']
-			add_y1 = cache_dic[date_val][site][first_var]['value']
-			add_colo = np.array([no_flag_color]*len(cache_dic[date_val][site]['x']))
+			add_x = cached['x']
+			add_y1 = cached[first_var]
+			add_colo = np.repeat(no_flag_color,len(cached['x']))
 			add_flag = ''
 			add_spectrum = ''
 			add_y2 = ''
 			if layout_mode == 'comp':
-				add_y2 = cache_dic[date_val][site][second_var]['value']
+				add_y2 = cached[second_var]
 
 		print 'load_var() ...'
 		print 'Using cached data for',date_val,site
-		site_source.data.update(add_data(site_source.data,x=add_x,y1=add_y1,y2=add_y2,colo=add_colo,flag=add_flag,spectrum=add_spectrum))
+		load_count[site_ID] += 1 # a load of this site that is still running in a worker thread will not overwrite the cached data
+		loading.pop(site_ID,None)
+		set_full_data(site_ID,site_source,add_data(full_data[site_ID],x=add_x,y1=add_y1,y2=add_y2,colo=add_colo,flag=add_flag,spectrum=add_spectrum),flag_mode=flag_mode)
+		status_div.text = 'Data loaded'
+		print 'load_var() DONE'
+
+def read_csv_column(files,path,var,start_id=None,end_id=None):
+	'''
+	returns the values of 'var' in the .eof.csv file at 'path' between start_id and end_id
+	'files' keeps the last file that was read, so that each file of a load is only parsed once
+	'''
+	if path not in files:
+		files.clear()
+		files[path] = pd.read_csv(path,header=2)
+	return np.array(files[path][var].values[start_id:end_id])
+
+def read_var(site,site_ID,site_source,load_ID,progress,file_slices,all_var,first_var,second_var,flag_mode,no_flag_color,date_val):
+	'''
+	Reads the (file,start_id,end_id,times) slices of the site files, it runs in a worker thread started by load_var()
+	It must not modify the document models, the new data is given to finish_load() with doc.add_next_tick_callback
+	'''
+	new_data = {key:[] for key in data_columns(public,layout_mode)} # the rows with other flags than the flag input are hidden by set_full_data()
+	if netcdf:
+		read = dataset_pool.read # netcdf files are read from the pool shared by all sessions, they stay open after the load
+	elif eof_columns:
+		read = read_column # only the needed columns and records are read from the memory mapped columns
+	else:
+		read = partial(read_csv_column,{})
+
+	try:
+		# loop over the TCCON files of the selected site that have data in the date range; start_id and end_id are the IDs of the first and last+1 matching times in each file
+		for site_file,start_id,end_id,file_time in file_slices:
+			progress['files'] += 1
+			try: # attempt to fetch data using start_id and end_id
+				file_data = read_file(read,os.path.join(data_folder,site_file),start_id,end_id,file_time,list(new_data),first_var,second_var,all_var,netcdf,no_flag_color,flag_color)
+			except KeyError:
+				print 'KeyError'
+			else: # if the try didnt raise any exceptions, add the new data
+				new_data = {key:append_column(new_data[key],file_data[key]) for key in new_data}
+				print site_file,'data read:',len(file_data['x']),'new values'
+
+		if len(new_data['x'])!=0 and cache_max_size!=0:
+			add_cache(date_val,site,new_data,first_var=first_var,second_var=second_var)
+	except Exception as error: # report unexpected errors in the 'status_div' instead of leaving the load running
+		print 'Error while loading',site,':',repr(error)
+		new_data = None
+	dataset_pool.end_load()
+		
+	doc.add_next_tick_callback(partial(finish_load,site,site_ID,site_source,load_ID,new_data,date_val,flag_mode))
+
+	if new_data is not None:
+		prefetch(site,site_ID,load_ID,file_slices,all_var,first_var,second_var,date_val,len(new_data['x']))
+
+def finish_load(site,site_ID,site_source,load_ID,new_data,date_val,flag_mode):
+	'''
+	Updates the data source with the data read by read_var(), it is called by the server thread
+	'''
+	if load_ID != load_count[site_ID]: # another load was started for this site_ID since this one started
+		return
+
+	progress = loading.pop(site_ID)
+
+	if new_data is None:
+		set_full_data(site_ID,site_source,full_data[site_ID]) # removes the previous data
+		status_div.text = 'Could not load '+site+' data, see the server output'
+		return
 
-	if len(site_source.data['x'])!=0:
-		dum_text.value = str(time.time()+6) # click the timer button again to end the loading countdown
-		print 'If all the data is not showing quickly, you should use the date_input widget to select a smaller subset of data'
+	if len(new_data['x'])!=0 and flag_mode!='' and not public and not (np.asarray(flag_values(np.asarray(new_data['flag'])))==int(flag_mode)).any(): # no data with the flag input
+		new_data = full_data[site_ID] # removes the previous data
+
+	print 'Updating',site,'data source ...'
+	set_full_data(site_ID,site_source,new_data,flag_mode=flag_mode)
+	if len(new_data['x'])==0: # no data
+		status_div.text = no_data_message(site,date_val,flag_mode)
+	else:
+		print site,'data source updated:',len(new_data['x']),'values'
+		if len(loading)==0:
+			status_div.text = 'Data loaded: {:.1f} s'.format(time.time()-progress['start'])
 	print 'load_var() DONE'
+
+def read_slices(file_slices,var):
+	'''
+	returns the values of 'var' in the (file,start_id,end_id,times) slices of the netcdf files or columnar stores
+	it is only used for background reads: it returns None as soon as a user load is running in any session
+	'''
+	values = []
+	for site_file,start_id,end_id,file_time in file_slices:
+		if dataset_pool.user_loads!=0:
+			return None
+		if netcdf:
+			add_values = dataset_pool.read_background(os.path.join(data_folder,site_file),var,start_id,end_id)
+			if add_values is None:
+				return None
+			values = append_column(values,add_values)
+		else:
+			values = append_column(values,read_column(os.path.join(data_folder,site_file),var,start_id,end_id))
+	return values
+
+def slices_nbytes(file_slices,var):
+	'''
+	returns the size in bytes of the values of 'var' in the (file,start_id,end_id,times) slices of the netcdf files or columnar stores, without reading them
+	'''
+	nbytes = 0
+	for site_file,start_id,end_id,file_time in file_slices:
+		if netcdf:
+			nbytes += dataset_pool.nbytes(os.path.join(data_folder,site_file),var,start_id,end_id)
+		else:
+			nbytes += column_nbytes(os.path.join(data_folder,site_file),var,start_id,end_id)
+	return nbytes
+
+def prefetch(site,site_ID,load_ID,file_slices,all_var,first_var,second_var,date_val,n_values):
+	'''
+	Reads variables that are likely to be loaded next for the same site and dates, and adds them to the cache; it runs in the worker thread of a load, after the loaded data is given to finish_load()
+		- the _error variables of the loaded variables
+		- the most recently used variables of the site
+	At most prefetch_max_size bytes are read (and not more than the size of the cache), the size of each variable is known before reading it
+	It stops as soon as a user load is started in any session
+	'''
+	if prefetch_max_size==0 or cache_max_size==0 or n_values==0 or not (netcdf or eof_columns): # reading a variable from .eof.csv files would read the whole files again
+		return
+
+	var_list = [var+'_error' for var in [first_var,second_var] if var!=''] + recent_vars.get(site,[])[::-1]
+	var_list = [var for i,var in enumerate(var_list) if var in all_var and var not in [first_var,second_var]+var_list[:i]]
+
+	max_size = min(prefetch_max_size,cache_max_size)
+	size = 0
+	for var in var_list:
+		if load_ID != load_count[site_ID] or dataset_pool.user_loads!=0: # a new load was started, do not slow it down
+			return
+		if data_cache.get(date_val,site,[var]) is not None: # already cached
+			continue
+		try:
+			var_size = slices_nbytes(file_slices,var)
+			if size+var_size>max_size: # try the next variables, they may be smaller
+				continue
+			values = read_slices(file_slices,var)
+		except (KeyError,IOError): # the variable is not in all the files
+			continue
+		if values is None: # a user load was started
+			return
+		size += var_size
+		if len(values)==n_values:
+			data_cache.put(date_val,site,var,values)
+			print 'Prefetched',var,'for',date_val,site
 ## END OF LOAD_VAR FUNCTION
 #########################################################################################################################################################################
 ## INPUT WIDGETS CALLBACKS SECTION
@@ -1067,6 +1251,10 @@ if layout_mode == 'comp':
 	fig3.select_one(BoxSelectTool).callback = CustomJS(args={'txt':select_div},code = corfig_box_select_code)
 	fig4.select_one(BoxSelectTool).callback = CustomJS(args={'txt':select_div},code = corfig_box_select_code)
 
+# update the decimated data sources when zooming or panning
+fig.x_range.on_change('start',update_view_later)
+fig.x_range.on_change('end',update_view_later)
+
 ## END OF INPUT WIDGETS CALLBACKS SECTION
 #########################################################################################################################################################################
 ## CENTER FUNCTION
@@ -1087,49 +1275,26 @@ def center():
 	elif layout_mode =='simple':
 		var_list = [var_input.value]
 
-	# get all the data sources in a list
-	if not public:
-		data_list = []
-		if layout_mode == 'comp':
-			if var_input.value=='':
-				data_list = [	np.array(source2.data['y1'])[np.array(source2.data['colo'])!=flag_color].astype(np.float),
-								np.array(source2.data['y2'])[np.array(source2.data['colo'])!=flag_color].astype(np.float),
-								np.array(source2.data['y1'])[np.array(source2.data['colo'])!=flag_color].astype(np.float),
-								np.array(source2.data['y2'])[np.array(source2.data['colo'])!=flag_color].astype(np.float),]
-			elif var_input3.value=='':
-				data_list = [	np.array(source.data['y1'])[np.array(source.data['colo'])!=flag_color].astype(np.float),
-								np.array(source.data['y2'])[np.array(source.data['colo'])!=flag_color].astype(np.float),
-								np.array(source.data['y1'])[np.array(source.data['colo'])!=flag_color].astype(np.float),
-								np.array(source.data['y2'])[np.array(source.data['colo'])!=flag_color].astype(np.float),]
-			else:
-				data_list = [	np.array(source.data['y1'])[np.array(source.data['colo'])!=flag_color].astype(np.float),
-								np.array(source.data['y2'])[np.array(source.data['colo'])!=flag_color].astype(np.float),
-								np.array(source2.data['y1'])[np.array(source2.data['colo'])!=flag_color].astype(np.float),
-								np.array(source2.data['y2'])[np.array(source2.data['colo'])!=flag_color].astype(np.float),]
-	else:
-		data_list = [np.array(source.data['y1'])]
-		if layout_mode == 'comp':
-			data_list += [	np.array(source.data['y2']),
-							np.array(source2.data['y1']),
-							np.array(source2.data['y2']),]
+	# (site_ID,column) of the data shown on each y axis
+	# ID = 0 ; left Y axis of the first figure
+	# ID = 1 ; left Y axis of the second figure
+	# ID = 2 ; right Y axis of the first figure
+	# ID = 3 ; right Y axis of the second figure
+	axis_keys = [((1,'y1'),),((1,'y2'),),((2,'y1'),),((2,'y2'),)]
 
-	for ID,current_data in enumerate(data_list): # loop over the data sources
-		# ID = 0 ; left Y axis of the first figure
-		# ID = 1 ; left Y axis of the second figure
-		# ID = 2 ; right Y axis of the first figure
-		# ID = 3 ; right Y axis of the second figure
+	for ID in range(len(var_list)): # loop over the y axes
 
 		if var_list[ID]=='': # if no variable is selected, go to next iteration of the for loop
 			continue
 
-		# in 'comp' mode, if the variable is the same on both y axes of a figure, add the two sites data sources before doing the scaling calculations
+		# in 'comp' mode, if the variable is the same on both y axes of a figure, use the two sites data for the scaling
 		if layout_mode == 'comp':
 			if ID==0 and var_input.value==var_input3.value: # if the y axes of the first figure show the same variable
-				current_data = np.append(current_data,data_list[2])
+				axis_keys[0] = ((1,'y1'),(2,'y1'))
 			elif ID==1 and var_input2.value==var_input4.value: # if the y axes of the second figure show the same variable
-				current_data = np.append(current_data,data_list[3])
+				axis_keys[1] = ((1,'y2'),(2,'y2'))
 
-			# if the two sites data sources have been added together, the scaling has already been done with the first y axis, so make the second y axis range equal to the first
+			# if the two sites data have been used together, the scaling has already been done with the first y axis, so make the second y axis range equal to the first
 			elif ID==2 and var_input.value==var_input3.value: # if the y axes of the first figure show the same variable
 				min_y = fig.y_range.start
 				max_y = fig.y_range.end
@@ -1147,63 +1312,42 @@ def center():
 				fig4.x_range.end = max_y
 				continue
 
-		negatives = current_data[current_data<0] # negative values in the data
-		positives = current_data[current_data>0] # positives values in the data
-		zeroes = current_data[current_data==0]
-
-		mean_current_data = np.mean(current_data)
+		stats = get_stats(axis_keys[ID]) # computed when the data was loaded
 
-		try:
-			# I tried to define some rules to obtain a good scaling in different situations
-			if len(zeroes)==len(current_data): # if all the data is exactly 0; the constant variable exception will handle it
- 				pass
- 			elif len(zeroes)>0.1*len(current_data): # if more than 10% of the data is exactly 0, it might be a dummy value, so I don't include those
- 				current_data = current_data[current_data!=0]
-			elif len(negatives)==0:
-				current_data = current_data[(current_data<1.5*mean_current_data) & (current_data>0.5*mean_current_data)] # resample the data to get within +/- 50% of the mean
-			elif len(positives)==0:
-				current_data = current_data[(current_data>1.5*mean_current_data) & (current_data<0.5*mean_current_data)] # resample the data to get within +/- 50% of the mean
-			elif 0.5<(len(positives)/len(negatives))<1.5:
-				current_data = current_data[(current_data<2*np.mean(positives)) & (current_data>2*np.mean(negatives))] # resample the data to get within +20% of the positive mean and +20% of the negative mean
-
-			if list(current_data).count(current_data[0])!=len(current_data): # if the variable is not a constant, start calculations
-
-				min_y = min(current_data)
-				max_y = max(current_data)
-
-				ampli = (max_y-min_y)/10
-
-				min_y = min_y - ampli
-				max_y = max_y + ampli
-
-				if ID == 0:
-					fig.y_range.start = min_y
-					fig.y_range.end = max_y
-					if layout_mode == 'comp':
-						fig3.y_range.start = min_y
-						fig3.y_range.end = max_y
-
-				elif ID == 1: # only happens when mode==comp
-					fig2.y_range.start = min_y
-					fig2.y_range.end = max_y				
-					fig3.x_range.start = min_y
-					fig3.x_range.end = max_y
-
-				elif ID ==2: # only happens when mode==comp
-					fig.extra_y_ranges['first_var'].start = min_y
-					fig.extra_y_ranges['first_var'].end = max_y
-					fig4.y_range.start = min_y
-					fig4.y_range.end = max_y
-				
-				elif ID ==3: # only happens when mode==comp
-					fig2.extra_y_ranges['second_var'].start = min_y
-					fig2.extra_y_ranges['second_var'].end = max_y
-					fig4.x_range.start = min_y
-					fig4.x_range.end = max_y												
-			else: # if the variable is a constant, update the 'status_div' to let the user know why nothing happened
-				status_div.text = var_list[ID]+' is constant: {:3.2E}'.format(current_data[0])
-		except IndexError:
+		if stats is None:
 			status_div.text = 'Cannot scale: missing data'
+		elif stats['constant']: # if the variable is a constant, update the 'status_div' to let the user know why nothing happened
+			status_div.text = var_list[ID]+' is constant: {:3.2E}'.format(stats['min'])
+		else:
+			ampli = (stats['max']-stats['min'])/10
+
+			min_y = stats['min'] - ampli
+			max_y = stats['max'] + ampli
+
+			if ID == 0:
+				fig.y_range.start = min_y
+				fig.y_range.end = max_y
+				if layout_mode == 'comp':
+					fig3.y_range.start = min_y
+					fig3.y_range.end = max_y
+
+			elif ID == 1: # only happens when mode==comp
+				fig2.y_range.start = min_y
+				fig2.y_range.end = max_y				
+				fig3.x_range.start = min_y
+				fig3.x_range.end = max_y
+
+			elif ID ==2: # only happens when mode==comp
+				fig.extra_y_ranges['first_var'].start = min_y
+				fig.extra_y_ranges['first_var'].end = max_y
+				fig4.y_range.start = min_y
+				fig4.y_range.end = max_y
+			
+			elif ID ==3: # only happens when mode==comp
+				fig2.extra_y_ranges['second_var'].start = min_y
+				fig2.extra_y_ranges['second_var'].end = max_y
+				fig4.x_range.start = min_y
+				fig4.x_range.end = max_y												
 
 ## END OF CENTER FUNCTION
 #########################################################################################################################################################################
@@ -1253,18 +1397,17 @@ elif layout_mode == 'simple':
 		side_box = gridplot([[site_input],[var_input],[linediv()],[date_input],[linediv()],[load_button],[status_text,status_div],[linediv()],[notes_div]],toolbar_location=None)
 
 side_box.css_classes = ['side_box']
-dum_box.css_classes = ['dum_box']
 
 for elem in side_box.children:
 	elem.css_classes = ['side_box_row'] # custom class for each row in the side_box, will be used in styles.css to set their margin to 'auto' (center elements)
 
 # final layout
-grid = gridplot([[figroup,side_box],[dum_box]], toolbar_location = None)
+grid = gridplot([[figroup,side_box]], toolbar_location = None)
 
 grid.children[0].css_classes = ['main_grid'] # used in scripts.js to increase the width the main div (otherwise adding a border to side_box will put it under the plots)
 
 ## END OF LAYOUT PLOT ELEMENTS
 #########################################################################################################################################################################
 
-curdoc().title='TCCON' # displayed in the internet tab of the window
-curdoc().add_root(grid) # this adds the grid layout to the document
+doc.title='TCCON' # displayed in the internet tab of the window
+doc.add_root(grid) # this adds the grid layout to the document
@@ -0,0 +1,64 @@
+'''
+Columns of the app data sources read from the site files
+
+These functions do not use the bokeh models, they run in the worker threads of the loads (see read_var() in main.py).
+'''
+
+import numpy as np
+import netCDF4
+
+def data_columns(public,layout_mode):
+	'''
+	returns the names of the columns of the data sources for the type of files and the layout mode
+	'''
+	columns = ['x','y1']
+	if layout_mode == 'comp':
+		columns += ['y2']
+	columns += ['colo']
+	if not public:
+		columns += ['flag','spectrum'] # for the HoverTool
+	return columns
+
+def append_column(column,values):
+	'''
+	same as np.append, but keeps the type of 'values' when 'column' is empty (np.append cannot join the empty lists of a reset data source with datetime64 values)
+	'''
+	if len(column)==0:
+		return np.asarray(values)
+	return np.append(column,values)
+
+def eof_flags(int_flag,all_var,get_values):
+	'''
+	returns the strings "flag variable = value" of the .eof.csv flag column, with the variable that caused the flag and its value
+	get_values(var) must return the values of 'var' for the same records as int_flag
+	'''
+	flag_var = np.array(all_var)[int_flag]
+	flag_var_value = np.empty(len(int_flag),dtype=object)
+	for flag in np.unique(int_flag):
+		flag_var_value[int_flag==flag] = get_values(all_var[flag])[int_flag==flag]
+	return np.char.add(np.char.add(np.char.add(np.char.add(int_flag.astype(str),' '),flag_var),' = '),flag_var_value.astype(str))
+
+def read_file(read,path,start_id,end_id,file_time,columns,first_var,second_var,all_var,netcdf,no_flag_color,flag_color):
+	'''
+	returns the 'columns' (see data_columns()) of the records start_id to end_id of the site file at 'path'
+	read(path,var,start_id,end_id) must return the values of 'var' in the file, and file_time are the times of the records in fractional days since 1970
+	a KeyError is raised if a variable is not in the file
+	'''
+	data = {'x':np.floor(file_time*24*3600).astype(np.int64).astype('datetime64[s]')}
+	data['y1'] = read(path,first_var,start_id,end_id)
+	if 'y2' in columns:
+		data['y2'] = read(path,second_var,start_id,end_id)
+
+	int_flag = np.zeros(len(data['x']),dtype=int)
+	if 'flag' in columns:
+		data['spectrum'] = read(path,'spectrum',start_id,end_id) # name of spectra for the HoverTool
+		if data['spectrum'].ndim == 2: # character arrays are not automatically converted to strings
+			data['spectrum'] = netCDF4.chartostring(np.ma.getdata(data['spectrum']))
+		int_flag = np.asarray(read(path,'flag',start_id,end_id)).astype(int)
+		if netcdf:
+			data['flag'] = int_flag
+		else: # the flag column of .eof.csv data also shows the variable that caused the flag and its value
+			data['flag'] = eof_flags(int_flag,all_var,lambda var: read(path,var,start_id,end_id))
+	data['colo'] = np.where(int_flag==0,no_flag_color,flag_color)
+
+	return data
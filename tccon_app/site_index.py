@@ -0,0 +1,120 @@
+'''
+Time index of the data files of each site
+
+It is built once per server process and shared by all sessions, so that a date input can be resolved into (file,start,end) slices with np.searchsorted without opening the files that are out of range.
+It is also used by TCCON_archive.py, which is run again for each session: the index is kept in this module, which is only imported once per process.
+'''
+
+import os
+import calendar
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from dataset_pool import dataset_pool
+import eof_store
+
+_indexes = {} # one (modification time,index) per data folder
+_indexes_lock = threading.Lock() # sessions can ask for the index at the same time, it is only built by one of them
+
+def file_name_day(date_string):
+	'''
+	convert a YYYYMMDD string from a file name into days since 1970
+	'''
+	return calendar.timegm(datetime.strptime(date_string,'%Y%m%d').timetuple())/24/3600
+
+def read_times(path,netcdf):
+	'''
+	returns the list of variables and the times (fractional days since 1970) of a data file
+	'''
+	if netcdf:
+		all_var = [var for var in dataset_pool.variables(path) if 'run' not in var]
+		times = np.asarray(dataset_pool.read(path,'time'),dtype=np.float64)
+	elif path.endswith(eof_store.store_ext): # columnar store made from .eof.csv files by eof_store.py
+		all_var = [var for var in eof_store.store_columns(path) if 'run' not in var]
+		times = eof_store.read_times(path)
+	else:
+		all_var = [var for var in list(pd.read_csv(path,header=2,nrows=0)) if 'run' not in var]
+		times = eof_store.csv_times(pd.read_csv(path,header=2,usecols=['year','day','hour']))
+
+	return all_var,times
+
+def build_site_index(data_folder,file_list,netcdf):
+	'''
+	returns a dictionary with one entry per site prefix:
+		- 'files': the sorted list of the site files
+		- 'variables': the variables of the first file
+		- 'times': the times of all the files concatenated
+		- 'offsets': cumulative number of records, the times of files[i] are times[offsets[i]:offsets[i+1]]
+		- 'monotonic': True if 'times' is sorted
+		- 'min_date' and 'max_date': the first and last YYYYMMDD from the file names
+		- 'min_day' and 'max_day': the same dates in days since 1970
+	'''
+	site_index = {}
+	for prefix in sorted(set([i[:2] for i in file_list])):
+		site_file_list = sorted([i for i in file_list if i[:2]==prefix])
+
+		time_list = []
+		for site_file in site_file_list:
+			all_var,times = read_times(os.path.join(data_folder,site_file),netcdf)
+			if len(time_list)==0:
+				site_variables = all_var
+			time_list.append(times)
+
+		times = np.concatenate(time_list)
+		min_date = min([site_file[2:10] for site_file in site_file_list])
+		max_date = max([site_file[11:19] for site_file in site_file_list])
+
+		site_index[prefix] = {	'files':site_file_list,
+								'variables':site_variables,
+								'times':times,
+								'offsets':np.cumsum([0]+[len(elem) for elem in time_list]),
+								'monotonic':bool(np.all(np.diff(times)>=0)),
+								'min_date':min_date,
+								'max_date':max_date,
+								'min_day':file_name_day(min_date),
+								'max_day':file_name_day(max_date),
+							}
+		print 'Indexed',prefix,':',len(site_file_list),'files,',len(times),'records'
+
+	return site_index
+
+def get_site_index(data_folder,file_list,netcdf):
+	'''
+	returns the site index of 'data_folder', building it the first time it is asked for
+	the index is built again if the modification time of the folder changed (files were added, removed, or renamed)
+	'''
+	mtime = os.path.getmtime(data_folder)
+	with _indexes_lock:
+		if data_folder not in _indexes or _indexes[data_folder][0]!=mtime:
+			_indexes[data_folder] = (mtime,build_site_index(data_folder,file_list,netcdf))
+		return _indexes[data_folder][1]
+
+def time_slices(site_entry,mindate,maxdate):
+	'''
+	returns a list of (file,start_id,end_id,times) for the records with mindate <= time < maxdate (days since 1970)
+	files without records in that range are not included
+	'''
+	times = site_entry['times']
+	offsets = site_entry['offsets']
+
+	if site_entry['monotonic']:
+		first_id,last_id = np.searchsorted(times,[mindate,maxdate])
+
+	slices = []
+	for i,site_file in enumerate(site_entry['files']):
+		if site_entry['monotonic']:
+			start_id = max(first_id,offsets[i])-offsets[i]
+			end_id = min(last_id,offsets[i+1])-offsets[i]
+		else: # unsorted times, find the first and last matching records of the file
+			file_times = times[offsets[i]:offsets[i+1]]
+			inds = np.flatnonzero((file_times>=mindate) & (file_times<maxdate))
+			if len(inds)==0:
+				continue
+			start_id = inds[0]
+			end_id = inds[-1]+1
+		if start_id<end_id:
+			slices.append((site_file,start_id,end_id,times[offsets[i]+start_id:offsets[i]+end_id]))
+
+	return slices
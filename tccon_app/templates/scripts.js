@@ -1,8 +1,3 @@
-function click_dummy_button(){
-	// this click the hidden button in "dum_box" in order to start/stop the counter in the status_div
-	document.getElementsByClassName("dum_button")[0].children[0].click();
-}
-
 /*
 document.addEventListener("DOMContentLoaded", function(event){
 	setTimeout( function(){
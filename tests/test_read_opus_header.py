@@ -0,0 +1,67 @@
+'''
+Check read_opus_header against the output format of the OpusHdr program (GGGPATH/i2s/scripts) for a real OPUS file
+
+data/peach_juice.0.gz is the peach_juice.0 OPUS file of the orange-spectroscopy package (datasets folder), with the bytes of the data blocks set to 0
+The file header, the directory and the parameter blocks are unchanged, the file has several parameter blocks of the same type
+
+data/peach_juice_header.txt is in the format printed by OpusHdr: block names on their own line followed by 'parameter: value' lines, with the blocks in the order of the directory
+The parameter values were decoded with the brukeropus package (parse_params), not with read_opus_header, and the REAL64 values are written with 15 significant digits like perl does
+'''
+
+import os
+import sys
+import gzip
+from collections import OrderedDict
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from TCCON_read import read_opus_header, write_opus_header
+
+data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)),'data')
+
+def read_opushdr_output(text):
+	'''
+	parse the shell output of OpusHdr the same way the previous read_opus_header did, a block name printed again replaces the previous block
+	'''
+	data = {}
+	for line in text.split('\n'):
+		if (':' not in line) and (line!=''):
+			key = line.strip()
+			data[key] = {}
+		elif line!='':
+			try:
+				subkey,val = [x.strip() for x in line.split(': ')]
+			except ValueError:
+				pass
+			else:
+				data[key][subkey] = val
+	return data
+
+def test_read_opus_header(tmpdir):
+	path = str(tmpdir.join('peach_juice.0'))
+	with gzip.open(os.path.join(data_folder,'peach_juice.0.gz'),'rb') as infile:
+		with open(path,'wb') as outfile:
+			outfile.write(infile.read())
+
+	with open(os.path.join(data_folder,'peach_juice_header.txt'),'r') as infile:
+		expected = read_opushdr_output(infile.read())
+
+	header = read_opus_header(path)
+	assert {key:dict(header[key]) for key in header} == expected
+
+def test_write_opus_header(tmpdir):
+	path = str(tmpdir.join('pa20120204s0e00a.0001'))
+	header = OrderedDict([
+		('Data Parameters IgSm',OrderedDict([('NPT',64),('FXV',15798.0138),('DXU','PTS')])),
+		('Instrument Status Parameters',OrderedDict([('HFL',15798.0138),('SSM',1)])),
+		])
+	write_opus_header(path,header,igram_size=64)
+
+	assert read_opus_header(path) == {'Data Parameters IgSm':{'NPT':'64','FXV':'15798.0138','DXU':'PTS'},'Instrument Status Parameters':{'HFL':'15798.0138','SSM':'1'}}
+
+def test_not_opus_file(tmpdir):
+	path = str(tmpdir.join('not_opus.txt'))
+	with open(path,'w') as outfile:
+		outfile.write('this is not an OPUS file\n')
+
+	assert read_opus_header(path) == {}
@@ -0,0 +1,60 @@
+'''
+Check the columns read by the tccon_app loads for a private netCDF file, when the data source of the site was never filled
+'''
+
+import os
+import sys
+import numpy as np
+import netCDF4
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'tccon_app'))
+
+from site_data import data_columns, append_column, read_file
+from dataset_pool import DatasetPool
+
+def write_private_file(path,flag):
+	'''
+	write a private netCDF file with the variables used by the app
+	'''
+	with netCDF4.Dataset(path,'w') as outfile:
+		outfile.createDimension('time',len(flag))
+		outfile.createDimension('specname',8)
+		outfile.createVariable('time',np.float64,('time',))[:] = 15000+np.arange(len(flag))/24.0
+		outfile.createVariable('xco2',np.float32,('time',))[:] = 400+np.arange(len(flag))
+		outfile.createVariable('flag',np.int16,('time',))[:] = flag
+		spectrum = outfile.createVariable('spectrum','S1',('time','specname'))
+		spectrum[:] = netCDF4.stringtochar(np.array(['pa%06d' % i for i in range(len(flag))],dtype='S8'))
+
+def test_first_private_load(tmpdir):
+	path = str(tmpdir.join('pa20110101_20111231.private.nc'))
+	write_private_file(path,[0,0,3,0,7])
+	dataset_pool = DatasetPool()
+
+	columns = data_columns(False,'simple')
+	new_data = {key:[] for key in columns} # first load: nothing was read before
+	file_time = dataset_pool.read(path,'time',1,4)
+	file_data = read_file(dataset_pool.read,path,1,4,file_time,columns,'xco2','',['xco2'],True,'green','red')
+	new_data = {key:append_column(new_data[key],file_data[key]) for key in new_data}
+	dataset_pool.close_all()
+
+	assert sorted(new_data) == sorted(['x','y1','colo','flag','spectrum'])
+	assert list(new_data['y1']) == [401,402,403]
+	assert list(new_data['flag']) == [0,3,0]
+	assert list(new_data['colo']) == ['green','red','green']
+	assert list(new_data['spectrum']) == ['pa000001','pa000002','pa000003']
+	assert new_data['x'].dtype == np.dtype('datetime64[s]')
+
+def test_public_columns():
+	assert data_columns(True,'simple') == ['x','y1','colo']
+	assert data_columns(True,'comp') == ['x','y1','y2','colo']
+	assert data_columns(False,'comp') == ['x','y1','y2','colo','flag','spectrum']
+
+def test_nbytes_before_reading(tmpdir):
+	path = str(tmpdir.join('pa20110101_20111231.private.nc'))
+	write_private_file(path,[0,0,3,0,7])
+	dataset_pool = DatasetPool()
+
+	for var in ['xco2','flag','spectrum']:
+		assert dataset_pool.nbytes(path,var,1,4) == dataset_pool.read(path,var,1,4).nbytes
+	assert dataset_pool.nbytes(path,'xco2') == 5*4
+	dataset_pool.close_all()
@@ -0,0 +1,39 @@
+'''
+Check the helper functions of TCCON_comp.py (the script needs bokeh to be imported)
+'''
+
+import os
+import sys
+from datetime import datetime
+import numpy as np
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('bokeh')
+from TCCON_comp import x_limits, prefix_sums
+
+def test_x_limits_datetime():
+	columns = [np.array(['2012-01-02T10:00','2012-03-04T12:30'],dtype='datetime64[us]'),np.array(['2011-05-06T08:15','2012-02-03T00:00'],dtype='datetime64[us]')]
+	min_x,max_x = x_limits(columns)
+	assert min_x == datetime(2011,5,6,8,15)
+	assert max_x == datetime(2012,3,4,12,30)
+
+def test_x_limits_values():
+	assert x_limits([np.array([1.5,3.2]),np.array([0.7,2.0])]) == (0,4)
+
+def test_prefix_sums_time_window():
+	x = np.array([5,1,4,2,3],dtype=np.float64) # not sorted by time
+	y1 = np.array([1.5,np.nan,4.0,2.5,3.0])
+	y2 = np.array([1.0,1.0,3.0,2.0,3.5])
+	offset,sums = prefix_sums(x,y1,y2)
+
+	assert list(sums['t']) == [1,2,3,4,5]
+	assert list(x[sums['order']]) == [1,2,3,4,5]
+
+	# window 2 <= x <= 4 (positions 1 to 3 of the sorted times)
+	lo,hi = np.searchsorted(sums['t'],2,side='left'),np.searchsorted(sums['t'],4,side='right')-1
+	n = sums['n'][hi]-sums['n'][lo-1]
+	bias = ((sums['s1'][hi]-sums['s1'][lo-1])-(sums['s2'][hi]-sums['s2'][lo-1]))/n
+	assert n == 3
+	assert np.isclose(bias,np.mean([2.5-2.0,3.0-3.5,4.0-3.0]))